@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark da serialização dos eventos de broadcast
+
+Compara, para 1, 50 e 500 admins conectados:
+  - atual:  json.dumps por evento + laço de send_text (UTF-8 por conexão)
+  - texto:  encode_event uma vez + send_text com o mesmo texto ASCII
+  - binario: encode_event uma vez + send_bytes com os mesmos bytes para todos
+
+Uso: python bench_broadcast_serialization.py [eventos]
+"""
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+
+from serialization import encode_event, orjson
+
+
+class ServerSocket:
+    """Simula o custo do servidor ASGI: texto é codificado em UTF-8 a cada envio"""
+
+    def __init__(self):
+        self.bytes_enviados = 0
+
+    async def send_text(self, message: str):
+        self.bytes_enviados += len(message.encode("utf-8"))
+
+    async def send_bytes(self, data: bytes):
+        self.bytes_enviados += len(data)
+
+
+def montar_evento(i: int) -> dict:
+    return {
+        "type": "device_ping",
+        "device_id": i,
+        "imei": "358240051111110",
+        "device_marca": "Samsung",
+        "device_modelo": "Galaxy A10",
+        "device_status": "ativo",
+        "usuario_id": 42,
+        "usuario_nome": "João Manuel Cossa",
+        "latitude": -25.9692 + i * 1e-6,
+        "longitude": 32.5732 - i * 1e-6,
+        "bateria": 87,
+        "precisao_gps": 4.5,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+async def atual(sockets, eventos):
+    for evento in eventos:
+        message = json.dumps(evento)
+        for ws in sockets:
+            await ws.send_text(message)
+
+
+async def texto(sockets, eventos):
+    for evento in eventos:
+        frame = encode_event(evento, binary=False)
+        for ws in sockets:
+            await ws.send_text(frame.text)
+
+
+async def binario(sockets, eventos):
+    for evento in eventos:
+        frame = encode_event(evento, text=False)
+        for ws in sockets:
+            await ws.send_bytes(frame.data)
+
+
+def medir(estrategia, admins: int, total_eventos: int, repeticoes: int = 5) -> float:
+    """Melhor tempo (µs por evento) entre as repetições"""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        sockets = [ServerSocket() for _ in range(admins)]
+        eventos = [montar_evento(i) for i in range(total_eventos)]
+        inicio = time.perf_counter()
+        asyncio.run(estrategia(sockets, eventos))
+        melhor = min(melhor, (time.perf_counter() - inicio) / total_eventos * 1e6)
+    return melhor
+
+
+def main():
+    total_eventos = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("📊 Benchmark de serialização de broadcast")
+    print(f"   Serializador: {'orjson' if orjson else 'json (stdlib)'} | eventos por cenário: {total_eventos}")
+    print()
+    print(f"{'admins':>7} | {'atual (µs/ev)':>14} | {'texto (µs/ev)':>14} | {'binario (µs/ev)':>16} | {'ganho binario':>13}")
+    print("-" * 78)
+    for admins in (1, 50, 500):
+        eventos = max(total_eventos // max(admins // 10, 1), 50)
+        t_atual = medir(atual, admins, eventos)
+        t_texto = medir(texto, admins, eventos)
+        t_binario = medir(binario, admins, eventos)
+        print(f"{admins:>7} | {t_atual:>14.1f} | {t_texto:>14.1f} | {t_binario:>16.1f} | {t_atual / t_binario:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
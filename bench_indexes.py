@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos índices das consultas frequentes (antes/depois)
+
+Cria um banco SQLite temporário sem os índices secundários, popula com
+dados sintéticos, mede as consultas usadas pelo main.py, cria os índices
+com migrate_db.create_indexes e mede novamente.
+
+Uso: python bench_indexes.py [pings]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, or_
+from sqlalchemy.orm import sessionmaker
+
+from migrate_db import create_indexes
+from models import Admin, Base, Dispositivo, Emergencia, LogSistema, PingDispositivo, Usuario
+
+DISPOSITIVOS = 5000
+EMERGENCIAS = 20000
+LOGS = 50000
+
+
+def popular(engine, total_pings: int):
+    random.seed(42)
+    agora = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(Admin.__table__.insert(), [{
+            "id": 1, "nome_completo": "Admin", "email": "admin@prm.gov.mz", "senha_hash": "x",
+            "numero_badge": "PRM001", "posto_policial": "PRM Maputo Central", "ativo": True
+        }])
+        conn.execute(Usuario.__table__.insert(), [{
+            "id": i, "nome_completo": f"Usuario {i}", "numero_identidade": f"BI{i:08d}",
+            "telefone_principal": "840000000", "provincia": "Maputo", "cidade": "Maputo",
+            "bairro": "Centro", "latitude_residencia": -25.96, "longitude_residencia": 32.57,
+            "ativo": i % 10 != 0, "admin_cadastrador_id": 1
+        } for i in range(1, DISPOSITIVOS + 1)])
+        conn.execute(Dispositivo.__table__.insert(), [{
+            "id": i, "imei": f"{i:015d}", "usuario_id": i,
+            "status": "roubado" if i % 100 == 0 else "ativo"
+        } for i in range(1, DISPOSITIVOS + 1)])
+        conn.execute(Emergencia.__table__.insert(), [{
+            "latitude": -25.96, "longitude": 32.57, "usuario_id": 1, "dispositivo_id": 1,
+            "status": "ativo" if i % 50 == 0 else "finalizado",
+            "timestamp_acionamento": agora - timedelta(minutes=i)
+        } for i in range(EMERGENCIAS)])
+        conn.execute(LogSistema.__table__.insert(), [{
+            "nivel": "INFO", "mensagem": "log", "timestamp": agora - timedelta(seconds=i)
+        } for i in range(LOGS)])
+
+        lote = []
+        for i in range(total_pings):
+            dispositivo_id = random.randint(1, DISPOSITIVOS)
+            lote.append({
+                "dispositivo_id": dispositivo_id,
+                "timestamp": agora - timedelta(seconds=total_pings - i),
+                "latitude": -25.96, "longitude": 32.57,
+                "status_dispositivo": "roubado" if dispositivo_id % 100 == 0 else "ativo",
+                "tipo_ping": "device_ping"
+            })
+            if len(lote) == 50000:
+                conn.execute(PingDispositivo.__table__.insert(), lote)
+                lote = []
+        if lote:
+            conn.execute(PingDispositivo.__table__.insert(), lote)
+
+
+CONSULTAS = {
+    "historico do dispositivo": lambda db: db.query(PingDispositivo).filter(
+        PingDispositivo.dispositivo_id == 4200
+    ).order_by(PingDispositivo.timestamp.desc()).limit(100).all(),
+    "pings de roubados": lambda db: db.query(PingDispositivo).join(Dispositivo).filter(or_(
+        Dispositivo.status == "roubado",
+        PingDispositivo.status_dispositivo == "roubado"
+    )).order_by(PingDispositivo.timestamp.desc()).limit(100).all(),
+    "emergencias ativas": lambda db: db.query(Emergencia).filter(
+        Emergencia.status == "ativo"
+    ).order_by(Emergencia.timestamp_acionamento.desc()).all(),
+    "dispositivos roubados": lambda db: db.query(Dispositivo).filter(Dispositivo.status == "roubado").count(),
+    "usuarios ativos": lambda db: db.query(Usuario).filter(Usuario.ativo == True).count(),
+    "logs recentes": lambda db: db.query(LogSistema).filter(
+        LogSistema.timestamp >= func.datetime("now", "-1 hour")
+    ).order_by(LogSistema.timestamp.desc()).limit(100).all(),
+}
+
+
+def medir(Session, repeticoes: int = 5) -> dict:
+    """Melhor tempo (ms) de cada consulta entre as repetições"""
+    tempos = {}
+    with Session() as db:
+        for nome, consulta in CONSULTAS.items():
+            melhor = float("inf")
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                consulta(db)
+                melhor = min(melhor, time.perf_counter() - inicio)
+                db.expunge_all()
+            tempos[nome] = melhor * 1000
+    return tempos
+
+
+def main():
+    total_pings = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    caminho = os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    engine = create_engine(f"sqlite:///{caminho}")
+    Session = sessionmaker(bind=engine)
+
+    print("📊 Benchmark de índices (SQLite)")
+    print(f"   pings: {total_pings} | dispositivos: {DISPOSITIVOS} | emergências: {EMERGENCIAS} | logs: {LOGS}")
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(bind=engine)
+    popular(engine, total_pings)
+
+    antes = medir(Session)
+    inicio = time.perf_counter()
+    create_indexes(bind=engine)
+    criacao = time.perf_counter() - inicio
+    depois = medir(Session)
+
+    print()
+    print(f"{'consulta':<26} | {'antes (ms)':>10} | {'depois (ms)':>11} | {'ganho':>7}")
+    print("-" * 64)
+    for nome in CONSULTAS:
+        print(f"{nome:<26} | {antes[nome]:>10.2f} | {depois[nome]:>11.2f} | {antes[nome] / depois[nome]:>6.1f}x")
+    print(f"\nCriação dos índices: {criacao:.2f}s")
+    engine.dispose()
+    os.remove(caminho)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark de logins/s (verificação bcrypt) por número de rounds
+
+Para cada custo do bcrypt mede a vazão de verificações pelo pool de
+senhas (PasswordHasher) com 1 e com N workers, e a latência do event loop
+enquanto a rajada é processada: com o bcrypt no pool o loop continua
+respondendo; verificado direto no loop, ele fica parado o tempo todo.
+
+Uso: python bench_login.py [logins] [workers]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from passlib.context import CryptContext
+
+from passwords import PasswordHasher
+
+ROUNDS = (10, 11, 12)
+
+
+async def latencia_maxima_do_loop(fim: asyncio.Event) -> float:
+    """Maior atraso observado de um sleep de 5 ms enquanto a rajada roda"""
+    pior = 0.0
+    while not fim.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(0.005)
+        pior = max(pior, time.perf_counter() - inicio - 0.005)
+    return pior * 1000
+
+
+async def rajada_no_pool(rounds: int, workers: int, logins: int, senha_hash: str):
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_pending=logins)
+    fim = asyncio.Event()
+    monitor = asyncio.create_task(latencia_maxima_do_loop(fim))
+    inicio = time.perf_counter()
+    await asyncio.gather(*[hasher.verify("senha-correta", senha_hash) for _ in range(logins)])
+    duracao = time.perf_counter() - inicio
+    fim.set()
+    hasher.close()
+    return logins / duracao, await monitor
+
+
+async def rajada_no_loop(logins: int, senha_hash: str):
+    contexto = CryptContext(schemes=["bcrypt"])
+    fim = asyncio.Event()
+    monitor = asyncio.create_task(latencia_maxima_do_loop(fim))
+    await asyncio.sleep(0)
+    inicio = time.perf_counter()
+    for _ in range(logins):
+        contexto.verify("senha-correta", senha_hash)
+    duracao = time.perf_counter() - inicio
+    await asyncio.sleep(0)
+    fim.set()
+    return logins / duracao, await monitor
+
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 2)
+
+    print("📊 Benchmark de login (bcrypt)")
+    print(f"   logins por rodada: {logins} | CPUs: {os.cpu_count()}")
+    print()
+    print(f"{'rounds':>6} | {'caminho':<14} | {'logins/s':>9} | {'loop parado (ms)':>16}")
+    print("-" * 56)
+    for rounds in ROUNDS:
+        senha_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds).hash("senha-correta")
+        vazao, parado = asyncio.run(rajada_no_loop(logins, senha_hash))
+        print(f"{rounds:>6} | {'no event loop':<14} | {vazao:>9.1f} | {parado:>16.1f}")
+        for n in sorted({1, workers}):
+            vazao, parado = asyncio.run(rajada_no_pool(rounds, n, logins, senha_hash))
+            print(f"{rounds:>6} | {f'pool ({n} thr)':<14} | {vazao:>9.1f} | {parado:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark da detecção de dispositivos offline: roda de tempo x varredura SQL
+
+Popula um banco SQLite temporário com N dispositivos ativos, com pings
+espalhados numa janela de 10 minutos, e simula varreduras a cada 30 s.
+Compara o custo de encontrar os vencidos pelo OfflineSweeper (só abre os
+baldes vencidos da roda de tempo) com a consulta que varre a tabela procurando
+ultimo_ping antigo a cada rodada (sem índice em ultimo_ping, o custo é o de
+percorrer a tabela). Entre as varreduras 90% dos dispositivos enviam um
+ping novo.
+
+Uso: python bench_offline.py [dispositivos] [varreduras]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+
+from cache import DeviceCache
+from models import Base, Dispositivo
+from presence import OfflineSweeper
+
+LIMITE_SEGUNDOS = 600
+INTERVALO_SEGUNDOS = 30
+
+VENCIDOS_SQL = text("""
+    SELECT id FROM dispositivos
+    WHERE status = 'ativo' AND ultimo_ping < :limite
+""")
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    varreduras = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    caminho = os.path.join(tempfile.mkdtemp(), "bench_offline.db")
+    engine = create_engine(f"sqlite:///{caminho}")
+    Base.metadata.create_all(bind=engine)
+    aleatorio = random.Random(42)
+    inicio = datetime(2024, 5, 1, 12, 0, 0)
+    ultimos = {i: inicio - timedelta(seconds=aleatorio.uniform(0, LIMITE_SEGUNDOS)) for i in range(1, total + 1)}
+    with engine.begin() as conn:
+        conn.execute(Dispositivo.__table__.insert(), [
+            {"id": i, "imei": f"{i:015d}", "usuario_id": 1, "status": "ativo", "ultimo_ping": quando}
+            for i, quando in ultimos.items()
+        ])
+
+    sweeper = OfflineSweeper(None, DeviceCache(), offline_after_seconds=LIMITE_SEGUNDOS)
+    for dispositivo_id, quando in ultimos.items():
+        sweeper.visto(dispositivo_id, quando)
+
+    tempos_heap, tempos_sql, vencidos_total = [], [], 0
+    agora = inicio
+    with engine.connect() as conn:
+        for _ in range(varreduras):
+            agora += timedelta(seconds=INTERVALO_SEGUNDOS)
+            for dispositivo_id in ultimos:
+                if aleatorio.random() < 0.9:
+                    ultimos[dispositivo_id] = agora
+                    sweeper.visto(dispositivo_id, agora)
+
+            comeco = time.perf_counter()
+            vencidos = sweeper.vencidos(agora.replace(tzinfo=timezone.utc).timestamp())
+            tempos_heap.append((time.perf_counter() - comeco) * 1000)
+            vencidos_total += len(vencidos)
+
+            comeco = time.perf_counter()
+            conn.execute(VENCIDOS_SQL, {"limite": agora - timedelta(seconds=LIMITE_SEGUNDOS)}).all()
+            tempos_sql.append((time.perf_counter() - comeco) * 1000)
+
+    print("📊 Benchmark de detecção de dispositivos offline")
+    print(f"   dispositivos: {total} | varreduras: {varreduras} (a cada {INTERVALO_SEGUNDOS} s) | "
+          f"vencidos por varredura: {vencidos_total / varreduras:.0f}")
+    print()
+    print(f"{'método':<18} | {'média (ms)':>10} | {'máx (ms)':>9}")
+    print("-" * 44)
+    print(f"{'roda de tempo':<18} | {statistics.mean(tempos_heap):>10.3f} | {max(tempos_heap):>9.3f}")
+    print(f"{'varredura SQL':<18} | {statistics.mean(tempos_sql):>10.3f} | {max(tempos_sql):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
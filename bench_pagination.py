@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de paginação: OFFSET x cursor (keyset)
+
+Popula um banco SQLite temporário com pings de dispositivos roubados e
+mede o tempo de buscar uma página de 100 itens em profundidades
+crescentes com a consulta de /dispositivos/pings-roubados, usando
+offset(skip) e usando o cursor (timestamp, id).
+
+Uso: python bench_pagination.py [pings]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from models import Admin, Base, Dispositivo, PingDispositivo, Usuario
+from pagination import encode_cursor, paginar_por_tempo
+
+DISPOSITIVOS = 1000
+PAGINA = 100
+
+
+def popular(engine, total_pings: int):
+    agora = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(Admin.__table__.insert(), [{
+            "id": 1, "nome_completo": "Admin", "email": "admin@prm.gov.mz", "senha_hash": "x",
+            "numero_badge": "PRM001", "posto_policial": "PRM Maputo Central"
+        }])
+        conn.execute(Usuario.__table__.insert(), [{
+            "id": i, "nome_completo": f"Usuario {i}", "numero_identidade": f"BI{i:08d}",
+            "telefone_principal": "840000000", "provincia": "Maputo", "cidade": "Maputo",
+            "bairro": "Centro", "latitude_residencia": -25.96, "longitude_residencia": 32.57,
+            "admin_cadastrador_id": 1
+        } for i in range(1, DISPOSITIVOS + 1)])
+        conn.execute(Dispositivo.__table__.insert(), [{
+            "id": i, "imei": f"{i:015d}", "usuario_id": i, "status": "roubado"
+        } for i in range(1, DISPOSITIVOS + 1)])
+        for inicio in range(0, total_pings, 50000):
+            conn.execute(PingDispositivo.__table__.insert(), [{
+                "dispositivo_id": i % DISPOSITIVOS + 1,
+                # Vários pings por segundo: empates de timestamp exercitam o desempate por id
+                "timestamp": agora - timedelta(seconds=(total_pings - i) // 4),
+                "latitude": -25.96, "longitude": 32.57,
+                "status_dispositivo": "roubado", "tipo_ping": "stolen_device_ping", "retido": True
+            } for i in range(inicio, min(inicio + 50000, total_pings))])
+
+
+def consulta(db):
+    return db.query(PingDispositivo).join(Dispositivo).filter(PingDispositivo.retido == True, or_(
+        Dispositivo.status == "roubado",
+        PingDispositivo.status_dispositivo == "roubado"
+    ))
+
+
+def medir(funcao, repeticoes: int = 5) -> float:
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def main():
+    total_pings = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    caminho = os.path.join(tempfile.mkdtemp(), "bench_pagination.db")
+    engine = create_engine(f"sqlite:///{caminho}")
+    Session = sessionmaker(bind=engine)
+
+    print("📊 Benchmark de paginação (SQLite)")
+    print(f"   pings: {total_pings} | página: {PAGINA}")
+    Base.metadata.create_all(bind=engine)
+    popular(engine, total_pings)
+
+    print()
+    print(f"{'profundidade':>12} | {'offset (ms)':>11} | {'cursor (ms)':>11} | {'ganho':>7}")
+    print("-" * 52)
+    with Session() as db:
+        for profundidade in (0, 10_000, 100_000, total_pings // 2, total_pings - 2 * PAGINA):
+            # Cursor do último item da página anterior (fora da medição)
+            cursor = None
+            if profundidade:
+                anterior = consulta(db).order_by(
+                    PingDispositivo.timestamp.desc(), PingDispositivo.id.desc()
+                ).offset(profundidade - 1).first()
+                cursor = encode_cursor(anterior.timestamp, anterior.id)
+
+            t_offset = medir(lambda: paginar_por_tempo(
+                consulta(db), PingDispositivo.timestamp, PingDispositivo.id, None, PAGINA, profundidade
+            ))
+            t_cursor = medir(lambda: paginar_por_tempo(
+                consulta(db), PingDispositivo.timestamp, PingDispositivo.id, cursor, PAGINA
+            ))
+            # Mesma página pelos dois caminhos
+            por_offset, _ = paginar_por_tempo(consulta(db), PingDispositivo.timestamp, PingDispositivo.id, None, PAGINA, profundidade)
+            por_cursor, _ = paginar_por_tempo(consulta(db), PingDispositivo.timestamp, PingDispositivo.id, cursor, PAGINA)
+            assert [p.id for p in por_offset] == [p.id for p in por_cursor]
+            db.expunge_all()
+            print(f"{profundidade:>12} | {t_offset:>11.2f} | {t_cursor:>11.2f} | {t_offset / t_cursor:>6.1f}x")
+
+    engine.dispose()
+    os.remove(caminho)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca por proximidade: grade em memória x varredura SQL
+
+Popula um banco SQLite temporário com N dispositivos (70% concentrados em
+cinco cidades, 30% espalhados pelo país), carrega o ProximityIndex e mede
+a latência de buscas por raio e por retângulo contra a consulta ingênua
+com a fórmula haversine no SQL (varre a tabela inteira a cada busca).
+
+Uso: python bench_proximidade.py [dispositivos] [buscas] [graus_por_celula]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from geo import ProximityIndex, retangulo_do_raio
+from models import Base, Dispositivo
+
+CIDADES = [(-25.9655, 32.5832), (-19.8436, 34.8389), (-15.1165, 39.2666), (-16.1564, 33.5867), (-23.8650, 35.3833)]
+RAIOS_KM = (1, 5, 20)
+
+HAVERSINE_SQL = text("""
+    SELECT id, distancia FROM (
+        SELECT id, 2 * 6371.0088 * asin(min(1, sqrt(
+            power(sin(radians(ultima_localizacao_lat - :lat) / 2), 2) +
+            cos(radians(:lat)) * cos(radians(ultima_localizacao_lat)) *
+            power(sin(radians(ultima_localizacao_lng - :lng) / 2), 2)
+        ))) AS distancia
+        FROM dispositivos
+        WHERE ultima_localizacao_lat IS NOT NULL
+    ) WHERE distancia <= :raio ORDER BY distancia LIMIT :limite
+""")
+
+RETANGULO_SQL = text("""
+    SELECT id FROM dispositivos
+    WHERE ultima_localizacao_lat BETWEEN :min_lat AND :max_lat
+      AND ultima_localizacao_lng BETWEEN :min_lng AND :max_lng
+    LIMIT :limite
+""")
+
+
+def popular(engine, total: int) -> None:
+    aleatorio = random.Random(42)
+    linhas = []
+    for i in range(1, total + 1):
+        if aleatorio.random() < 0.7:
+            lat, lng = aleatorio.choice(CIDADES)
+            lat, lng = aleatorio.gauss(lat, 0.08), aleatorio.gauss(lng, 0.08)
+        else:
+            lat, lng = aleatorio.uniform(-26.8, -10.5), aleatorio.uniform(30.3, 40.8)
+        linhas.append({"id": i, "imei": f"{i:015d}", "usuario_id": 1, "status": "ativo",
+                       "ultima_localizacao_lat": lat, "ultima_localizacao_lng": lng})
+    with engine.begin() as conn:
+        conn.execute(Dispositivo.__table__.insert(), linhas)
+
+
+def medir(funcao, centros) -> tuple:
+    tempos = []
+    for lat, lng in centros:
+        inicio = time.perf_counter()
+        funcao(lat, lng)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return statistics.mean(tempos), tempos[int(len(tempos) * 0.99) - 1]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    buscas = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    celula = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    caminho = os.path.join(tempfile.mkdtemp(), "bench_proximidade.db")
+    engine = create_engine(f"sqlite:///{caminho}")
+    Base.metadata.create_all(bind=engine)
+    popular(engine, total)
+    Session = sessionmaker(bind=engine)
+
+    indice = ProximityIndex(Session, **({"cell_degrees": celula} if celula else {}))
+    inicio = time.perf_counter()
+    indice.carregar()
+    carga = (time.perf_counter() - inicio) * 1000
+
+    aleatorio = random.Random(7)
+    centros = [
+        (aleatorio.gauss(lat, 0.05), aleatorio.gauss(lng, 0.05))
+        for lat, lng in (aleatorio.choice(CIDADES) for _ in range(buscas))
+    ]
+
+    print("📊 Benchmark de busca por proximidade")
+    print(f"   dispositivos: {total} | buscas por cenário: {buscas} | célula: {indice.cell_degrees}° | carga do índice: {carga:.0f} ms")
+    print()
+    print(f"{'busca':<16} | {'método':<17} | {'média (ms)':>10} | {'p99 (ms)':>9}")
+    print("-" * 62)
+    with engine.connect() as conn:
+        for raio in RAIOS_KM:
+            nome = f"raio {raio} km"
+            media, p99 = medir(lambda lat, lng: indice.dispositivos.raio(lat, lng, raio, limit=100), centros)
+            print(f"{nome:<16} | {'grade em memória':<17} | {media:>10.3f} | {p99:>9.3f}")
+            media, p99 = medir(lambda lat, lng: conn.execute(
+                HAVERSINE_SQL, {"lat": lat, "lng": lng, "raio": raio, "limite": 100}).all(), centros[:max(buscas // 10, 5)])
+            print(f"{nome:<16} | {'SQL haversine':<17} | {media:>10.3f} | {p99:>9.3f}")
+
+        nome = "retângulo 10 km"
+        media, p99 = medir(lambda lat, lng: indice.dispositivos.retangulo(*retangulo_do_raio(lat, lng, 5), limit=100), centros)
+        print(f"{nome:<16} | {'grade em memória':<17} | {media:>10.3f} | {p99:>9.3f}")
+        media, p99 = medir(lambda lat, lng: conn.execute(RETANGULO_SQL, dict(zip(
+            ("min_lat", "min_lng", "max_lat", "max_lng"), retangulo_do_raio(lat, lng, 5)), limite=100)).all(), centros[:max(buscas // 10, 5)])
+        print(f"{nome:<16} | {'SQL BETWEEN':<17} | {media:>10.3f} | {p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark da entrega de /uploads: StaticFiles (mount anterior) x UploadFiles
+
+Mede pedidos/s pelo app ASGI (sem rede, via httpx) para uma miniatura, uma
+foto comum e uma foto grande, em três situações: GET completo, GET
+condicional com o ETag recebido (revalidação) e Range de 64 KB. No
+navegador a diferença maior nem aparece aqui: com Cache-Control immutable
+um reload do dashboard não faz pedido nenhum, enquanto com o mount
+anterior cada foto é revalidada (ou baixada de novo).
+
+Uso: python bench_uploads.py [pedidos] [concorrencia]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+from static_uploads import UploadFiles
+
+ARQUIVOS = {
+    "miniatura 8 KB": 8 * 1024,
+    "foto 300 KB": 300 * 1024,
+    "foto 3 MB": 3 * 1024 * 1024,
+}
+
+
+def preparar() -> Path:
+    raiz = Path(tempfile.mkdtemp())
+    for indice, tamanho in enumerate(ARQUIVOS.values()):
+        (raiz / f"{indice:064x}.jpg").write_bytes(os.urandom(tamanho))
+    return raiz
+
+
+async def rodada(app, url: str, headers: dict, pedidos: int, concorrencia: int) -> tuple:
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        primeira = await cliente.get(url)
+        if headers.get("If-None-Match") == "etag":
+            headers = {"If-None-Match": primeira.headers.get("etag", "")}
+        semaforo = asyncio.Semaphore(concorrencia)
+        bytes_recebidos = 0
+        status = set()
+
+        async def pedir():
+            nonlocal bytes_recebidos
+            async with semaforo:
+                resposta = await cliente.get(url, headers=headers)
+                bytes_recebidos += len(resposta.content)
+                status.add(resposta.status_code)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[pedir() for _ in range(pedidos)])
+        duracao = time.perf_counter() - inicio
+    return pedidos / duracao, bytes_recebidos / pedidos, sorted(status)
+
+
+def main():
+    pedidos = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    concorrencia = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    raiz = preparar()
+    apps = {
+        "StaticFiles": Starlette(routes=[Mount("/uploads", StaticFiles(directory=raiz))]),
+        "UploadFiles": Starlette(routes=[Mount("/uploads", UploadFiles(directory=raiz))]),
+    }
+    situacoes = {
+        "GET": {},
+        "GET condicional": {"If-None-Match": "etag"},
+        "Range 64 KB": {"Range": "bytes=0-65535"},
+    }
+
+    print("📊 Benchmark de /uploads")
+    print(f"   pedidos por rodada: {pedidos} | concorrência: {concorrencia}")
+    print()
+    print(f"{'arquivo':<15} | {'pedido':<15} | {'servidor':<11} | {'pedidos/s':>9} | {'KB/pedido':>9} | status")
+    print("-" * 80)
+    for indice, nome in enumerate(ARQUIVOS):
+        url = f"/uploads/{indice:064x}.jpg"
+        for situacao, headers in situacoes.items():
+            for servidor, app in apps.items():
+                vazao, media, status = asyncio.run(rodada(app, url, dict(headers), pedidos, concorrencia))
+                print(f"{nome:<15} | {situacao:<15} | {servidor:<11} | {vazao:>9.0f} | {media / 1024:>9.1f} | {status}")
+    print()
+    print("   Reload do dashboard no navegador: StaticFiles revalida cada foto;")
+    print("   UploadFiles (Cache-Control immutable) não faz nenhum pedido.")
+
+
+if __name__ == "__main__":
+    main()
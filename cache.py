@@ -0,0 +1,327 @@
+"""
+Caches em memória (LRU com expiração por TTL)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Admin, Dispositivo, Usuario
+
+
+class TTLCache:
+    """Cache LRU limitado com expiração por tempo, seguro entre threads"""
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 300.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Obter valor; retorna None se ausente ou expirado"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expira_em = item
+            if expira_em < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                antigo = next(iter(self._data))
+                self._remove(antigo)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            return self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def _remove(self, key: Hashable) -> Any:
+        value, _ = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+        return value
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class DeviceCache:
+    """Resolução IMEI → dispositivo/usuário para os caminhos de ping e SOS"""
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 300.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, on_evict=self._on_evict)
+        self._imei_por_id: Dict[int, str] = {}
+        self._imeis_por_usuario: Dict[int, Set[str]] = {}
+        self._lock = threading.RLock()
+        # Incrementado a cada invalidação; evita guardar uma leitura que
+        # começou antes de uma invalidação concorrente
+        self._geracao = 0
+
+    def get_by_imei(self, db: Session, imei: str) -> Optional[dict]:
+        """Dados do dispositivo pelo IMEI (None se não cadastrado)"""
+        entry = self._cache.get(imei)
+        if entry is not None:
+            return entry
+        return self._load(db, Dispositivo.imei == imei)
+
+    def get_by_id(self, db: Session, dispositivo_id: int) -> Optional[dict]:
+        """Dados do dispositivo pelo ID (None se não cadastrado)"""
+        entry = self._cached_by_id(dispositivo_id)
+        if entry is not None:
+            return entry
+        return self._load(db, Dispositivo.id == dispositivo_id)
+
+    def get_many_by_id(self, db: Session, ids: Iterable[int]) -> Dict[int, dict]:
+        """Dados de vários dispositivos pelo ID, com uma consulta para os ausentes do cache"""
+        encontrados = {}
+        faltando = []
+        for dispositivo_id in ids:
+            entry = self._cached_by_id(dispositivo_id)
+            if entry is not None:
+                encontrados[dispositivo_id] = entry
+            else:
+                faltando.append(dispositivo_id)
+        if faltando:
+            geracao = self._geracao
+            consulta = self._consulta(Dispositivo.id.in_(faltando)).limit(None)
+            for row in db.execute(consulta).all():
+                entry = self._guardar(row, geracao)
+                encontrados[entry["id"]] = entry
+        return encontrados
+
+    def get_cached(self, imei: str) -> Optional[dict]:
+        """Dados do dispositivo se já estiverem no cache (sem consultar o banco)"""
+        return self._cache.get(imei)
+
+    async def get_by_imei_async(self, db: AsyncSession, imei: str) -> Optional[dict]:
+        """Como get_by_imei, consultando o banco pela sessão assíncrona"""
+        entry = self._cache.get(imei)
+        if entry is not None:
+            return entry
+        return await self.load_by_imei_async(db, imei)
+
+    async def load_by_imei_async(self, db: AsyncSession, imei: str) -> Optional[dict]:
+        """Carregar do banco e guardar no cache (após um get_cached sem sucesso)"""
+        return await self._load_async(db, Dispositivo.imei == imei)
+
+    async def get_by_id_async(self, db: AsyncSession, dispositivo_id: int) -> Optional[dict]:
+        """Como get_by_id, consultando o banco pela sessão assíncrona"""
+        entry = self._cached_by_id(dispositivo_id)
+        if entry is not None:
+            return entry
+        return await self._load_async(db, Dispositivo.id == dispositivo_id)
+
+    def _cached_by_id(self, dispositivo_id: int) -> Optional[dict]:
+        imei = self._imei_por_id.get(dispositivo_id)
+        if imei is None:
+            self._cache.misses += 1
+            return None
+        return self._cache.get(imei)
+
+    @staticmethod
+    def _consulta(criterio):
+        return select(Dispositivo, Usuario, Admin.posto_policial).outerjoin(
+            Usuario, Usuario.id == Dispositivo.usuario_id
+        ).outerjoin(
+            Admin, Admin.id == Usuario.admin_cadastrador_id
+        ).where(criterio).limit(1)
+
+    def _load(self, db: Session, criterio) -> Optional[dict]:
+        geracao = self._geracao
+        return self._guardar(db.execute(self._consulta(criterio)).first(), geracao)
+
+    async def _load_async(self, db: AsyncSession, criterio) -> Optional[dict]:
+        geracao = self._geracao
+        return self._guardar((await db.execute(self._consulta(criterio))).first(), geracao)
+
+    def _guardar(self, row, geracao: int) -> Optional[dict]:
+        if row is None:
+            return None
+
+        entry = build_device_entry(*row)
+        with self._lock:
+            if geracao == self._geracao:
+                self._store(entry)
+        return entry
+
+    def _store(self, entry: dict) -> None:
+        self._cache.set(entry["imei"], entry)
+        self._imei_por_id[entry["id"]] = entry["imei"]
+        self._imeis_por_usuario.setdefault(entry["usuario_id"], set()).add(entry["imei"])
+
+    def _on_evict(self, imei: str, entry: dict) -> None:
+        self._imei_por_id.pop(entry["id"], None)
+        imeis = self._imeis_por_usuario.get(entry["usuario_id"])
+        if imeis is not None:
+            imeis.discard(imei)
+            if not imeis:
+                del self._imeis_por_usuario[entry["usuario_id"]]
+
+    def set_status(self, imei: str, novo_status: str) -> None:
+        """Refletir no cache uma mudança de status feita pelo caminho de ping"""
+        with self._lock:
+            entry = self._cache.pop(imei)
+            if entry is not None:
+                self._store(dict(entry, status=novo_status))
+
+    def invalidate(self, imei: Optional[str] = None, dispositivo_id: Optional[int] = None) -> None:
+        """Remover um dispositivo do cache pelo IMEI ou pelo ID"""
+        with self._lock:
+            self._geracao += 1
+            if imei is None and dispositivo_id is not None:
+                imei = self._imei_por_id.get(dispositivo_id)
+            if imei is not None:
+                self._cache.pop(imei)
+
+    def invalidate_usuario(self, usuario_id: int) -> None:
+        """Remover do cache todos os dispositivos de um usuário"""
+        with self._lock:
+            self._geracao += 1
+            for imei in list(self._imeis_por_usuario.get(usuario_id, ())):
+                self._cache.pop(imei)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._geracao += 1
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+class AdminPrincipal(NamedTuple):
+    """Dados do admin autenticado usados pelas rotas"""
+    id: int
+    tipo_admin: str
+    ativo: bool
+    nome_completo: str
+
+
+class PrincipalCache:
+    """Token JWT já verificado → principal do admin, para get_current_admin"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, on_evict=self._on_evict)
+        self._tokens_por_admin: Dict[int, Set[str]] = {}
+        self._lock = threading.RLock()
+        # Mesmo papel que em DeviceCache: uma leitura iniciada antes de uma
+        # invalidação não é guardada
+        self._geracao = 0
+        # Consultas ao Admin evitadas (requisições autenticadas pelo cache)
+        self.lookups_avoided = 0
+
+    def get(self, token: str) -> Optional[AdminPrincipal]:
+        """Principal do token, se verificado recentemente e ainda não expirado"""
+        entry = self._cache.get(token)
+        if entry is None:
+            return None
+        principal, expira_em = entry
+        if expira_em is not None and expira_em <= time.time():
+            self._cache.pop(token)
+            return None
+        self.lookups_avoided += 1
+        return principal
+
+    def geracao(self) -> int:
+        """Marcar o início de uma leitura do banco (passar depois para set)"""
+        return self._geracao
+
+    def set(self, token: str, principal: AdminPrincipal, expira_em: Optional[float], geracao: int) -> None:
+        with self._lock:
+            if geracao != self._geracao:
+                return
+            self._cache.set(token, (principal, expira_em))
+            self._tokens_por_admin.setdefault(principal.id, set()).add(token)
+
+    def invalidate_admin(self, admin_id: int) -> None:
+        """Descartar os tokens de um admin (alterado ou desativado)"""
+        with self._lock:
+            self._geracao += 1
+            for token in list(self._tokens_por_admin.get(admin_id, ())):
+                self._cache.pop(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._geracao += 1
+            self._cache.clear()
+
+    def _on_evict(self, token: str, entry: tuple) -> None:
+        admin_id = entry[0].id
+        tokens = self._tokens_por_admin.get(admin_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_por_admin[admin_id]
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["db_lookups_avoided"] = self.lookups_avoided
+        return stats
+
+
+def build_device_entry(
+    dispositivo: Dispositivo,
+    usuario: Optional[Usuario],
+    posto_policial: Optional[str] = None,
+) -> dict:
+    """Montar a entrada do cache a partir das linhas do banco"""
+    return {
+        "id": dispositivo.id,
+        "imei": dispositivo.imei,
+        "status": dispositivo.status,
+        "marca": dispositivo.marca,
+        "modelo": dispositivo.modelo,
+        "usuario_id": dispositivo.usuario_id,
+        "usuario_nome": usuario.nome_completo if usuario else "N/A",
+        "usuario_telefone": usuario.telefone_principal if usuario else "N/A",
+        "usuario_endereco": f"{usuario.rua}, {usuario.bairro}, {usuario.cidade}" if usuario else "N/A",
+        # Usados no roteamento das assinaturas do WebSocket
+        "usuario_provincia": usuario.provincia if usuario else None,
+        "posto_policial": posto_policial,
+    }
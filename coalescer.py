@@ -0,0 +1,90 @@
+"""
+Coalescência dos broadcasts de posição (device_ping) por dispositivo
+
+Um telefone que envia ping a cada poucos segundos geraria um broadcast por
+ping. O PingCoalescer emite no máximo uma atualização de posição por
+dispositivo a cada janela: o primeiro ping da janela sai imediatamente e
+os seguintes ficam pendentes, sendo enviado apenas o mais recente ao fim
+da janela (latest-wins). Alertas (stolen_device_located, emergency_created)
+não passam por aqui e são publicados imediatamente.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+# A cada tantas ofertas, esquecer dispositivos sem envio recente
+_PRUNE_INTERVAL = 4096
+
+
+class PingCoalescer:
+    """Estágio latest-wins por dispositivo na frente do publish do WebSocket"""
+
+    def __init__(self, publish: Callable[..., Awaitable[None]], window_ms: int = 1000):
+        self.publish = publish
+        self.window = window_ms / 1000
+        self._ultimo_envio: Dict[Hashable, float] = {}
+        self._pendentes: Dict[Hashable, Tuple[dict, dict]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+
+        # Métricas
+        self.total_received = 0
+        self.total_emitted = 0
+        self.total_suppressed = 0
+
+    async def offer(self, device_id: Hashable, payload: dict, **rota) -> None:
+        """Publicar a posição agora ou guardá-la como pendente da janela atual"""
+        self.total_received += 1
+        if self.window <= 0:
+            self.total_emitted += 1
+            await self.publish(payload, **rota)
+            return
+
+        loop = asyncio.get_running_loop()
+        agora = loop.time()
+        if self.total_received % _PRUNE_INTERVAL == 0:
+            self._prune(agora)
+
+        ultimo = self._ultimo_envio.get(device_id)
+        if device_id not in self._timers and (ultimo is None or agora - ultimo >= self.window):
+            self._ultimo_envio[device_id] = agora
+            self.total_emitted += 1
+            await self.publish(payload, **rota)
+            return
+
+        # Dentro da janela: substituir a posição pendente pela mais recente
+        if device_id in self._pendentes:
+            self.total_suppressed += 1
+        self._pendentes[device_id] = (payload, rota)
+        if device_id not in self._timers:
+            self._timers[device_id] = loop.call_at(ultimo + self.window, self._emitir_pendente, device_id)
+
+    def _emitir_pendente(self, device_id: Hashable) -> None:
+        self._timers.pop(device_id, None)
+        item = self._pendentes.pop(device_id, None)
+        if item is None:
+            return
+        payload, rota = item
+        self._ultimo_envio[device_id] = asyncio.get_running_loop().time()
+        self.total_emitted += 1
+        asyncio.ensure_future(self.publish(payload, **rota))
+
+    def _prune(self, agora: float) -> None:
+        limite = agora - self.window
+        for device_id in [d for d, t in self._ultimo_envio.items() if t < limite and d not in self._timers]:
+            del self._ultimo_envio[device_id]
+
+    def close(self) -> None:
+        """Cancelar os envios pendentes (encerramento da aplicação)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pendentes.clear()
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": int(self.window * 1000),
+            "pending": len(self._pendentes),
+            "tracked_devices": len(self._ultimo_envio),
+            "total_received": self.total_received,
+            "total_emitted": self.total_emitted,
+            "total_suppressed": self.total_suppressed,
+        }
@@ -32,8 +32,74 @@ class Settings:
     # Configurações de Upload
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "5242880"))  # 5MB
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_ORPHAN_GRACE_SECONDS: float = float(os.getenv("UPLOAD_ORPHAN_GRACE_SECONDS", "3600"))  # fotos sem referência por mais que isso são apagadas
+    UPLOAD_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("UPLOAD_SWEEP_INTERVAL_SECONDS", "3600"))
+    UPLOAD_VARIANT_WORKERS: int = int(os.getenv("UPLOAD_VARIANT_WORKERS", "1"))  # geração de miniaturas em segundo plano
+    UPLOAD_VARIANT_QUEUE_SIZE: int = int(os.getenv("UPLOAD_VARIANT_QUEUE_SIZE", "1000"))
+    UPLOAD_CACHE_MAX_AGE_SECONDS: int = int(os.getenv("UPLOAD_CACHE_MAX_AGE_SECONDS", "31536000"))  # 1 ano (nomes imutáveis)
     ALLOWED_EXTENSIONS: set = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
     
+    # Configurações da fila de ingestão de pings
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+    INGEST_FLUSH_INTERVAL_MS: int = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "250"))
+    INGEST_MAX_QUEUE: int = int(os.getenv("INGEST_MAX_QUEUE", "20000"))
+    
+    # Última posição dos dispositivos (em memória, gravada periodicamente no banco)
+    POSITION_CHECKPOINT_SECONDS: float = float(os.getenv("POSITION_CHECKPOINT_SECONDS", "60"))
+    POSITION_CHECKPOINT_BATCH: int = int(os.getenv("POSITION_CHECKPOINT_BATCH", "1000"))
+    
+    # Retenção e particionamento de pings_dispositivos
+    PING_RETENTION_DAYS: int = int(os.getenv("PING_RETENTION_DAYS", "180"))
+    PING_DOWNSAMPLE_AFTER_DAYS: int = int(os.getenv("PING_DOWNSAMPLE_AFTER_DAYS", "7"))
+    PING_DOWNSAMPLE_MINUTES: int = int(os.getenv("PING_DOWNSAMPLE_MINUTES", "15"))  # um ping por dispositivo por intervalo
+    PING_PARTITION_MONTHS_AHEAD: int = int(os.getenv("PING_PARTITION_MONTHS_AHEAD", "3"))
+    PING_RETENTION_INTERVAL_HOURS: float = float(os.getenv("PING_RETENTION_INTERVAL_HOURS", "6"))
+    
+    # Estatísticas do dashboard
+    DASHBOARD_RECONCILE_SECONDS: float = float(os.getenv("DASHBOARD_RECONCILE_SECONDS", "60"))
+    
+    # Detecção de dispositivos offline (sem ping dentro do prazo)
+    DEVICE_OFFLINE_AFTER_SECONDS: float = float(os.getenv("DEVICE_OFFLINE_AFTER_SECONDS", "600"))
+    DEVICE_OFFLINE_SWEEP_SECONDS: float = float(os.getenv("DEVICE_OFFLINE_SWEEP_SECONDS", "30"))
+    DEVICE_OFFLINE_BATCH_SIZE: int = int(os.getenv("DEVICE_OFFLINE_BATCH_SIZE", "500"))
+    
+    # Trajetos simplificados (/dispositivos/{id}/trajeto)
+    TRACK_DEFAULT_HOURS: float = float(os.getenv("TRACK_DEFAULT_HOURS", "24"))  # período sem `desde`
+    TRACK_MAX_PINGS: int = int(os.getenv("TRACK_MAX_PINGS", "50000"))  # pings lidos por trajeto (os mais recentes)
+    TRACK_CACHE_SIZE: int = int(os.getenv("TRACK_CACHE_SIZE", "1000"))
+    TRACK_CACHE_TTL_SECONDS: float = float(os.getenv("TRACK_CACHE_TTL_SECONDS", "300"))
+    
+    # Busca por proximidade (índice espacial em memória)
+    GEO_CELL_DEGREES: float = float(os.getenv("GEO_CELL_DEGREES", "0.005"))  # ~550 m por célula
+    GEO_MAX_RADIUS_KM: float = float(os.getenv("GEO_MAX_RADIUS_KM", "100"))
+    GEO_MAX_RESULTS: int = int(os.getenv("GEO_MAX_RESULTS", "1000"))
+    
+    # Cache de resolução IMEI → dispositivo/usuário
+    DEVICE_CACHE_MAX_SIZE: int = int(os.getenv("DEVICE_CACHE_MAX_SIZE", "50000"))
+    DEVICE_CACHE_TTL_SECONDS: int = int(os.getenv("DEVICE_CACHE_TTL_SECONDS", "300"))
+    
+    # Cache de autenticação (token JWT verificado → admin)
+    AUTH_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_CACHE_MAX_SIZE", "10000"))
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    
+    # Senhas (bcrypt em pool dedicado) e limite de tentativas de login
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_POOL_WORKERS: int = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+    PASSWORD_POOL_MAX_PENDING: int = int(os.getenv("PASSWORD_POOL_MAX_PENDING", "64"))  # acima disso, 503
+    LOGIN_MAX_ATTEMPTS_PER_EMAIL: int = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_EMAIL", "5"))
+    LOGIN_MAX_ATTEMPTS_PER_IP: int = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "20"))
+    LOGIN_ATTEMPT_WINDOW_SECONDS: float = float(os.getenv("LOGIN_ATTEMPT_WINDOW_SECONDS", "300"))
+
+    # Configurações do WebSocket (fila de saída por conexão)
+    WS_QUEUE_SIZE: int = int(os.getenv("WS_QUEUE_SIZE", "256"))
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")  # drop_oldest, drop_newest, close
+    WS_SEND_TIMEOUT_SECONDS: float = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+    WS_SUBSCRIPTION_CELL_DEGREES: float = float(os.getenv("WS_SUBSCRIPTION_CELL_DEGREES", "0.5"))  # grade do índice de áreas
+    WS_PING_COALESCE_MS: int = int(os.getenv("WS_PING_COALESCE_MS", "1000"))  # janela por dispositivo; 0 desativa
+    WS_MAX_INFLIGHT_PER_CONNECTION: int = int(os.getenv("WS_MAX_INFLIGHT_PER_CONNECTION", "8"))  # mensagens de dispositivo em processamento por conexão
+    WS_SESSION_RECYCLE_MESSAGES: int = int(os.getenv("WS_SESSION_RECYCLE_MESSAGES", "500"))  # sessão de banco da conexão renovada a cada N mensagens
+    MAP_DELTA_INTERVAL_MS: int = int(os.getenv("MAP_DELTA_INTERVAL_MS", "1000"))  # envio dos deltas do mapa às conexões em map_sync
+
     # Configurações do Servidor
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
@@ -0,0 +1,204 @@
+"""
+Gerenciador de conexões WebSocket com fan-out não bloqueante
+
+Cada conexão tem uma fila de saída limitada e uma tarefa escritora
+própria; o broadcast apenas enfileira a mensagem em cada conexão, de
+modo que um dashboard lento não atrasa os demais nem quem publicou.
+
+Os eventos publicados com publish() são serializados uma única vez por
+formato (Frame): conexões abertas com ?encoding=binary recebem exatamente
+os mesmos bytes em frames binários e as demais o mesmo texto JSON.
+
+Conexões podem assinar tópicos (tipo de evento, província, posto policial,
+áreas); publish() entrega cada evento apenas às conexões cujo filtro
+combina, consultando a tabela indexada de assinaturas.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from serialization import Frame, encode_event
+from subscriptions import SubscriptionIndex, parse_filtro
+
+# Políticas para consumidores lentos (fila de saída cheia)
+DROP_OLDEST = "drop_oldest"   # descarta a mensagem mais antiga da fila
+DROP_NEWEST = "drop_newest"   # descarta a mensagem nova
+CLOSE = "close"               # fecha a conexão do consumidor lento
+SLOW_CONSUMER_POLICIES = (DROP_OLDEST, DROP_NEWEST, CLOSE)
+
+
+class _ClientConnection:
+    """Estado de uma conexão: fila de saída, tarefa escritora e contadores"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task = None
+        self.sent = 0
+        self.dropped = 0
+
+
+class ConnectionManager:
+    def __init__(
+        self,
+        queue_size: int = 256,
+        slow_consumer_policy: str = DROP_OLDEST,
+        send_timeout: float = 5.0,
+        subscription_cell_degrees: float = 0.5,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Política inválida: {slow_consumer_policy}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[WebSocket, _ClientConnection] = {}
+        self.subscriptions = SubscriptionIndex(cell_degrees=subscription_cell_degrees)
+        # Fechamentos em andamento: o loop só guarda referências fracas às tarefas
+        self._fechamentos: Set[asyncio.Task] = set()
+
+        # Métricas
+        self.total_broadcasts = 0
+        self.total_dropped = 0
+        self.total_slow_closed = 0
+        self.total_send_errors = 0
+
+    async def connect(self, websocket: WebSocket, binary: bool = False):
+        await websocket.accept()
+        conn = _ClientConnection(websocket, self.queue_size, binary)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.active_connections[websocket] = conn
+        self.subscriptions.add(conn)
+
+    def disconnect(self, websocket: WebSocket):
+        conn = self.active_connections.pop(websocket, None)
+        if conn is None:
+            return
+        self.subscriptions.remove(conn)
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        conn = self.active_connections.get(websocket)
+        if conn is None:
+            await websocket.send_text(message)
+        else:
+            self._offer(conn, message)
+
+    def offer(self, websocket: WebSocket, message: Union[str, Frame]) -> bool:
+        """Enfileirar a mensagem para uma conexão; False se ela não está registrada"""
+        conn = self.active_connections.get(websocket)
+        if conn is None:
+            return False
+        self._offer(conn, message)
+        return True
+
+    def subscribe(self, websocket: WebSocket, dados: dict) -> dict:
+        """Substituir o filtro de assinatura da conexão; levanta ValueError se inválido"""
+        conn = self.active_connections.get(websocket)
+        if conn is None:
+            raise ValueError("Conexão não registrada")
+        filtro = parse_filtro(dados)
+        self.subscriptions.add(conn, filtro)
+        return filtro
+
+    def unsubscribe(self, websocket: WebSocket) -> None:
+        """Voltar a receber todos os eventos"""
+        conn = self.active_connections.get(websocket)
+        if conn is not None:
+            self.subscriptions.add(conn)
+
+    async def publish(
+        self,
+        payload: dict,
+        provincia: Optional[str] = None,
+        posto: Optional[str] = None,
+    ):
+        """Serializar o evento uma única vez e enviá-lo às conexões assinantes"""
+        if not self.active_connections:
+            return
+        destinos = self.subscriptions.match(
+            evento=payload.get("type"),
+            provincia=provincia,
+            posto=posto,
+            lat=payload.get("latitude"),
+            lng=payload.get("longitude"),
+        )
+        if not destinos:
+            return
+
+        binarios = sum(1 for conn in destinos if conn.binary)
+        frame = encode_event(payload, text=len(destinos) > binarios, binary=binarios > 0)
+        self.total_broadcasts += 1
+        for conn in destinos:
+            self._offer(conn, frame)
+
+    async def broadcast(self, message: Union[str, Frame]):
+        """Enfileirar a mensagem em todas as conexões sem aguardar o envio"""
+        self.total_broadcasts += 1
+        # Cópia da lista: conexões podem ser removidas durante o fan-out
+        for conn in list(self.active_connections.values()):
+            self._offer(conn, message)
+
+    def _offer(self, conn: _ClientConnection, message: Union[str, Frame]) -> None:
+        try:
+            conn.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        conn.dropped += 1
+        self.total_dropped += 1
+        if self.slow_consumer_policy == DROP_OLDEST:
+            conn.queue.get_nowait()
+            conn.queue.put_nowait(message)
+        elif self.slow_consumer_policy == CLOSE:
+            self.total_slow_closed += 1
+            self.disconnect(conn.websocket)
+            fechamento = asyncio.create_task(self._close(conn.websocket))
+            self._fechamentos.add(fechamento)
+            fechamento.add_done_callback(self._fechamentos.discard)
+
+    async def _writer(self, conn: _ClientConnection) -> None:
+        """Tarefa que envia, em ordem, as mensagens da fila de uma conexão"""
+        try:
+            while True:
+                message = await conn.queue.get()
+                if not isinstance(message, Frame):
+                    envio = conn.websocket.send_text(message)
+                elif conn.binary:
+                    envio = conn.websocket.send_bytes(message.data)
+                else:
+                    envio = conn.websocket.send_text(message.text)
+                await asyncio.wait_for(envio, timeout=self.send_timeout)
+                conn.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Conexão quebrada ou lenta demais: remover
+            self.total_send_errors += 1
+            self.disconnect(conn.websocket)
+
+    async def _close(self, websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=1013)  # Try Again Later
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """Métricas das filas de saída"""
+        conns = list(self.active_connections.values())
+        depths: List[int] = [conn.queue.qsize() for conn in conns]
+        return {
+            "connections": len(depths),
+            "filtered_connections": sum(1 for conn in conns if self.subscriptions.filtro_de(conn)),
+            "queue_size": self.queue_size,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "total_broadcasts": self.total_broadcasts,
+            "total_dropped": self.total_dropped,
+            "total_slow_closed": self.total_slow_closed,
+            "total_send_errors": self.total_send_errors,
+        }
@@ -0,0 +1,150 @@
+"""
+Estatísticas do dashboard servidas de um snapshot em memória
+
+As contagens são calculadas numa única consulta agregada (somas
+condicionais) e mantidas num snapshot atualizado incrementalmente pelos
+endpoints que criam registros ou mudam status. Uma tarefa periódica
+reconcilia o snapshot com o banco, corrigindo qualquer desvio.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import case, func, select, true
+from sqlalchemy.orm import Session
+
+from models import Dispositivo, Emergencia, Usuario
+
+CAMPOS = (
+    "total_usuarios",
+    "total_dispositivos",
+    "total_emergencias",
+    "emergencias_ativas",
+    "dispositivos_roubados",
+    "usuarios_ativos",
+)
+
+
+def _soma_se(condicao):
+    return func.coalesce(func.sum(case((condicao, 1), else_=0)), 0)
+
+
+def consultar_estatisticas(db: Session) -> Dict[str, int]:
+    """Todas as contagens do dashboard numa única consulta"""
+    usuarios = select(
+        func.count().label("total_usuarios"),
+        _soma_se(Usuario.ativo == True).label("usuarios_ativos"),
+    ).subquery()
+    dispositivos = select(
+        func.count().label("total_dispositivos"),
+        _soma_se(Dispositivo.status == "roubado").label("dispositivos_roubados"),
+    ).subquery()
+    emergencias = select(
+        func.count().label("total_emergencias"),
+        _soma_se(Emergencia.status == "ativo").label("emergencias_ativas"),
+    ).subquery()
+
+    # Cada agregado tem uma linha: o JOIN explícito (ON 1) evita o aviso de
+    # produto cartesiano sem ler cada tabela mais de uma vez
+    consulta = select(usuarios, dispositivos, emergencias).select_from(
+        usuarios.join(dispositivos, true()).join(emergencias, true())
+    )
+    row = db.execute(consulta).mappings().one()
+    return {campo: int(row[campo]) for campo in CAMPOS}
+
+
+class DashboardStats:
+    """Snapshot das estatísticas com atualização incremental e reconciliação"""
+
+    def __init__(self, session_factory: Callable[[], Session], reconcile_seconds: float = 60):
+        self.session_factory = session_factory
+        self.reconcile_interval = reconcile_seconds
+        self._snapshot: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_reads = 0
+        self.total_reconciles = 0
+        self.total_drift = 0
+        self.last_reconcile_ms = 0.0
+
+    def get(self, db: Session) -> Dict[str, int]:
+        """Estatísticas atuais (consulta o banco apenas se ainda não houver snapshot)"""
+        self.total_reads += 1
+        with self._lock:
+            if self._snapshot is not None:
+                return dict(self._snapshot)
+        return self.reconcile(db)
+
+    def reconcile(self, db: Optional[Session] = None) -> Dict[str, int]:
+        """Recalcular o snapshot a partir do banco"""
+        inicio = time.perf_counter()
+        if db is None:
+            db = self.session_factory()
+            try:
+                atual = consultar_estatisticas(db)
+            finally:
+                db.close()
+        else:
+            atual = consultar_estatisticas(db)
+
+        with self._lock:
+            if self._snapshot is not None:
+                self.total_drift += sum(abs(atual[c] - self._snapshot[c]) for c in CAMPOS)
+            self._snapshot = atual
+        self.total_reconciles += 1
+        self.last_reconcile_ms = (time.perf_counter() - inicio) * 1000
+        return dict(atual)
+
+    def ajustar(self, **deltas: int) -> None:
+        """Aplicar deltas ao snapshot (ignorado enquanto não houver snapshot)"""
+        with self._lock:
+            if self._snapshot is None:
+                return
+            for campo, delta in deltas.items():
+                self._snapshot[campo] += delta
+
+    def usuario_ativo(self, antes: Optional[bool], depois: Optional[bool]) -> None:
+        if bool(antes) != bool(depois):
+            self.ajustar(usuarios_ativos=1 if depois else -1)
+
+    def status_dispositivo(self, antes: Optional[str], depois: Optional[str]) -> None:
+        if antes != depois and "roubado" in (antes, depois):
+            self.ajustar(dispositivos_roubados=1 if depois == "roubado" else -1)
+
+    def status_emergencia(self, antes: Optional[str], depois: Optional[str]) -> None:
+        if antes != depois and "ativo" in (antes, depois):
+            self.ajustar(emergencias_ativas=1 if depois == "ativo" else -1)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await loop.run_in_executor(None, self.reconcile)
+            except Exception as e:
+                print(f"❌ Erro ao reconciliar estatísticas do dashboard: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "reconcile_seconds": self.reconcile_interval,
+            "total_reads": self.total_reads,
+            "total_reconciles": self.total_reconciles,
+            "total_drift": self.total_drift,
+            "last_reconcile_ms": round(self.last_reconcile_ms, 2),
+        }
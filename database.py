@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config import settings
@@ -17,6 +18,24 @@ engine = create_engine(
 # Criar sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrona (mesmo banco, driver async) para os handlers async def,
+# que não podem bloquear o event loop esperando o banco
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+
+async_engine = create_async_engine(
+    engine.url.set(drivername=ASYNC_DRIVERS[engine.url.get_backend_name()]),
+    echo=settings.DEBUG,
+    connect_args=settings.connect_args,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=10,
+    max_overflow=20
+)
+
+# expire_on_commit=False: os atributos continuam legíveis após o commit
+# sem um novo round-trip (lazy load não é permitido em sessão async)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 # Base para os modelos
 Base = declarative_base()
 
@@ -30,12 +49,25 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    Dependency para obter sessão assíncrona do banco de dados
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """
     Inicializar banco de dados - criar todas as tabelas
     """
     from models import Base
+    from retention import adicionar_coluna_retido
     Base.metadata.create_all(bind=engine)
+    # create_all não altera tabelas existentes: a coluna retido (NOT NULL) é
+    # exigida por todo INSERT de pings, então é adicionada aqui em qualquer banco
+    with engine.begin() as conn:
+        if adicionar_coluna_retido(conn):
+            print("Coluna 'retido' adicionada a pings_dispositivos")
     print("Banco de dados inicializado com sucesso!")
 
 def create_superuser():
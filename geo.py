@@ -0,0 +1,317 @@
+"""
+Índice espacial em memória para buscas por proximidade
+
+Grade uniforme em graus, como a das assinaturas do WebSocket: cada ponto
+fica na célula (floor(lat / d), floor(lng / d)). Uma busca por raio ou por
+retângulo visita só as células que cruzam a área e confere cada ponto
+dessas células (retângulo e depois haversine). Buscas por raio com limite
+percorrem anéis de células a partir do centro e param assim que os anéis
+seguintes não podem ter ponto mais próximo: com células de 0,005° (~550 m)
+e 100 mil dispositivos, buscas de 1 a 5 km em bairros densos respondem em
+menos de 1 ms (python bench_proximidade.py).
+
+ProximityIndex guarda três grades: a última posição dos dispositivos, as
+residências dos usuários e as emergências ativas. É carregado do banco na
+inicialização e mantido pelos caminhos de escrita (pings HTTP e WebSocket,
+SOS, cadastro de usuários, resposta e finalização de emergências).
+"""
+import heapq
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models import Dispositivo, Emergencia, Usuario
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU_LAT = 111.32
+
+Ponto = Tuple[float, float]
+Achado = Tuple[Hashable, float, float, Optional[float]]  # (chave, lat, lng, distância em km)
+
+
+def distancia_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância haversine entre dois pontos, em km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def retangulo_do_raio(lat: float, lng: float, raio_km: float) -> Tuple[float, float, float, float]:
+    """Menor retângulo (min_lat, min_lng, max_lat, max_lng) que contém o círculo"""
+    dlat = raio_km / KM_POR_GRAU_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlng = 180.0 if cos_lat < 1e-6 else min(raio_km / (KM_POR_GRAU_LAT * cos_lat), 180.0)
+    return (max(lat - dlat, -90.0), max(lng - dlng, -180.0), min(lat + dlat, 90.0), min(lng + dlng, 180.0))
+
+
+def coordenadas(lat, lng) -> Optional[Ponto]:
+    """(lat, lng) como floats válidos, ou None (pings podem vir com lixo)"""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+class GridIndex:
+    """Pontos por chave numa grade de células de cell_degrees graus"""
+
+    def __init__(self, cell_degrees: float = 0.005):
+        self.cell_degrees = cell_degrees
+        self._pontos: Dict[Hashable, Tuple[float, float, Tuple[int, int]]] = {}
+        self._celulas: Dict[Tuple[int, int], Dict[Hashable, Ponto]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pontos)
+
+    def __contains__(self, chave: Hashable) -> bool:
+        return chave in self._pontos
+
+    def get(self, chave: Hashable) -> Optional[Ponto]:
+        ponto = self._pontos.get(chave)
+        return None if ponto is None else (ponto[0], ponto[1])
+
+    def atualizar(self, chave: Hashable, lat, lng, somente_novo: bool = False) -> bool:
+        """Inserir ou mover um ponto; False se as coordenadas forem inválidas
+
+        somente_novo não sobrescreve um ponto já presente (carga do banco
+        concorrente com pings mais recentes).
+        """
+        ponto = coordenadas(lat, lng)
+        if ponto is None:
+            return False
+        lat, lng = ponto
+        cell = self._cell(lat, lng)
+        with self._lock:
+            anterior = self._pontos.get(chave)
+            if anterior is not None:
+                if somente_novo:
+                    return True
+                if anterior[2] != cell:
+                    self._tirar_da_celula(chave, anterior[2])
+            self._pontos[chave] = (lat, lng, cell)
+            self._celulas.setdefault(cell, {})[chave] = ponto
+        return True
+
+    def remover(self, chave: Hashable) -> None:
+        with self._lock:
+            anterior = self._pontos.pop(chave, None)
+            if anterior is not None:
+                self._tirar_da_celula(chave, anterior[2])
+
+    def retangulo(
+        self, min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: Optional[int] = None
+    ) -> List[Achado]:
+        """Pontos dentro do retângulo (sem ordem definida)"""
+        achados = []
+        with self._lock:
+            for pontos in self._celulas_em(min_lat, min_lng, max_lat, max_lng):
+                for chave, (lat, lng) in pontos.items():
+                    if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                        achados.append((chave, lat, lng, None))
+                        if limit is not None and len(achados) >= limit:
+                            return achados
+        return achados
+
+    def raio(self, lat: float, lng: float, raio_km: float, limit: Optional[int] = None) -> List[Achado]:
+        """Pontos a até raio_km do centro, do mais próximo para o mais distante"""
+        area = retangulo_do_raio(lat, lng, raio_km)
+        min_lat, min_lng, max_lat, max_lng = area
+        achados = []
+        with self._lock:
+            if limit is not None and self._total_celulas(*area) <= len(self._celulas):
+                return self._mais_proximos(lat, lng, raio_km, limit, area)
+            for pontos in self._celulas_em(min_lat, min_lng, max_lat, max_lng):
+                for chave, (p_lat, p_lng) in pontos.items():
+                    # Retângulo primeiro: descarta a maioria sem trigonometria
+                    if min_lat <= p_lat <= max_lat and min_lng <= p_lng <= max_lng:
+                        distancia = distancia_km(lat, lng, p_lat, p_lng)
+                        if distancia <= raio_km:
+                            achados.append((chave, p_lat, p_lng, distancia))
+        if limit is not None and len(achados) > limit:
+            return heapq.nsmallest(limit, achados, key=lambda achado: achado[3])
+        achados.sort(key=lambda achado: achado[3])
+        return achados
+
+    def _mais_proximos(self, lat: float, lng: float, raio_km: float, limit: int, area: tuple) -> List[Achado]:
+        """Os limit pontos mais próximos, em anéis de células a partir do centro
+
+        Para quando os anéis seguintes já não podem ter ponto mais perto que
+        o limit-ésimo encontrado: em áreas densas visita só as células
+        vizinhas, qualquer que seja o raio pedido.
+        """
+        min_lat, min_lng, max_lat, max_lng = area
+        lat0, lng0 = self._cell(min_lat, min_lng)
+        lat1, lng1 = self._cell(max_lat, max_lng)
+        ci, cj = self._cell(lat, lng)
+        # Menor distância (km) atravessada por célula, na latitude mais afastada do equador
+        lat_extrema = min(max(abs(min_lat), abs(max_lat)), 89.9)
+        passo_km = self.cell_degrees * min(110.57, KM_POR_GRAU_LAT * math.cos(math.radians(lat_extrema)))
+
+        melhores: list = []  # heap de (-distância, ordem, achado): o topo é o mais distante
+        ordem = 0
+        for anel in range(max(ci - lat0, lat1 - ci, cj - lng0, lng1 - cj) + 1):
+            # Pontos do anel r estão a pelo menos (r - 1) células do centro
+            minimo = (anel - 1) * passo_km
+            if minimo > raio_km or (len(melhores) >= limit and -melhores[0][0] <= minimo):
+                break
+            for cell in self._anel(ci, cj, anel):
+                if not (lat0 <= cell[0] <= lat1 and lng0 <= cell[1] <= lng1):
+                    continue
+                pontos = self._celulas.get(cell)
+                if not pontos:
+                    continue
+                for chave, (p_lat, p_lng) in pontos.items():
+                    if not (min_lat <= p_lat <= max_lat and min_lng <= p_lng <= max_lng):
+                        continue
+                    distancia = distancia_km(lat, lng, p_lat, p_lng)
+                    if distancia > raio_km:
+                        continue
+                    ordem += 1
+                    if len(melhores) < limit:
+                        heapq.heappush(melhores, (-distancia, ordem, (chave, p_lat, p_lng, distancia)))
+                    elif distancia < -melhores[0][0]:
+                        heapq.heapreplace(melhores, (-distancia, ordem, (chave, p_lat, p_lng, distancia)))
+        return [achado for _, _, achado in sorted(melhores, key=lambda item: (-item[0], item[1]))]
+
+    @staticmethod
+    def _anel(ci: int, cj: int, anel: int) -> Iterator[Tuple[int, int]]:
+        if anel == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - anel, cj + anel + 1):
+            yield (ci - anel, j)
+            yield (ci + anel, j)
+        for i in range(ci - anel + 1, ci + anel):
+            yield (i, cj - anel)
+            yield (i, cj + anel)
+
+    def _total_celulas(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> int:
+        lat0, lng0 = self._cell(min_lat, min_lng)
+        lat1, lng1 = self._cell(max_lat, max_lng)
+        return (lat1 - lat0 + 1) * (lng1 - lng0 + 1)
+
+    def _celulas_em(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Iterator[Dict[Hashable, Ponto]]:
+        lat0, lng0 = self._cell(min_lat, min_lng)
+        lat1, lng1 = self._cell(max_lat, max_lng)
+        if self._total_celulas(min_lat, min_lng, max_lat, max_lng) > len(self._celulas):
+            # Área maior que a parte ocupada da grade: percorrer só as ocupadas
+            for (i, j), pontos in self._celulas.items():
+                if lat0 <= i <= lat1 and lng0 <= j <= lng1:
+                    yield pontos
+            return
+        for i in range(lat0, lat1 + 1):
+            for j in range(lng0, lng1 + 1):
+                pontos = self._celulas.get((i, j))
+                if pontos:
+                    yield pontos
+
+    def _tirar_da_celula(self, chave: Hashable, cell: Tuple[int, int]) -> None:
+        pontos = self._celulas.get(cell)
+        if pontos is not None:
+            pontos.pop(chave, None)
+            if not pontos:
+                del self._celulas[cell]
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def stats(self) -> dict:
+        return {"points": len(self._pontos), "cells": len(self._celulas)}
+
+
+class ProximityIndex:
+    """Dispositivos, residências e emergências ativas em grades espaciais"""
+
+    def __init__(self, session_factory: Callable[[], Session], cell_degrees: float = 0.005):
+        self.session_factory = session_factory
+        self.cell_degrees = cell_degrees
+        self.dispositivos = GridIndex(cell_degrees)
+        self.residencias = GridIndex(cell_degrees)
+        self.emergencias = GridIndex(cell_degrees)
+        self.carregado = False
+
+        # Métricas
+        self.total_queries = 0
+        self.last_load_ms = 0.0
+        self.last_query_ms = 0.0
+
+    async def start(self) -> None:
+        """Carregar as posições do banco (sem derrubar a inicialização se falhar)"""
+        try:
+            await run_in_threadpool(self.carregar)
+        except Exception as e:
+            print(f"⚠️ Índice de proximidade não carregado: {e}")
+
+    def garantir_carregado(self, db: Session) -> None:
+        if not self.carregado:
+            self.carregar(db)
+
+    def carregar(self, db: Optional[Session] = None) -> None:
+        """Preencher as grades a partir do banco, sem sobrescrever posições mais novas"""
+        inicio = time.perf_counter()
+        proprio = db is None
+        if proprio:
+            db = self.session_factory()
+        try:
+            dispositivos = db.execute(
+                select(Dispositivo.id, Dispositivo.ultima_localizacao_lat, Dispositivo.ultima_localizacao_lng)
+                .where(Dispositivo.ultima_localizacao_lat.is_not(None), Dispositivo.ultima_localizacao_lng.is_not(None))
+            ).all()
+            residencias = db.execute(
+                select(Usuario.id, Usuario.latitude_residencia, Usuario.longitude_residencia)
+                .where(Usuario.latitude_residencia.is_not(None), Usuario.longitude_residencia.is_not(None))
+            ).all()
+            emergencias = db.execute(
+                select(Emergencia.id, Emergencia.latitude, Emergencia.longitude)
+                .where(Emergencia.status == "ativo")
+            ).all()
+        finally:
+            if proprio:
+                db.close()
+
+        for grade, linhas in ((self.dispositivos, dispositivos), (self.residencias, residencias), (self.emergencias, emergencias)):
+            for chave, lat, lng in linhas:
+                grade.atualizar(chave, lat, lng, somente_novo=True)
+        self.carregado = True
+        self.last_load_ms = (time.perf_counter() - inicio) * 1000
+
+    def buscar(
+        self,
+        grade: GridIndex,
+        centro: Optional[Ponto] = None,
+        raio_km: Optional[float] = None,
+        area: Optional[Tuple[float, float, float, float]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Achado]:
+        """Busca por raio (centro + raio_km) ou por retângulo (area)"""
+        inicio = time.perf_counter()
+        if centro is not None:
+            achados = grade.raio(centro[0], centro[1], raio_km, limit)
+        else:
+            achados = grade.retangulo(*area, limit=limit)
+        self.total_queries += 1
+        self.last_query_ms = (time.perf_counter() - inicio) * 1000
+        return achados
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.carregado,
+            "cell_degrees": self.cell_degrees,
+            "dispositivos": self.dispositivos.stats(),
+            "residencias": self.residencias.stats(),
+            "emergencias": self.emergencias.stats(),
+            "total_queries": self.total_queries,
+            "last_load_ms": round(self.last_load_ms, 2),
+            "last_query_ms": round(self.last_query_ms, 3),
+        }
@@ -0,0 +1,267 @@
+"""
+Fila de ingestão de pings com escrita em lote (write-behind)
+
+Os pings são aceitos em memória e gravados no banco em lote: um INSERT
+multi-linha em pings_dispositivos e um UPDATE em lote da última
+localização dos dispositivos, a cada N linhas ou M milissegundos. Com
+update_last_position=False a última localização fica por conta de quem
+a guarda em memória (PositionStore) e o lote só insere o histórico.
+
+Mudanças de status vão junto com o ping que as causou e são gravadas no
+mesmo lote, com a guarda do status que o ping encontrou: se um admin
+alterou o status no meio tempo, a alteração dele prevalece. Pelo mesmo
+motivo a marca retido dos pings do lote é conferida com o status atual
+do dispositivo ao gravar, e não só com o status visto na recepção.
+
+Um lote que falha volta para a frente da fila. Depois de max_retries
+falhas seguidas ele é gravado linha a linha e as linhas que o banco
+rejeita (dados inválidos) são descartadas, para que um ping ruim não
+bloqueie a fila inteira; falhas de conexão continuam sendo repetidas.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, or_, update
+from sqlalchemy.exc import DBAPIError, DataError, IntegrityError, StatementError
+from sqlalchemy.orm import Session
+
+from models import Dispositivo, PingDispositivo
+from retention import reter_historico, reter_pings_do_lote
+
+
+class IngestQueueFull(Exception):
+    """Fila de ingestão cheia - o cliente deve tentar novamente mais tarde"""
+
+
+def _erro_de_dados(erro: Exception) -> bool:
+    """Erro causado pela linha (NOT NULL, tipo, tamanho) e não pelo banco"""
+    if isinstance(erro, (IntegrityError, DataError)):
+        return True
+    # Falha ao converter o parâmetro, antes de chegar ao banco
+    return isinstance(erro, (StatementError, TypeError, ValueError)) and not isinstance(erro, DBAPIError)
+
+
+# (dispositivo_id, status encontrado pelo ping ou None para não verificar, novo status)
+Transicao = Tuple[int, Optional[str], str]
+
+
+class PingIngestQueue:
+    """Fila limitada de pings com descarga periódica em lote"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        batch_size: int = 500,
+        flush_interval_ms: int = 250,
+        max_queue: int = 20000,
+        update_last_position: bool = True,
+        max_retries: int = 3,
+    ):
+        self.session_factory = session_factory
+        self.update_last_position = update_last_position
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._falhas = 0
+
+        self._buffer: List[Tuple[dict, Optional[Transicao]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_enqueued = 0
+        self.total_flushed = 0
+        self.total_rejected = 0
+        self.total_batches = 0
+        self.total_errors = 0
+        self.total_dropped = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def enqueue(self, ping: dict, new_status: Optional[str] = None, status_anterior: Optional[str] = None) -> None:
+        """Adicionar ping à fila; levanta IngestQueueFull se a fila estiver cheia
+
+        new_status só é gravado se o dispositivo ainda estiver em status_anterior.
+        """
+        if len(self._buffer) >= self.max_queue:
+            self.total_rejected += 1
+            raise IngestQueueFull()
+
+        transicao = None
+        if new_status is not None:
+            transicao = (ping["dispositivo_id"], status_anterior, new_status)
+        self._buffer.append((ping, transicao))
+        self.total_enqueued += 1
+
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        """Iniciar a tarefa de descarga em segundo plano"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar a tarefa e descarregar tudo o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._buffer:
+            if not await self.flush():
+                break
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            ok = await self.flush()
+            # Ainda há um lote completo pendente: descarregar sem esperar o timer
+            if ok and len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """Gravar no banco os pings pendentes; retorna False em caso de erro"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._buffer:
+                return True
+
+            lote = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+
+            inicio = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            total = len(lote)
+            descartadas = 0
+            try:
+                if self._falhas >= self.max_retries:
+                    descartadas = await loop.run_in_executor(None, self._write_isolando, lote)
+                else:
+                    rows = [ping for ping, _ in lote]
+                    transicoes = [transicao for _, transicao in lote if transicao is not None]
+                    await loop.run_in_executor(None, self._write_batch, rows, transicoes)
+            except Exception as e:
+                self._falhas += 1
+                self.total_errors += 1
+                print(f"❌ Erro ao gravar lote de pings: {e}")
+                # Devolver o lote à fila (respeitando o limite) para nova tentativa
+                espaco = max(self.max_queue - len(self._buffer), 0)
+                self._buffer[:0] = lote[:espaco]
+                return False
+
+            if descartadas:
+                self.total_errors += descartadas
+                self.total_dropped += descartadas
+            self._falhas = 0
+            self.last_flush_ms = (time.perf_counter() - inicio) * 1000
+            self.total_flushed += total - descartadas
+            self.total_batches += 1
+            return True
+
+    def _write_batch(self, rows: List[dict], transicoes: List[Transicao]) -> None:
+        """Executar o INSERT e os UPDATEs em lote numa única transação"""
+        # Última posição de cada dispositivo dentro do lote
+        latest: Dict[int, dict] = {}
+        for row in (rows if self.update_last_position else ()):
+            atual = latest.get(row["dispositivo_id"])
+            if atual is None or row["timestamp"] >= atual["b_ts"]:
+                latest[row["dispositivo_id"]] = {
+                    "b_id": row["dispositivo_id"],
+                    "b_lat": row["latitude"],
+                    "b_lng": row["longitude"],
+                    "b_ts": row["timestamp"],
+                }
+
+        db = self.session_factory()
+        try:
+            if rows:
+                db.execute(insert(PingDispositivo), rows)
+            if latest:
+                # Não sobrescrever uma posição mais recente gravada por outro caminho
+                tabela = Dispositivo.__table__
+                db.connection().execute(
+                    update(tabela)
+                    .where(tabela.c.id == bindparam("b_id"))
+                    .where(or_(tabela.c.ultimo_ping.is_(None), tabela.c.ultimo_ping <= bindparam("b_ts")))
+                    .values(
+                        ultima_localizacao_lat=bindparam("b_lat"),
+                        ultima_localizacao_lng=bindparam("b_lng"),
+                        ultimo_ping=bindparam("b_ts"),
+                    ),
+                    list(latest.values())
+                )
+            if transicoes:
+                # Na ordem dos pings; a guarda mantém um status alterado por um admin no meio tempo
+                tabela = Dispositivo.__table__
+                anterior_confere = or_(bindparam("b_anterior").is_(None), tabela.c.status == bindparam("b_anterior"))
+                db.connection().execute(
+                    update(tabela)
+                    .where(tabela.c.id == bindparam("b_id"))
+                    .where(anterior_confere)
+                    .values(status=bindparam("b_status")),
+                    [{"b_id": d, "b_anterior": anterior, "b_status": novo} for d, anterior, novo in transicoes]
+                )
+                reter_historico(db, {d for d, _, novo in transicoes if novo == "roubado"})
+            if rows:
+                # retido foi decidido na recepção; um admin pode ter marcado o
+                # dispositivo como roubado depois disso (e já rodado reter_historico)
+                reter_pings_do_lote(db, {row["dispositivo_id"] for row in rows},
+                                    min(row["timestamp"] for row in rows))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_isolando(self, lote: List[Tuple[dict, Optional[Transicao]]]) -> int:
+        """Gravar o lote linha a linha, descartando as rejeitadas; retorna quantas"""
+        descartadas = 0
+        tentadas = 0
+        try:
+            for ping, transicao in lote:
+                try:
+                    self._write_batch([ping], [transicao] if transicao else [])
+                except Exception as e:
+                    if not _erro_de_dados(e):
+                        raise
+                    print(f"❌ Ping descartado (dispositivo {ping.get('dispositivo_id')}): {e}")
+                    descartadas += 1
+                tentadas += 1
+        finally:
+            # Em caso de erro só volta à fila o que ainda não foi tentado
+            del lote[:tentadas]
+        return descartadas
+
+    def stats(self) -> dict:
+        """Métricas da fila de ingestão"""
+        return {
+            "queue_depth": len(self._buffer),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            "total_enqueued": self.total_enqueued,
+            "total_flushed": self.total_flushed,
+            "total_rejected": self.total_rejected,
+            "total_batches": self.total_batches,
+            "total_errors": self.total_errors,
+            "total_dropped": self.total_dropped,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
@@ -0,0 +1,119 @@
+"""
+Sincronização do mapa ao vivo por deltas no WebSocket
+
+O dashboard baixa o estado da frota uma vez (GET /mapa/snapshot, com a
+versão) e envia {"type": "map_sync", "versao": N, "instancia": "..."} pelo
+/ws. A partir daí recebe, a cada interval_ms, um "map_delta" só com os
+dispositivos alterados desde a última versão enviada a ele. Ao reconectar,
+o mesmo map_sync com a última versão recebida traz apenas o que mudou
+enquanto esteve fora, em vez da frota inteira.
+
+Conexões na mesma versão recebem o mesmo frame, calculado e serializado
+uma única vez. Se a fila de saída da conexão descartou mensagens, a
+próxima entrega é o estado completo (completo=True).
+"""
+import asyncio
+from typing import Dict, Optional
+
+from fastapi import WebSocket
+
+from connection_manager import ConnectionManager
+from positions import PositionStore
+from serialization import encode_event
+
+
+class _Assinante:
+    __slots__ = ("versao", "instancia", "descartadas")
+
+    def __init__(self, versao: int, instancia: Optional[str], descartadas: int):
+        self.versao = versao
+        self.instancia = instancia
+        self.descartadas = descartadas
+
+
+class MapSync:
+    """Conexões em modo delta e a tarefa que envia as alterações do mapa"""
+
+    def __init__(self, posicoes: PositionStore, manager: ConnectionManager, interval_ms: int = 1000):
+        self.posicoes = posicoes
+        self.manager = manager
+        self.interval = interval_ms / 1000
+        self._assinantes: Dict[WebSocket, _Assinante] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_deltas = 0
+        self.total_full = 0
+        self.total_changes_sent = 0
+
+    def __len__(self) -> int:
+        return len(self._assinantes)
+
+    def sincronizar(self, websocket: WebSocket, versao: int = 0, instancia: Optional[str] = None) -> None:
+        """Colocar a conexão em modo delta e enviar o que mudou desde `versao`"""
+        conn = self.manager.active_connections.get(websocket)
+        if conn is None:
+            return
+        self._assinantes[websocket] = _Assinante(versao, instancia, conn.dropped)
+        self._enviar({websocket: self._assinantes[websocket]})
+
+    def remover(self, websocket: WebSocket) -> None:
+        self._assinantes.pop(websocket, None)
+
+    def _enviar(self, assinantes: Dict[WebSocket, _Assinante]) -> None:
+        instancia = self.posicoes.instancia.hex()
+        frames = {}
+        for websocket, assinante in assinantes.items():
+            conn = self.manager.active_connections.get(websocket)
+            if conn is None:
+                self.remover(websocket)
+                continue
+            if conn.dropped != assinante.descartadas:
+                # Um delta pode ter sido descartado: reenviar o estado completo
+                assinante.versao, assinante.descartadas = 0, conn.dropped
+            chave = (assinante.versao, assinante.instancia)
+            if assinante.versao == self.posicoes.versao and assinante.instancia == instancia:
+                continue
+            if chave not in frames:
+                delta = self.posicoes.alteracoes_desde(*chave)
+                frames[chave] = (encode_event({"type": "map_delta", **delta}), delta)
+                if delta["completo"]:
+                    self.total_full += 1
+                else:
+                    self.total_deltas += 1
+                self.total_changes_sent += len(delta["ids"])
+            frame, delta = frames[chave]
+            self.manager.offer(websocket, frame)
+            assinante.versao, assinante.instancia = delta["versao"], delta["instancia"]
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._assinantes.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._assinantes:
+                try:
+                    self._enviar(dict(self._assinantes))
+                except Exception as e:
+                    print(f"❌ Erro ao enviar deltas do mapa: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._assinantes),
+            "interval_ms": int(self.interval * 1000),
+            "total_deltas": self.total_deltas,
+            "total_full": self.total_full,
+            "total_changes_sent": self.total_changes_sent,
+        }
@@ -1,23 +1,41 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, WebSocket, WebSocketDisconnect, File, UploadFile, Form
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, or_, select, update
 from typing import List, Optional, Annotated
 from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
-import uuid
-import shutil
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import jwt
-from passlib.context import CryptContext
 
 # Imports locais
-from database import get_db, init_db, engine
+from database import get_db, get_async_db, init_db, engine, SessionLocal, AsyncSessionLocal
 from models import Admin, Usuario, Dispositivo, Emergencia, LogSistema, PingDispositivo
+from ingest import PingIngestQueue, IngestQueueFull
+from cache import AdminPrincipal, DeviceCache, PrincipalCache, TTLCache
+from coalescer import PingCoalescer
+from dashboard import DashboardStats
+from geo import GridIndex, ProximityIndex, coordenadas
+from positions import PositionStore
+from live_map import MapSync
+from trajectory import simplificar
+from presence import OfflineSweeper
+from pagination import CursorInvalido, filtrar_por_tempo, paginar_por_id, paginar_por_tempo, proximo_cursor_por_tempo
+from retention import PingRetention, ping_retido, reter_historico
+from connection_manager import ConnectionManager
+from serialization import dumps, stream_json_array
+from unit_of_work import ConnectionUnitOfWork
+from passwords import LoginThrottle, PasswordHasher, PasswordPoolBusy, TooManyAttempts
+from static_uploads import UploadFiles
+from uploads import FotoRecebida, PhotoStore, UploadTooLarge
+from variants import VARIANTES, VariantWorker
 import schemas
 
 # Importar configurações centralizadas
@@ -29,6 +47,81 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 MAX_FILE_SIZE = settings.MAX_FILE_SIZE
 ALLOWED_EXTENSIONS = settings.ALLOWED_EXTENSIONS
 
+# Fila de ingestão de pings (gravação em lote)
+ping_ingest = PingIngestQueue(
+    SessionLocal,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval_ms=settings.INGEST_FLUSH_INTERVAL_MS,
+    max_queue=settings.INGEST_MAX_QUEUE,
+    update_last_position=False
+)
+
+# Última posição de cada dispositivo em memória (checkpoint periódico na linha do banco)
+posicoes = PositionStore(
+    SessionLocal,
+    checkpoint_seconds=settings.POSITION_CHECKPOINT_SECONDS,
+    checkpoint_batch=settings.POSITION_CHECKPOINT_BATCH
+)
+
+# Downsampling/expiração dos pings e manutenção das partições
+ping_retention = PingRetention(
+    SessionLocal,
+    retention_days=settings.PING_RETENTION_DAYS,
+    downsample_after_days=settings.PING_DOWNSAMPLE_AFTER_DAYS,
+    downsample_minutes=settings.PING_DOWNSAMPLE_MINUTES,
+    months_ahead=settings.PING_PARTITION_MONTHS_AHEAD,
+    interval_hours=settings.PING_RETENTION_INTERVAL_HOURS
+)
+
+# Estatísticas do dashboard (snapshot em memória reconciliado periodicamente)
+dashboard_stats = DashboardStats(SessionLocal, reconcile_seconds=settings.DASHBOARD_RECONCILE_SECONDS)
+
+# Índice espacial (dispositivos, residências e emergências ativas) para buscas por proximidade
+proximidade = ProximityIndex(SessionLocal, cell_degrees=settings.GEO_CELL_DEGREES)
+
+# Cache de resolução IMEI → dispositivo/usuário
+device_cache = DeviceCache(
+    maxsize=settings.DEVICE_CACHE_MAX_SIZE,
+    ttl=settings.DEVICE_CACHE_TTL_SECONDS
+)
+
+# Trajetos simplificados por (dispositivo, período, tolerância, intervalo)
+trajeto_cache = TTLCache(maxsize=settings.TRACK_CACHE_SIZE, ttl=settings.TRACK_CACHE_TTL_SECONDS)
+
+# Miniaturas e variantes WebP das fotos, geradas em segundo plano
+variant_worker = VariantWorker(
+    UPLOAD_DIR,
+    workers=settings.UPLOAD_VARIANT_WORKERS,
+    queue_size=settings.UPLOAD_VARIANT_QUEUE_SIZE
+)
+
+# Fotos endereçadas pelo conteúdo (deduplicadas) e limpeza de órfãs
+photo_store = PhotoStore(
+    UPLOAD_DIR,
+    SessionLocal,
+    grace_seconds=settings.UPLOAD_ORPHAN_GRACE_SECONDS,
+    interval_seconds=settings.UPLOAD_SWEEP_INTERVAL_SECONDS,
+    ao_remover=variant_worker.remover
+)
+
+# bcrypt em pool dedicado e limite de tentativas de login
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.PASSWORD_POOL_WORKERS,
+    max_pending=settings.PASSWORD_POOL_MAX_PENDING
+)
+login_throttle = LoginThrottle(
+    max_por_email=settings.LOGIN_MAX_ATTEMPTS_PER_EMAIL,
+    max_por_ip=settings.LOGIN_MAX_ATTEMPTS_PER_IP,
+    janela_segundos=settings.LOGIN_ATTEMPT_WINDOW_SECONDS
+)
+
+# Cache de autenticação: token verificado → admin (invalidado ao alterar o admin)
+principal_cache = PrincipalCache(
+    maxsize=settings.AUTH_CACHE_MAX_SIZE,
+    ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+
 # Lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -54,10 +147,32 @@ async def lifespan(app: FastAPI):
         print(f"⚠️ Erro na inicialização: {e}")
         print("⚠️ Sistema continuará sem banco de dados")
     
+    await ping_ingest.start()
+    await posicoes.start()
+    await ping_retention.start()
+    await dashboard_stats.start()
+    await proximidade.start()
+    await photo_store.start()
+    await variant_worker.start()
+    await map_sync.start()
+    await presenca.start((dispositivo_id, quando) for dispositivo_id, quando, status in posicoes.vistos() if status != "inativo")
+    
     yield
     
     # Shutdown
     print("🛑 AntiCrime 04 API encerrando...")
+    
+    # Gravar pings ainda pendentes na fila
+    ping_coalescer.close()
+    password_hasher.close()
+    await map_sync.stop()
+    await presenca.stop()
+    await variant_worker.stop()
+    await photo_store.stop()
+    await dashboard_stats.stop()
+    await ping_retention.stop()
+    await ping_ingest.stop()
+    await posicoes.stop()
 
 # Inicializar FastAPI
 app = FastAPI(
@@ -74,39 +189,101 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Servir arquivos estáticos (uploads)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+@app.exception_handler(CursorInvalido)
+async def cursor_invalido_handler(request: Request, exc: CursorInvalido):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(PasswordPoolBusy)
+async def password_pool_busy_handler(request: Request, exc: PasswordPoolBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Sistema sobrecarregado, tente novamente"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(TooManyAttempts)
+async def too_many_attempts_handler(request: Request, exc: TooManyAttempts):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Muitas tentativas de login, tente novamente mais tarde"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Servir arquivos estáticos (uploads): nomes imutáveis, cache de longa duração
+uploads_static = UploadFiles(directory=UPLOAD_DIR, max_age=settings.UPLOAD_CACHE_MAX_AGE_SECONDS)
+
+@app.api_route("/uploads/{caminho:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def servir_upload(caminho: str, request: Request, variante: Optional[str] = None):
+    """Arquivo de /uploads; ?variante=miniatura|media|webp serve a versão
+    redimensionada, ou o original enquanto ela não foi gerada"""
+    if variante is not None:
+        if variante not in VARIANTES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Variante inválida. Use: {', '.join(VARIANTES)}"
+            )
+        servido = await variant_worker.resolver(caminho, variante)
+        if servido == caminho:
+            # Original no lugar da variante ainda pendente: não pode ficar no
+            # cache como "imutável", senão a miniatura nunca chega
+            response = await uploads_static.get_response(caminho, request.scope)
+            response.headers["cache-control"] = "no-cache"
+            return response
+        caminho = servido
+    return await uploads_static.get_response(caminho, request.scope)
 
 # Configuração de autenticação
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Gerenciador de conexões WebSocket
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+manager = ConnectionManager(
+    queue_size=settings.WS_QUEUE_SIZE,
+    slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS,
+    subscription_cell_degrees=settings.WS_SUBSCRIPTION_CELL_DEGREES
+)
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Broadcasts de posição: no máximo um por dispositivo a cada janela (latest-wins)
+ping_coalescer = PingCoalescer(manager.publish, window_ms=settings.WS_PING_COALESCE_MS)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Dashboards em modo delta: só os dispositivos alterados desde a última versão enviada
+map_sync = MapSync(posicoes, manager, interval_ms=settings.MAP_DELTA_INTERVAL_MS)
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+async def notificar_offline(dispositivos: List[dict]) -> None:
+    """Evento device_offline para cada dispositivo sem ping dentro do prazo"""
+    for dispositivo in dispositivos:
+        if dispositivo["status"] != dispositivo["status_anterior"]:
+            dashboard_stats.status_dispositivo(dispositivo["status_anterior"], dispositivo["status"])
+            posicoes.definir_status(dispositivo["id"], dispositivo["status"])
+        await manager.publish({
+            "type": "device_offline",
+            "device_id": dispositivo["id"],
+            "imei": dispositivo["imei"],
+            "device_marca": dispositivo["marca"],
+            "device_modelo": dispositivo["modelo"],
+            "status": dispositivo["status"],
+            "ultimo_ping": dispositivo["ultimo_ping"].isoformat(),
+            "message": f"Dispositivo {dispositivo['marca']} {dispositivo['modelo']} sem sinal"
+        }, **rota_assinatura(dispositivo))
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                # Remover conexões quebradas
-                self.active_connections.remove(connection)
+# Dispositivos sem ping há DEVICE_OFFLINE_AFTER_SECONDS (heap de prazos, varrido periodicamente)
+presenca = OfflineSweeper(
+    SessionLocal,
+    device_cache,
+    offline_after_seconds=settings.DEVICE_OFFLINE_AFTER_SECONDS,
+    interval_seconds=settings.DEVICE_OFFLINE_SWEEP_SECONDS,
+    batch_size=settings.DEVICE_OFFLINE_BATCH_SIZE,
+    ao_ficar_offline=notificar_offline
+)
 
-manager = ConnectionManager()
+def rota_assinatura(dispositivo: Optional[dict]) -> dict:
+    """Província e posto do dispositivo usados no roteamento das assinaturas do WebSocket"""
+    if not dispositivo:
+        return {}
+    return {"provincia": dispositivo["usuario_provincia"], "posto": dispositivo["posto_policial"]}
 
 # Funções auxiliares para upload de arquivos
 def validate_file(file: UploadFile) -> bool:
@@ -121,26 +298,28 @@ def validate_file(file: UploadFile) -> bool:
     
     return True
 
-def save_upload_file(file: UploadFile, destination: Path) -> None:
-    """Salvar arquivo de upload"""
+async def receber_foto_residencia(foto: UploadFile) -> FotoRecebida:
+    """Validar e gravar a foto (em blocos, endereçada pelo conteúdo)"""
+    if not validate_file(foto):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Arquivo inválido. Use apenas imagens: JPG, PNG, GIF, BMP, WEBP"
+        )
+    
     try:
-        with destination.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    finally:
-        file.file.close()
-
-def generate_filename(original_filename: str) -> str:
-    """Gerar nome único para arquivo"""
-    file_ext = Path(original_filename).suffix.lower()
-    unique_id = str(uuid.uuid4())
-    return f"{unique_id}{file_ext}"
+        return await photo_store.receber(foto, MAX_FILE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Arquivo muito grande. Máximo {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
 
-# Funções auxiliares de autenticação
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Funções auxiliares de autenticação (bcrypt no pool de senhas)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -155,34 +334,51 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def get_current_admin(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-):
+) -> AdminPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        admin_id: int = payload.get("sub")
-        if admin_id is None:
+    token = credentials.credentials
+    principal = principal_cache.get(token)
+    if principal is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            admin_id: int = payload.get("sub")
+            if admin_id is None:
+                raise credentials_exception
+        except jwt.PyJWTError:
+            raise credentials_exception
+        
+        geracao = principal_cache.geracao()
+        admin = db.query(Admin).filter(Admin.id == admin_id).first()
+        if admin is None:
             raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
+        principal = AdminPrincipal(admin.id, admin.tipo_admin, admin.ativo, admin.nome_completo)
+        principal_cache.set(token, principal, payload.get("exp"), geracao)
     
-    admin = db.query(Admin).filter(Admin.id == admin_id).first()
-    if admin is None:
-        raise credentials_exception
-    return admin
+    if not principal.ativo:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Conta desativada"
+        )
+    return principal
 
 # Banco de dados é inicializado no lifespan handler
 
 # ROTAS DE AUTENTICAÇÃO
 @app.post("/auth/login", response_model=schemas.Token)
-def login(login_data: schemas.Login, db: Session = Depends(get_db)):
+async def login(login_data: schemas.Login, request: Request, db: AsyncSession = Depends(get_async_db)):
     """Login de administrador"""
-    admin = db.query(Admin).filter(Admin.email == login_data.email).first()
+    # Email/IP com falhas demais: recusar antes de gastar CPU com o bcrypt
+    ip = request.client.host if request.client else None
+    login_throttle.verificar(login_data.email, ip)
     
-    if not admin or not verify_password(login_data.senha, admin.senha_hash):
+    admin = (await db.execute(select(Admin).where(Admin.email == login_data.email))).scalars().first()
+    
+    if not admin or not await verify_password(login_data.senha, admin.senha_hash):
+        login_throttle.registrar_falha(login_data.email, ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha incorretos",
@@ -195,9 +391,11 @@ def login(login_data: schemas.Login, db: Session = Depends(get_db)):
             detail="Conta desativada"
         )
     
+    login_throttle.registrar_sucesso(login_data.email)
+    
     # Atualizar último login
     admin.ultimo_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     # Criar token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -208,16 +406,19 @@ def login(login_data: schemas.Login, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/auth/me", response_model=schemas.AdminResponse)
-def read_users_me(current_admin: Admin = Depends(get_current_admin)):
+def read_users_me(
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
     """Obter dados do admin logado"""
-    return current_admin
+    return db.query(Admin).filter(Admin.id == current_admin.id).first()
 
 # ROTAS DE ADMINS
 @app.post("/admins/", response_model=schemas.AdminResponse)
-def create_admin(
+async def create_admin(
     admin: schemas.AdminCreate,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Criar novo administrador (apenas super_admin)"""
     if current_admin.tipo_admin != "super_admin":
@@ -227,21 +428,21 @@ def create_admin(
         )
     
     # Verificar se email já existe
-    if db.query(Admin).filter(Admin.email == admin.email).first():
+    if (await db.execute(select(Admin.id).where(Admin.email == admin.email))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já cadastrado"
         )
     
     # Verificar se badge já existe
-    if db.query(Admin).filter(Admin.numero_badge == admin.numero_badge).first():
+    if (await db.execute(select(Admin.id).where(Admin.numero_badge == admin.numero_badge))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Número de badge já cadastrado"
         )
     
     # Criar admin
-    hashed_password = get_password_hash(admin.senha)
+    hashed_password = await get_password_hash(admin.senha)
     db_admin = Admin(
         nome_completo=admin.nome_completo,
         email=admin.email,
@@ -253,28 +454,76 @@ def create_admin(
         criado_por=current_admin.id
     )
     db.add(db_admin)
-    db.commit()
-    db.refresh(db_admin)
+    await db.commit()
+    await db.refresh(db_admin)
     
     return db_admin
 
 @app.get("/admins/", response_model=List[schemas.AdminResponse])
 def read_admins(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Listar administradores"""
-    admins = db.query(Admin).offset(skip).limit(limit).all()
+    """Listar administradores (próxima página no header X-Next-Cursor)"""
+    admins, proximo = paginar_por_id(db.query(Admin), Admin.id, cursor, limit, skip)
+    if proximo:
+        response.headers["X-Next-Cursor"] = proximo
     return admins
 
+@app.put("/admins/{admin_id}", response_model=schemas.AdminResponse)
+def update_admin(
+    admin_id: int,
+    admin_update: schemas.AdminUpdate,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Atualizar ou desativar administrador (apenas super_admin)"""
+    if current_admin.tipo_admin != "super_admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas super administradores podem alterar admins"
+        )
+    
+    admin = db.query(Admin).filter(Admin.id == admin_id).first()
+    if admin is None:
+        raise HTTPException(status_code=404, detail="Administrador não encontrado")
+    
+    update_data = admin_update.dict(exclude_unset=True)
+    if "email" in update_data and db.query(Admin).filter(
+        Admin.email == update_data["email"], Admin.id != admin_id
+    ).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email já cadastrado"
+        )
+    if "numero_badge" in update_data and db.query(Admin).filter(
+        Admin.numero_badge == update_data["numero_badge"], Admin.id != admin_id
+    ).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Número de badge já cadastrado"
+        )
+    
+    for field, value in update_data.items():
+        setattr(admin, field, value)
+    
+    db.commit()
+    db.refresh(admin)
+    
+    # Tokens já verificados deste admin voltam a consultar o banco
+    principal_cache.invalidate_admin(admin_id)
+    return admin
+
 # ROTAS DE USUÁRIOS (JSON)
 @app.post("/usuarios/", response_model=schemas.UsuarioResponse)
 def create_usuario_json(
     usuario: schemas.UsuarioCreate,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Cadastrar novo usuário via JSON (sem foto)"""
     # Verificar se número de identidade já existe
@@ -290,8 +539,11 @@ def create_usuario_json(
         admin_cadastrador_id=current_admin.id
     )
     db.add(db_usuario)
+    photo_store.referenciar_url(db, db_usuario.foto_residencia)
     db.commit()
     db.refresh(db_usuario)
+    dashboard_stats.ajustar(total_usuarios=1, usuarios_ativos=1 if db_usuario.ativo else 0)
+    proximidade.residencias.atualizar(db_usuario.id, db_usuario.latitude_residencia, db_usuario.longitude_residencia)
     
     return db_usuario
 
@@ -322,7 +574,7 @@ async def create_usuario(
     
     # Dependências
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Cadastrar novo usuário com foto da residência"""
     
@@ -347,33 +599,9 @@ async def create_usuario(
         )
     
     # Processar upload da foto
-    foto_url = None
+    foto = None
     if foto_residencia and foto_residencia.filename:
-        # Validar arquivo
-        if not validate_file(foto_residencia):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Arquivo inválido. Use apenas imagens: JPG, PNG, GIF, BMP, WEBP"
-            )
-        
-        # Verificar tamanho do arquivo
-        file_content = await foto_residencia.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Arquivo muito grande. Máximo {MAX_FILE_SIZE // (1024*1024)}MB"
-            )
-        
-        # Gerar nome único e salvar arquivo
-        filename = generate_filename(foto_residencia.filename)
-        file_path = UPLOAD_DIR / filename
-        
-        # Salvar o conteúdo do arquivo
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        # URL para acessar a foto
-        foto_url = f"/uploads/{filename}"
+        foto = await receber_foto_residencia(foto_residencia)
     
     # Criar usuário
     db_usuario = Usuario(
@@ -390,27 +618,41 @@ async def create_usuario(
         ponto_referencia=ponto_referencia,
         latitude_residencia=latitude_residencia,
         longitude_residencia=longitude_residencia,
-        foto_residencia=foto_url,
+        foto_residencia=foto.url if foto else None,
         observacoes=observacoes,
         ativo=ativo,
         admin_cadastrador_id=current_admin.id
     )
     
     db.add(db_usuario)
-    db.commit()
+    try:
+        if foto:
+            photo_store.referenciar(db, foto)
+        db.commit()
+    except BaseException:
+        if foto:
+            await photo_store.descartar(foto)
+        raise
+    if foto:
+        await photo_store.confirmar(foto)
+        variant_worker.agendar(foto.caminho)
     db.refresh(db_usuario)
+    dashboard_stats.ajustar(total_usuarios=1, usuarios_ativos=1 if db_usuario.ativo else 0)
+    proximidade.residencias.atualizar(db_usuario.id, db_usuario.latitude_residencia, db_usuario.longitude_residencia)
     
     return db_usuario
 
 @app.get("/usuarios/", response_model=List[schemas.UsuarioResponse])
 def read_usuarios(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Listar usuários com busca opcional"""
+    """Listar usuários com busca opcional (próxima página no header X-Next-Cursor)"""
     query = db.query(Usuario)
     
     if search:
@@ -422,14 +664,16 @@ def read_usuarios(
             )
         )
     
-    usuarios = query.offset(skip).limit(limit).all()
+    usuarios, proximo = paginar_por_id(query, Usuario.id, cursor, limit, skip)
+    if proximo:
+        response.headers["X-Next-Cursor"] = proximo
     return usuarios
 
 @app.get("/usuarios/{usuario_id}", response_model=schemas.UsuarioResponse)
 def read_usuario(
     usuario_id: int,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Obter usuário por ID"""
     usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
@@ -442,7 +686,7 @@ def update_usuario(
     usuario_id: int,
     usuario_update: schemas.UsuarioUpdate,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Atualizar usuário"""
     usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
@@ -450,12 +694,21 @@ def update_usuario(
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
     # Atualizar campos
+    ativo_antes = usuario.ativo
     update_data = usuario_update.dict(exclude_unset=True)
+    if "foto_residencia" in update_data and update_data["foto_residencia"] != usuario.foto_residencia:
+        photo_store.referenciar_url(db, update_data["foto_residencia"])
+        photo_store.liberar(db, usuario.foto_residencia)
     for field, value in update_data.items():
         setattr(usuario, field, value)
     
     db.commit()
     db.refresh(usuario)
+    dashboard_stats.usuario_ativo(ativo_antes, usuario.ativo)
+    proximidade.residencias.atualizar(usuario.id, usuario.latitude_residencia, usuario.longitude_residencia)
+    
+    # Nome/telefone/endereço ficam em cache junto com os dispositivos
+    device_cache.invalidate_usuario(usuario_id)
     return usuario
 
 @app.post("/usuarios/{usuario_id}/foto")
@@ -463,7 +716,7 @@ async def upload_foto_residencia(
     usuario_id: int,
     foto: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Upload/atualizar foto da residência do usuário"""
     
@@ -472,50 +725,31 @@ async def upload_foto_residencia(
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
-    # Validar arquivo
-    if not validate_file(foto):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Arquivo inválido. Use apenas imagens: JPG, PNG, GIF, BMP, WEBP"
-        )
+    recebida = await receber_foto_residencia(foto)
     
-    # Verificar tamanho do arquivo
-    file_content = await foto.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Arquivo muito grande. Máximo {MAX_FILE_SIZE // (1024*1024)}MB"
-        )
-    
-    # Remover foto anterior se existir
-    if usuario.foto_residencia:
-        old_filename = usuario.foto_residencia.split("/")[-1]
-        old_file_path = UPLOAD_DIR / old_filename
-        if old_file_path.exists():
-            old_file_path.unlink()
-    
-    # Gerar nome único e salvar arquivo
-    filename = generate_filename(foto.filename)
-    file_path = UPLOAD_DIR / filename
-    
-    # Salvar o conteúdo do arquivo
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-    
-    # Atualizar URL da foto no usuário
-    usuario.foto_residencia = f"/uploads/{filename}"
-    db.commit()
+    # Atualizar URL da foto no usuário; a anterior perde uma referência e,
+    # sem nenhuma, é removida pela limpeza periódica
+    try:
+        photo_store.referenciar(db, recebida)
+        photo_store.liberar(db, usuario.foto_residencia)
+        usuario.foto_residencia = recebida.url
+        db.commit()
+    except BaseException:
+        await photo_store.descartar(recebida)
+        raise
+    await photo_store.confirmar(recebida)
+    variant_worker.agendar(recebida.caminho)
     
     return {
         "message": "Foto atualizada com sucesso",
-        "foto_url": usuario.foto_residencia
+        "foto_url": recebida.url
     }
 
 # ROTAS DE DISPOSITIVOS
 @app.post("/dispositivos/ping")
 async def dispositivo_ping(
     ping_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Endpoint HTTP para dispositivos enviarem pings de localização"""
     # Validar dados obrigatórios
@@ -524,57 +758,69 @@ async def dispositivo_ping(
         if field not in ping_data:
             raise HTTPException(status_code=400, detail=f"Campo {field} é obrigatório")
     
+    # Coordenadas inválidas não entram na fila (o lote inteiro falharia no banco)
+    ponto = coordenadas(ping_data["latitude"], ping_data["longitude"])
+    if ponto is None:
+        raise HTTPException(status_code=400, detail="Informe latitude e longitude válidas")
+    
     imei = ping_data["imei"]
-    lat = ping_data["latitude"]
-    lng = ping_data["longitude"]
+    lat, lng = ponto
     bateria = ping_data.get("bateria", 0)
     precisao = ping_data.get("precisao", 0)
     device_status = ping_data.get("status", "ativo")
     tipo_ping = ping_data.get("tipo_ping", "device_ping")
     
     # Verificar se dispositivo existe
-    dispositivo = db.query(Dispositivo).filter(Dispositivo.imei == imei).first()
+    dispositivo = await device_cache.get_by_imei_async(db, imei)
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo não registrado no sistema")
     
-    # Atualizar localização e último ping
-    dispositivo.ultima_localizacao_lat = lat
-    dispositivo.ultima_localizacao_lng = lng
-    dispositivo.ultimo_ping = datetime.utcnow()
-    
     # Atualizar status baseado no tipo de ping
+    device_status_atual = dispositivo["status"]
     if tipo_ping == "stolen_device_ping" or device_status == "roubado":
-        dispositivo.status = "roubado"
-    elif dispositivo.status == "inativo":
-        dispositivo.status = "ativo"
-    
-    # Registrar ping no histórico
-    ping_record = PingDispositivo(
-        dispositivo_id=dispositivo.id,
-        latitude=lat,
-        longitude=lng,
-        precisao_gps=precisao,
-        nivel_bateria=bateria,
-        status_dispositivo=dispositivo.status,
-        tipo_ping=tipo_ping,
-        timestamp=datetime.utcnow()
-    )
-    db.add(ping_record)
-    db.commit()
+        device_status_atual = "roubado"
+    elif dispositivo["status"] == "inativo":
+        device_status_atual = "ativo"
     
-    # Buscar dados do usuário
-    usuario = db.query(Usuario).filter(Usuario.id == dispositivo.usuario_id).first()
+    # Registrar ping na fila de ingestão (gravado em lote no banco)
+    recebido_em = datetime.utcnow()
+    try:
+        ping_ingest.enqueue({
+            "dispositivo_id": dispositivo["id"],
+            "latitude": lat,
+            "longitude": lng,
+            "precisao_gps": precisao,
+            "nivel_bateria": bateria,
+            "status_dispositivo": device_status_atual,
+            "tipo_ping": tipo_ping,
+            "retido": ping_retido(device_status_atual),
+            "timestamp": recebido_em
+        }, device_status_atual if device_status_atual != dispositivo["status"] else None, dispositivo["status"])
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sistema sobrecarregado, tente novamente",
+            headers={"Retry-After": "1"}
+        )
+    
+    if posicoes.atualizar(dispositivo["id"], lat, lng, recebido_em, device_status_atual):
+        proximidade.dispositivos.atualizar(dispositivo["id"], lat, lng)
+        presenca.visto(dispositivo["id"], recebido_em)
+    
+    if device_status_atual != dispositivo["status"]:
+        device_cache.set_status(imei, device_status_atual)
+        dashboard_stats.status_dispositivo(dispositivo["status"], device_status_atual)
     
     # Notificar admins via WebSocket se conectados
     notification = {
         "type": "device_ping",
-        "device_id": dispositivo.id,
-        "imei": dispositivo.imei,
-        "device_marca": dispositivo.marca,
-        "device_modelo": dispositivo.modelo,
-        "device_status": dispositivo.status,
-        "usuario_id": dispositivo.usuario_id,
-        "usuario_nome": usuario.nome_completo if usuario else "N/A",
+        "device_id": dispositivo["id"],
+        "imei": dispositivo["imei"],
+        "device_marca": dispositivo["marca"],
+        "device_modelo": dispositivo["modelo"],
+        "device_status": device_status_atual,
+        "usuario_id": dispositivo["usuario_id"],
+        "usuario_nome": dispositivo["usuario_nome"],
         "latitude": lat,
         "longitude": lng,
         "bateria": bateria,
@@ -583,28 +829,28 @@ async def dispositivo_ping(
     }
     
     # Se é dispositivo roubado, enviar alerta especial
-    if dispositivo.status == "roubado":
-        await manager.broadcast(json.dumps({
+    if device_status_atual == "roubado":
+        await manager.publish({
             "type": "stolen_device_located",
             "message": f"🚨 DISPOSITIVO ROUBADO LOCALIZADO!",
-            "device_id": dispositivo.id,
+            "device_id": dispositivo["id"],
             "imei": imei,
-            "device_info": f"{dispositivo.marca} {dispositivo.modelo}",
-            "user_name": usuario.nome_completo if usuario else "N/A",
+            "device_info": f"{dispositivo['marca']} {dispositivo['modelo']}",
+            "user_name": dispositivo["usuario_nome"],
             "latitude": lat,
             "longitude": lng,
             "bateria": bateria,
             "timestamp": datetime.utcnow().isoformat()
-        }))
+        }, **rota_assinatura(dispositivo))
     else:
-        # Ping normal
-        await manager.broadcast(json.dumps(notification))
+        # Ping normal (coalescido por dispositivo)
+        await ping_coalescer.offer(dispositivo["id"], notification, **rota_assinatura(dispositivo))
     
     return {
         "status": "success",
         "message": "Ping registrado com sucesso",
-        "device_id": dispositivo.id,
-        "device_status": dispositivo.status,
+        "device_id": dispositivo["id"],
+        "device_status": device_status_atual,
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -635,6 +881,7 @@ def register_dispositivo(
     dispositivo.ultimo_ping = datetime.utcnow()
     
     db.commit()
+    device_cache.invalidate(imei=imei)
     
     return {
         "status": "success",
@@ -647,7 +894,7 @@ def register_dispositivo(
 def create_dispositivo(
     dispositivo: schemas.DispositivoCreate,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Cadastrar novo dispositivo para usuário"""
     # Verificar se IMEI já existe
@@ -667,32 +914,72 @@ def create_dispositivo(
     db.add(db_dispositivo)
     db.commit()
     db.refresh(db_dispositivo)
+    dashboard_stats.ajustar(total_dispositivos=1)
+    dashboard_stats.status_dispositivo(None, db_dispositivo.status)
+    posicoes.definir_status(db_dispositivo.id, db_dispositivo.status)
     
     return db_dispositivo
 
+def com_posicao_atual(dispositivos: List[Dispositivo]) -> List[Dispositivo]:
+    """Sobrepor a posição em memória quando for mais recente que a da linha (sem marcar alteração)"""
+    for dispositivo in dispositivos:
+        posicao = posicoes.get(dispositivo.id)
+        if posicao is None or (dispositivo.ultimo_ping is not None and posicao.timestamp <= dispositivo.ultimo_ping):
+            continue
+        set_committed_value(dispositivo, "ultima_localizacao_lat", posicao.latitude)
+        set_committed_value(dispositivo, "ultima_localizacao_lng", posicao.longitude)
+        set_committed_value(dispositivo, "ultimo_ping", posicao.timestamp)
+    return dispositivos
+
 @app.get("/dispositivos/", response_model=List[schemas.DispositivoResponse])
 def read_dispositivos(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status_filter: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Listar dispositivos com filtro de status opcional"""
+    """Listar dispositivos com filtro de status opcional (próxima página no header X-Next-Cursor)"""
     query = db.query(Dispositivo)
     
     if status_filter:
         query = query.filter(Dispositivo.status == status_filter)
     
-    dispositivos = query.offset(skip).limit(limit).all()
-    return dispositivos
+    dispositivos, proximo = paginar_por_id(query, Dispositivo.id, cursor, limit, skip)
+    if proximo:
+        response.headers["X-Next-Cursor"] = proximo
+    return com_posicao_atual(dispositivos)
+
+@app.get("/dispositivos/{dispositivo_id}/posicao")
+def read_posicao_dispositivo(
+    dispositivo_id: int,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Última posição conhecida do dispositivo ("visto por último")"""
+    posicao = posicoes.get(dispositivo_id)
+    if posicao is None:
+        linha = db.query(
+            Dispositivo.ultima_localizacao_lat, Dispositivo.ultima_localizacao_lng, Dispositivo.ultimo_ping
+        ).filter(Dispositivo.id == dispositivo_id).first()
+        if linha is None:
+            raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
+        return {"dispositivo_id": dispositivo_id, "latitude": linha[0], "longitude": linha[1], "ultimo_ping": linha[2]}
+    return {
+        "dispositivo_id": dispositivo_id,
+        "latitude": posicao.latitude,
+        "longitude": posicao.longitude,
+        "ultimo_ping": posicao.timestamp
+    }
 
 @app.put("/dispositivos/{dispositivo_id}/status")
 def update_dispositivo_status(
     dispositivo_id: int,
     status_data: dict,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Atualizar status do dispositivo"""
     dispositivo = db.query(Dispositivo).filter(Dispositivo.id == dispositivo_id).first()
@@ -703,8 +990,14 @@ def update_dispositivo_status(
     if novo_status not in ["ativo", "inativo", "roubado", "recuperado", "bloqueado"]:
         raise HTTPException(status_code=400, detail="Status inválido")
     
+    status_antes = dispositivo.status
     dispositivo.status = novo_status
+    if novo_status == "roubado":
+        reter_historico(db, [dispositivo.id])
     db.commit()
+    device_cache.invalidate(imei=dispositivo.imei)
+    dashboard_stats.status_dispositivo(status_antes, novo_status)
+    posicoes.definir_status(dispositivo.id, novo_status)
     
     return {"message": f"Status do dispositivo atualizado para {novo_status}"}
 
@@ -712,7 +1005,7 @@ def update_dispositivo_status(
 async def marcar_dispositivo_roubado(
     dispositivo_id: int,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Marcar dispositivo como roubado"""
     dispositivo = db.query(Dispositivo).filter(Dispositivo.id == dispositivo_id).first()
@@ -720,17 +1013,22 @@ async def marcar_dispositivo_roubado(
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
     
+    status_antes = dispositivo.status
     dispositivo.status = "roubado"
+    reter_historico(db, [dispositivo.id])
     db.commit()
+    device_cache.invalidate(imei=dispositivo.imei)
+    dashboard_stats.status_dispositivo(status_antes, "roubado")
+    posicoes.definir_status(dispositivo.id, "roubado")
     
     # Notificar admins
-    await manager.broadcast(json.dumps({
+    await manager.publish({
         "type": "device_status_changed",
         "device_id": dispositivo_id,
         "new_status": "roubado",
         "message": f"Dispositivo {dispositivo.marca} {dispositivo.modelo} marcado como ROUBADO",
         "imei": dispositivo.imei
-    }))
+    }, **rota_assinatura(device_cache.get_by_id(db, dispositivo_id)))
     
     return {"message": "Dispositivo marcado como roubado", "device_id": dispositivo_id}
 
@@ -738,7 +1036,7 @@ async def marcar_dispositivo_roubado(
 async def marcar_dispositivo_recuperado(
     dispositivo_id: int,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Marcar dispositivo como recuperado"""
     dispositivo = db.query(Dispositivo).filter(Dispositivo.id == dispositivo_id).first()
@@ -746,82 +1044,196 @@ async def marcar_dispositivo_recuperado(
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
     
+    status_antes = dispositivo.status
     dispositivo.status = "recuperado"
     db.commit()
+    device_cache.invalidate(imei=dispositivo.imei)
+    dashboard_stats.status_dispositivo(status_antes, "recuperado")
+    posicoes.definir_status(dispositivo.id, "recuperado")
     
     # Notificar admins
-    await manager.broadcast(json.dumps({
+    await manager.publish({
         "type": "device_status_changed", 
         "device_id": dispositivo_id,
         "new_status": "recuperado",
         "message": f"✅ Dispositivo {dispositivo.marca} {dispositivo.modelo} foi RECUPERADO!",
         "imei": dispositivo.imei
-    }))
+    }, **rota_assinatura(device_cache.get_by_id(db, dispositivo_id)))
     
     return {"message": "Dispositivo marcado como recuperado", "device_id": dispositivo_id}
 
+# Colunas serializadas por /dispositivos/pings-roubados, lidas numa única consulta com JOIN
+COLUNAS_PINGS_ROUBADOS = (
+    PingDispositivo.id,
+    PingDispositivo.timestamp,
+    PingDispositivo.latitude,
+    PingDispositivo.longitude,
+    PingDispositivo.precisao_gps,
+    PingDispositivo.nivel_bateria,
+    PingDispositivo.status_dispositivo,
+    PingDispositivo.tipo_ping,
+    Dispositivo.id.label("dispositivo_id"),
+    Dispositivo.imei,
+    Dispositivo.marca,
+    Dispositivo.modelo,
+    Dispositivo.status.label("dispositivo_status"),
+    Usuario.id.label("usuario_id"),
+    Usuario.nome_completo,
+    Usuario.telefone_principal,
+)
+
+def serializar_ping_roubado(row) -> dict:
+    return {
+        "id": row.id,
+        "timestamp": row.timestamp.isoformat(),
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "precisao_gps": row.precisao_gps,
+        "nivel_bateria": row.nivel_bateria,
+        "status_dispositivo": row.status_dispositivo,
+        "tipo_ping": row.tipo_ping,
+        "dispositivo": {
+            "id": row.dispositivo_id,
+            "imei": row.imei,
+            "marca": row.marca,
+            "modelo": row.modelo,
+            "status": row.dispositivo_status
+        },
+        "usuario": {
+            "id": row.usuario_id,
+            "nome": row.nome_completo,
+            "telefone": row.telefone_principal
+        } if row.usuario_id is not None else None
+    }
+
 @app.get("/dispositivos/pings-roubados")
 def get_pings_dispositivos_roubados(
     skip: int = 0,
     limit: int = 100,
     dispositivo_id: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Buscar histórico de pings de dispositivos roubados"""
-    query = db.query(PingDispositivo).join(Dispositivo)
+    """Buscar histórico de pings de dispositivos roubados (próxima página no header X-Next-Cursor)"""
+    query = db.query(*COLUNAS_PINGS_ROUBADOS).select_from(PingDispositivo).join(
+        Dispositivo, Dispositivo.id == PingDispositivo.dispositivo_id
+    ).outerjoin(
+        Usuario, Usuario.id == Dispositivo.usuario_id
+    )
     
     # Filtrar apenas dispositivos com status roubado ou que já foram roubados
     if dispositivo_id:
         query = query.filter(PingDispositivo.dispositivo_id == dispositivo_id)
     else:
-        query = query.filter(or_(
+        # Todo ping de dispositivo roubado é retido (inclusive os que estavam na
+        # fila ao marcar o roubo: a fila confere o status ao gravar o lote), então
+        # o filtro usa o índice (retido, timestamp) e, no MySQL, lê só a partição p_retidos
+        query = query.filter(PingDispositivo.retido == True, or_(
             Dispositivo.status == "roubado",
             PingDispositivo.status_dispositivo == "roubado"
         ))
     
-    # Ordenar por timestamp mais recente primeiro
-    query = query.order_by(PingDispositivo.timestamp.desc())
+    # Mais recente primeiro, paginado por cursor (timestamp, id)
+    query = filtrar_por_tempo(query, PingDispositivo.timestamp, PingDispositivo.id, cursor)
+    if cursor:
+        skip = 0
     
-    # Paginação
-    pings = query.offset(skip).limit(limit).all()
+    # Duas consultas, qualquer que seja o tamanho da página: as chaves da
+    # fronteira (cursor seguinte) e as linhas, lidas em streaming
+    proximo = proximo_cursor_por_tempo(
+        query.with_entities(PingDispositivo.timestamp, PingDispositivo.id), limit, skip
+    )
+    linhas = query.offset(skip).limit(limit).yield_per(500)
     
-    # Formatar resposta com informações do dispositivo
-    result = []
-    for ping in pings:
-        dispositivo = ping.dispositivo
-        usuario = dispositivo.usuario if dispositivo else None
-        
-        result.append({
-            "id": ping.id,
-            "timestamp": ping.timestamp.isoformat(),
-            "latitude": ping.latitude,
-            "longitude": ping.longitude,
-            "precisao_gps": ping.precisao_gps,
-            "nivel_bateria": ping.nivel_bateria,
-            "status_dispositivo": ping.status_dispositivo,
-            "tipo_ping": ping.tipo_ping,
-            "dispositivo": {
-                "id": dispositivo.id,
-                "imei": dispositivo.imei,
-                "marca": dispositivo.marca,
-                "modelo": dispositivo.modelo,
-                "status": dispositivo.status
-            },
-            "usuario": {
-                "id": usuario.id,
-                "nome": usuario.nome_completo,
-                "telefone": usuario.telefone_principal
-            } if usuario else None
-        })
-    
-    return result
+    return StreamingResponse(
+        stream_json_array(serializar_ping_roubado(row) for row in linhas),
+        media_type="application/json",
+        headers={"X-Next-Cursor": proximo} if proximo else None
+    )
+
+def calcular_trajeto(db: Session, dispositivo_id: int, desde: datetime, ate: Optional[datetime],
+                     tolerancia_m: float, intervalo_s: int) -> dict:
+    """Ler os pings do período (os mais recentes, até TRACK_MAX_PINGS) e simplificar"""
+    query = db.query(PingDispositivo.timestamp, PingDispositivo.latitude, PingDispositivo.longitude).filter(
+        PingDispositivo.dispositivo_id == dispositivo_id,
+        PingDispositivo.timestamp >= desde
+    )
+    if ate is not None:
+        query = query.filter(PingDispositivo.timestamp <= ate)
+    linhas = query.order_by(PingDispositivo.timestamp.desc(), PingDispositivo.id.desc()).limit(settings.TRACK_MAX_PINGS + 1).all()
+    truncado = len(linhas) > settings.TRACK_MAX_PINGS
+    linhas = linhas[:settings.TRACK_MAX_PINGS][::-1]
+
+    ts = [quando.replace(tzinfo=timezone.utc).timestamp() for quando, _, _ in linhas]
+    lat = [linha[1] for linha in linhas]
+    lng = [linha[2] for linha in linhas]
+    if ate is None:
+        # Período aberto: terminar na posição em memória (a fila de ingestão ainda pode não tê-la gravado)
+        posicao = posicoes.get(dispositivo_id)
+        if posicao is not None and posicao.timestamp >= desde:
+            segundos = posicao.timestamp.replace(tzinfo=timezone.utc).timestamp()
+            if not ts or segundos > ts[-1]:
+                ts.append(segundos)
+                lat.append(posicao.latitude)
+                lng.append(posicao.longitude)
+
+    pontos_originais = len(ts)
+    ts, lat, lng = simplificar(ts, lat, lng, tolerancia_m, intervalo_s)
+    return {
+        "dispositivo_id": dispositivo_id,
+        "desde": desde.isoformat(),
+        "ate": ate.isoformat() if ate else None,
+        "tolerancia_m": tolerancia_m,
+        "intervalo_s": intervalo_s,
+        "pontos_originais": pontos_originais,
+        "pontos": len(ts),
+        "truncado": truncado,
+        "ts": [int(segundos) for segundos in ts],
+        "lat": lat,
+        "lng": lng
+    }
+
+@app.get("/dispositivos/{dispositivo_id}/trajeto")
+def trajeto_dispositivo(
+    dispositivo_id: int,
+    desde: Optional[datetime] = None,
+    ate: Optional[datetime] = None,
+    tolerancia_m: float = 10.0,
+    intervalo_s: int = 0,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Trajeto do dispositivo simplificado (Douglas–Peucker), em colunas ts/lat/lng"""
+    if not 0 <= tolerancia_m <= 5000:
+        raise HTTPException(status_code=400, detail="tolerancia_m deve estar entre 0 e 5000")
+    if intervalo_s < 0:
+        raise HTTPException(status_code=400, detail="intervalo_s não pode ser negativo")
+    # Horários em UTC sem fuso, como gravados no banco
+    desde = desde.astimezone(timezone.utc).replace(tzinfo=None) if desde and desde.tzinfo else desde
+    ate = ate.astimezone(timezone.utc).replace(tzinfo=None) if ate and ate.tzinfo else ate
+    if desde is None:
+        # Alinhado ao minuto para que pedidos seguidos usem o mesmo cache
+        desde = ((ate or datetime.utcnow()) - timedelta(hours=settings.TRACK_DEFAULT_HOURS)).replace(second=0, microsecond=0)
+    if ate is not None and ate <= desde:
+        raise HTTPException(status_code=400, detail="ate deve ser posterior a desde")
+    if device_cache.get_by_id(db, dispositivo_id) is None:
+        raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
+
+    # Período aberto muda a cada ping: o horário da última posição entra na chave
+    posicao = posicoes.get(dispositivo_id) if ate is None else None
+    chave = (dispositivo_id, desde, ate, tolerancia_m, intervalo_s, posicao.timestamp if posicao else None)
+    trajeto = trajeto_cache.get(chave)
+    if trajeto is None:
+        trajeto = calcular_trajeto(db, dispositivo_id, desde, ate, tolerancia_m, intervalo_s)
+        trajeto_cache.set(chave, trajeto)
+    return trajeto
 
 # ROTAS DE EMERGÊNCIAS
 @app.post("/emergencias/sos")
 async def create_emergencia(
     emergencia_data: dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Acionar emergência (SOS) - usado pelo app móvel"""
     # Validar dados obrigatórios
@@ -831,16 +1243,14 @@ async def create_emergencia(
             raise HTTPException(status_code=400, detail=f"Campo {field} é obrigatório")
     
     # Verificar se dispositivo existe
-    dispositivo = db.query(Dispositivo).filter(
-        Dispositivo.id == emergencia_data["dispositivo_id"]
-    ).first()
+    dispositivo = await device_cache.get_by_id_async(db, emergencia_data["dispositivo_id"])
     
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo não encontrado")
     
     # Criar emergência
     emergencia = Emergencia(
-        usuario_id=dispositivo.usuario_id,
+        usuario_id=dispositivo["usuario_id"],
         dispositivo_id=emergencia_data["dispositivo_id"],
         latitude=emergencia_data["latitude"],
         longitude=emergencia_data["longitude"],
@@ -849,29 +1259,38 @@ async def create_emergencia(
     )
     
     db.add(emergencia)
-    db.commit()
-    db.refresh(emergencia)
     
-    # Atualizar localização do dispositivo
-    dispositivo.ultima_localizacao_lat = emergencia_data["latitude"]
-    dispositivo.ultima_localizacao_lng = emergencia_data["longitude"]
-    dispositivo.ultimo_ping = datetime.utcnow()
-    db.commit()
+    # Atualizar localização do dispositivo (SOS grava na hora, sem esperar o checkpoint)
+    acionada_em = datetime.utcnow()
+    await db.execute(
+        update(Dispositivo)
+        .where(Dispositivo.id == dispositivo["id"])
+        .values(
+            ultima_localizacao_lat=emergencia_data["latitude"],
+            ultima_localizacao_lng=emergencia_data["longitude"],
+            ultimo_ping=acionada_em
+        )
+    )
+    await db.commit()
+    await db.refresh(emergencia)
+    dashboard_stats.ajustar(total_emergencias=1, emergencias_ativas=1)
+    posicoes.atualizar(dispositivo["id"], emergencia.latitude, emergencia.longitude, acionada_em)
+    presenca.visto(dispositivo["id"], acionada_em)
+    proximidade.dispositivos.atualizar(dispositivo["id"], emergencia.latitude, emergencia.longitude)
+    proximidade.emergencias.atualizar(emergencia.id, emergencia.latitude, emergencia.longitude)
     
     # Enviar notificação via WebSocket para todos os admins conectados
-    usuario = db.query(Usuario).filter(Usuario.id == dispositivo.usuario_id).first()
-    
     notification = {
         "type": "emergency_created",
         "emergency_id": emergencia.id,
-        "device_id": dispositivo.id,
-        "device_marca": dispositivo.marca,
-        "device_modelo": dispositivo.modelo,
-        "device_imei": dispositivo.imei,
-        "user_id": usuario.id,
-        "user_name": usuario.nome_completo,
-        "user_phone": usuario.telefone_principal,
-        "user_address": f"{usuario.rua}, {usuario.bairro}, {usuario.cidade}",
+        "device_id": dispositivo["id"],
+        "device_marca": dispositivo["marca"],
+        "device_modelo": dispositivo["modelo"],
+        "device_imei": dispositivo["imei"],
+        "user_id": dispositivo["usuario_id"],
+        "user_name": dispositivo["usuario_nome"],
+        "user_phone": dispositivo["usuario_telefone"],
+        "user_address": dispositivo["usuario_endereco"],
         "latitude": emergencia.latitude,
         "longitude": emergencia.longitude,
         "timestamp": emergencia.timestamp_acionamento.isoformat(),
@@ -879,7 +1298,7 @@ async def create_emergencia(
         "gps_accuracy": emergencia.precisao_gps
     }
     
-    await manager.broadcast(json.dumps(notification))
+    await manager.publish(notification, **rota_assinatura(dispositivo))
     
     return {
         "status": "success",
@@ -889,25 +1308,31 @@ async def create_emergencia(
 
 @app.get("/emergencias/", response_model=List[schemas.EmergenciaResponse])
 def read_emergencias(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status_filter: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Listar emergências com filtro de status"""
+    """Listar emergências com filtro de status (próxima página no header X-Next-Cursor)"""
     query = db.query(Emergencia)
     
     if status_filter:
         query = query.filter(Emergencia.status == status_filter)
     
-    emergencias = query.order_by(Emergencia.timestamp_acionamento.desc()).offset(skip).limit(limit).all()
+    emergencias, proximo = paginar_por_tempo(
+        query, Emergencia.timestamp_acionamento, Emergencia.id, cursor, limit, skip
+    )
+    if proximo:
+        response.headers["X-Next-Cursor"] = proximo
     return emergencias
 
 @app.get("/emergencias/ativas", response_model=List[schemas.EmergenciaResponse])
 def read_emergencias_ativas(
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Listar apenas emergências ativas"""
     emergencias = db.query(Emergencia).filter(
@@ -919,15 +1344,16 @@ def read_emergencias_ativas(
 async def responder_emergencia(
     emergencia_id: int,
     resposta_data: dict,
-    db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Responder a uma emergência"""
-    emergencia = db.query(Emergencia).filter(Emergencia.id == emergencia_id).first()
+    emergencia = await db.get(Emergencia, emergencia_id)
     if not emergencia:
         raise HTTPException(status_code=404, detail="Emergência não encontrada")
     
     # Atualizar emergência
+    status_antes = emergencia.status
     emergencia.status = "respondido"
     emergencia.admin_responsavel_id = current_admin.id
     emergencia.timestamp_resposta = datetime.utcnow()
@@ -939,7 +1365,9 @@ async def responder_emergencia(
     if "observacoes" in resposta_data:
         emergencia.observacoes_admin = resposta_data["observacoes"]
     
-    db.commit()
+    await db.commit()
+    dashboard_stats.status_emergencia(status_antes, "respondido")
+    proximidade.emergencias.remover(emergencia.id)
     
     # Notificar via WebSocket
     notification = {
@@ -947,10 +1375,12 @@ async def responder_emergencia(
         "emergency_id": emergencia.id,
         "admin_name": current_admin.nome_completo,
         "response_time": emergencia.tempo_resposta,
+        "latitude": emergencia.latitude,
+        "longitude": emergencia.longitude,
         "timestamp": emergencia.timestamp_resposta.isoformat()
     }
     
-    await manager.broadcast(json.dumps(notification))
+    await manager.publish(notification, **rota_assinatura(await device_cache.get_by_id_async(db, emergencia.dispositivo_id)))
     
     return {"message": "Emergência respondida com sucesso"}
 
@@ -959,13 +1389,14 @@ def finalizar_emergencia(
     emergencia_id: int,
     finalizacao_data: dict,
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
     """Finalizar uma emergência"""
     emergencia = db.query(Emergencia).filter(Emergencia.id == emergencia_id).first()
     if not emergencia:
         raise HTTPException(status_code=404, detail="Emergência não encontrada")
     
+    status_antes = emergencia.status
     emergencia.status = "finalizado"
     emergencia.timestamp_finalizacao = datetime.utcnow()
     
@@ -973,31 +1404,438 @@ def finalizar_emergencia(
         emergencia.observacoes_admin = finalizacao_data["observacoes"]
     
     db.commit()
+    dashboard_stats.status_emergencia(status_antes, "finalizado")
+    proximidade.emergencias.remover(emergencia.id)
     
     return {"message": "Emergência finalizada com sucesso"}
 
+# ROTAS DE PROXIMIDADE (índice espacial em memória)
+def buscar_proximos(
+    db: Session,
+    grade: GridIndex,
+    lat: Optional[float],
+    lng: Optional[float],
+    raio_km: float,
+    area: tuple,
+    limit: int
+) -> list:
+    """Busca por raio (lat, lng, raio_km) ou por retângulo (min_lat, min_lng, max_lat, max_lng)"""
+    if not 0 < raio_km <= settings.GEO_MAX_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"raio_km deve estar entre 0 e {settings.GEO_MAX_RADIUS_KM}")
+    limit = max(1, min(limit, settings.GEO_MAX_RESULTS))
+    proximidade.garantir_carregado(db)
+
+    if lat is not None or lng is not None:
+        centro = coordenadas(lat, lng)
+        if centro is None:
+            raise HTTPException(status_code=400, detail="Informe latitude e longitude válidas (lat, lng)")
+        return proximidade.buscar(grade, centro=centro, raio_km=raio_km, limit=limit)
+
+    if any(v is None for v in area):
+        raise HTTPException(status_code=400, detail="Informe lat e lng (raio) ou min_lat, min_lng, max_lat e max_lng (área)")
+    min_lat, min_lng, max_lat, max_lng = area
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise HTTPException(status_code=400, detail="Área inválida")
+    return proximidade.buscar(grade, area=area, limit=limit)
+
+def _distancia(distancia: Optional[float]) -> Optional[float]:
+    return None if distancia is None else round(distancia, 3)
+
+def visto_por_ultimo(dispositivo_id: int, ultimo_ping: Optional[datetime]) -> Optional[datetime]:
+    """Horário do último ping: o da memória, se for mais recente que o do banco"""
+    posicao = posicoes.get(dispositivo_id)
+    if posicao is not None and (ultimo_ping is None or posicao.timestamp > ultimo_ping):
+        return posicao.timestamp
+    return ultimo_ping
+
+def detalhar_dispositivos(db: Session, achados: list) -> List[dict]:
+    """Dados dos dispositivos encontrados (uma consulta), na ordem da busca"""
+    if not achados:
+        return []
+    linhas = {
+        linha.id: linha
+        for linha in db.query(
+            Dispositivo.id, Dispositivo.imei, Dispositivo.marca, Dispositivo.modelo,
+            Dispositivo.status, Dispositivo.usuario_id, Dispositivo.ultimo_ping
+        ).filter(Dispositivo.id.in_([achado[0] for achado in achados]))
+    }
+    return [
+        {
+            "id": chave,
+            "imei": linhas[chave].imei,
+            "marca": linhas[chave].marca,
+            "modelo": linhas[chave].modelo,
+            "status": linhas[chave].status,
+            "usuario_id": linhas[chave].usuario_id,
+            "ultimo_ping": visto_por_ultimo(chave, linhas[chave].ultimo_ping),
+            "latitude": lat,
+            "longitude": lng,
+            "distancia_km": _distancia(distancia)
+        }
+        for chave, lat, lng, distancia in achados if chave in linhas
+    ]
+
+def detalhar_residencias(db: Session, achados: list) -> List[dict]:
+    """Dados dos usuários cujas residências foram encontradas, na ordem da busca"""
+    if not achados:
+        return []
+    linhas = {
+        linha.id: linha
+        for linha in db.query(
+            Usuario.id, Usuario.nome_completo, Usuario.telefone_principal, Usuario.bairro, Usuario.cidade
+        ).filter(Usuario.id.in_([achado[0] for achado in achados]))
+    }
+    return [
+        {
+            "usuario_id": chave,
+            "nome_completo": linhas[chave].nome_completo,
+            "telefone_principal": linhas[chave].telefone_principal,
+            "bairro": linhas[chave].bairro,
+            "cidade": linhas[chave].cidade,
+            "latitude": lat,
+            "longitude": lng,
+            "distancia_km": _distancia(distancia)
+        }
+        for chave, lat, lng, distancia in achados if chave in linhas
+    ]
+
+@app.get("/proximidade/dispositivos")
+def dispositivos_proximos(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    raio_km: float = 1.0,
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Dispositivos pela última localização: a até raio_km de (lat, lng), do mais próximo
+    para o mais distante, ou dentro da área min_lat/min_lng/max_lat/max_lng"""
+    achados = buscar_proximos(db, proximidade.dispositivos, lat, lng, raio_km, (min_lat, min_lng, max_lat, max_lng), limit)
+    return detalhar_dispositivos(db, achados)
+
+@app.get("/proximidade/residencias")
+def residencias_proximas(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    raio_km: float = 1.0,
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Residências de usuários por raio ou por área (mesmos parâmetros de /proximidade/dispositivos)"""
+    achados = buscar_proximos(db, proximidade.residencias, lat, lng, raio_km, (min_lat, min_lng, max_lat, max_lng), limit)
+    return detalhar_residencias(db, achados)
+
+@app.get("/proximidade/emergencias")
+def emergencias_proximas(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    raio_km: float = 1.0,
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Emergências ativas por raio ou por área"""
+    achados = buscar_proximos(db, proximidade.emergencias, lat, lng, raio_km, (min_lat, min_lng, max_lat, max_lng), limit)
+    if not achados:
+        return []
+    emergencias = {
+        e.id: e for e in db.query(Emergencia).filter(Emergencia.id.in_([achado[0] for achado in achados]))
+    }
+    return [
+        {
+            "id": chave,
+            "status": emergencias[chave].status,
+            "usuario_id": emergencias[chave].usuario_id,
+            "dispositivo_id": emergencias[chave].dispositivo_id,
+            "timestamp_acionamento": emergencias[chave].timestamp_acionamento,
+            "latitude": lat,
+            "longitude": lng,
+            "distancia_km": _distancia(distancia)
+        }
+        for chave, lat, lng, distancia in achados if chave in emergencias
+    ]
+
+@app.get("/emergencias/{emergencia_id}/proximidade")
+def proximidade_emergencia(
+    emergencia_id: int,
+    raio_km: float = 1.0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Dispositivos e residências a até raio_km de uma emergência"""
+    emergencia = db.query(Emergencia).filter(Emergencia.id == emergencia_id).first()
+    if not emergencia:
+        raise HTTPException(status_code=404, detail="Emergência não encontrada")
+    
+    sem_area = (None, None, None, None)
+    dispositivos = buscar_proximos(db, proximidade.dispositivos, emergencia.latitude, emergencia.longitude, raio_km, sem_area, limit)
+    residencias = buscar_proximos(db, proximidade.residencias, emergencia.latitude, emergencia.longitude, raio_km, sem_area, limit)
+    return {
+        "emergencia_id": emergencia.id,
+        "latitude": emergencia.latitude,
+        "longitude": emergencia.longitude,
+        "raio_km": raio_km,
+        "dispositivos": detalhar_dispositivos(db, dispositivos),
+        "residencias": detalhar_residencias(db, residencias)
+    }
+
+# ROTAS DO MAPA AO VIVO
+@app.get("/mapa/snapshot")
+def mapa_snapshot(
+    formato: str = "json",
+    db: Session = Depends(get_db),
+    current_admin: AdminPrincipal = Depends(get_current_admin)
+):
+    """Posição e status de todos os dispositivos em colunas, com a versão (para o map_sync do /ws)"""
+    if formato not in ("json", "binario"):
+        raise HTTPException(status_code=400, detail="formato deve ser json ou binario")
+    posicoes.garantir_carregado(db)
+    if formato == "binario":
+        return Response(content=posicoes.snapshot_binario(), media_type="application/octet-stream")
+    return Response(content=dumps(posicoes.snapshot()), media_type="application/json")
+
 # ROTAS DE ESTATÍSTICAS
 @app.get("/dashboard/stats", response_model=schemas.EstatisticasResponse)
 def get_dashboard_stats(
     db: Session = Depends(get_db),
-    current_admin: Admin = Depends(get_current_admin)
+    current_admin: AdminPrincipal = Depends(get_current_admin)
 ):
-    """Obter estatísticas para o dashboard"""
-    stats = {
-        "total_usuarios": db.query(Usuario).count(),
-        "total_dispositivos": db.query(Dispositivo).count(),
-        "total_emergencias": db.query(Emergencia).count(),
-        "emergencias_ativas": db.query(Emergencia).filter(Emergencia.status == "ativo").count(),
-        "dispositivos_roubados": db.query(Dispositivo).filter(Dispositivo.status == "roubado").count(),
-        "usuarios_ativos": db.query(Usuario).filter(Usuario.ativo == True).count()
+    """Obter estatísticas para o dashboard (snapshot em memória)"""
+    return dashboard_stats.get(db)
+
+@app.get("/sistema/metricas")
+def get_metricas_sistema(current_admin: AdminPrincipal = Depends(get_current_admin)):
+    """Métricas internas dos componentes em memória"""
+    return {
+        "ingest": ping_ingest.stats(),
+        "device_cache": device_cache.stats(),
+        "auth_cache": principal_cache.stats(),
+        "passwords": password_hasher.stats(),
+        "login_throttle": login_throttle.stats(),
+        "uploads": photo_store.stats(),
+        "upload_variants": variant_worker.stats(),
+        "websocket": manager.stats(),
+        "ping_coalescer": ping_coalescer.stats(),
+        "ping_retention": ping_retention.stats(),
+        "dashboard": dashboard_stats.stats(),
+        "proximidade": proximidade.stats(),
+        "posicoes": posicoes.stats(),
+        "mapa": map_sync.stats(),
+        "offline": presenca.stats(),
+        "trajetos": trajeto_cache.stats()
     }
-    return stats
 
 # WEBSOCKET PARA COMUNICAÇÃO EM TEMPO REAL
+async def processar_mensagem_dispositivo(
+    websocket: WebSocket,
+    payload: dict,
+    recebido_em: datetime,
+    uow: ConnectionUnitOfWork
+) -> None:
+    """Ping ou SOS recebido pelo WebSocket (executado fora do loop de recepção)"""
+    try:
+        if payload.get("type") == "device_sos":
+            await processar_sos_ws(websocket, payload, uow)
+        else:
+            await processar_ping_ws(websocket, payload, recebido_em, uow)
+    except Exception as e:
+        print(f"❌ Erro ao processar mensagem do WebSocket: {e}")
+
+async def processar_ping_ws(websocket: WebSocket, payload: dict, recebido_em: datetime, uow: ConnectionUnitOfWork) -> None:
+    """Ping via WebSocket: mesma gravação em lote do endpoint HTTP"""
+    # Esperado: { type, imei, latitude, longitude, bateria?, precisao?, status? }
+    msg_type = payload.get("type")
+    imei = payload.get("imei")
+    lat = payload.get("latitude")
+    lng = payload.get("longitude")
+    bateria = payload.get("bateria", 0)
+    precisao = payload.get("precisao", 0)
+    device_status = payload.get("status")
+
+    ponto = coordenadas(lat, lng)
+    if ponto is None:
+        await manager.send_personal_message(json.dumps({
+            "type": "error",
+            "message": "Informe latitude e longitude válidas",
+            "imei": imei
+        }), websocket)
+        return
+    lat, lng = ponto
+
+    dispositivo = device_cache.get_cached(imei)
+    if dispositivo is None:
+        # Só usa a sessão da conexão quando o dispositivo não está no cache
+        async with uow.unidade() as db:
+            dispositivo = await device_cache.load_by_imei_async(db, imei)
+    if not dispositivo:
+        # Dispositivo desconhecido; apenas ecoar erro ao remetente
+        await manager.send_personal_message(json.dumps({
+            "type": "error",
+            "message": "Dispositivo não registrado no sistema",
+            "imei": imei
+        }), websocket)
+        return
+
+    # Atualizar status baseado no tipo de ping
+    device_status_atual = dispositivo["status"]
+    if msg_type == "stolen_device_ping" or device_status == "roubado":
+        device_status_atual = "roubado"
+    elif dispositivo["status"] == "inativo":
+        device_status_atual = "ativo"
+
+    # Ping gravado pela fila de ingestão e última localização no PositionStore;
+    # o horário é o da recepção, para manter a ordem mesmo que as tarefas
+    # terminem fora dela
+    try:
+        ping_ingest.enqueue({
+            "dispositivo_id": dispositivo["id"],
+            "latitude": lat,
+            "longitude": lng,
+            "precisao_gps": precisao,
+            "nivel_bateria": bateria,
+            "status_dispositivo": device_status_atual,
+            "tipo_ping": msg_type,
+            "retido": ping_retido(device_status_atual),
+            "timestamp": recebido_em
+        }, device_status_atual if device_status_atual != dispositivo["status"] else None, dispositivo["status"])
+    except IngestQueueFull:
+        await manager.send_personal_message(json.dumps({
+            "type": "error",
+            "message": "Sistema sobrecarregado, tente novamente",
+            "imei": imei
+        }), websocket)
+        return
+
+    if posicoes.atualizar(dispositivo["id"], lat, lng, recebido_em, device_status_atual):
+        proximidade.dispositivos.atualizar(dispositivo["id"], lat, lng)
+        presenca.visto(dispositivo["id"], recebido_em)
+
+    if device_status_atual != dispositivo["status"]:
+        device_cache.set_status(imei, device_status_atual)
+        dashboard_stats.status_dispositivo(dispositivo["status"], device_status_atual)
+
+    # Broadcast para todos admins conectados
+    notification = {
+        "type": "device_ping",
+        "device_id": dispositivo["id"],
+        "imei": dispositivo["imei"],
+        "device_marca": dispositivo["marca"],
+        "device_modelo": dispositivo["modelo"],
+        "device_status": device_status_atual,
+        "usuario_id": dispositivo["usuario_id"],
+        "usuario_nome": dispositivo["usuario_nome"],
+        "latitude": lat,
+        "longitude": lng,
+        "bateria": bateria,
+        "precisao_gps": precisao,
+        "timestamp": recebido_em.isoformat()
+    }
+
+    await ping_coalescer.offer(dispositivo["id"], notification, **rota_assinatura(dispositivo))
+
+    # Se é dispositivo roubado, enviar alerta especial
+    if device_status_atual == "roubado":
+        await manager.publish({
+            "type": "stolen_device_located",
+            "message": f"🚨 DISPOSITIVO ROUBADO LOCALIZADO!",
+            "device_id": dispositivo["id"],
+            "imei": imei,
+            "device_info": f"{dispositivo['marca']} {dispositivo['modelo']}",
+            "user_name": dispositivo["usuario_nome"],
+            "latitude": lat,
+            "longitude": lng,
+            "bateria": bateria,
+            "timestamp": recebido_em.isoformat()
+        }, **rota_assinatura(dispositivo))
+
+async def processar_sos_ws(websocket: WebSocket, payload: dict, uow: ConnectionUnitOfWork) -> None:
+    """SOS via WebSocket: criar emergência a partir do IMEI e coordenadas"""
+    imei = payload.get("imei")
+    lat = payload.get("latitude")
+    lng = payload.get("longitude")
+    nivel_bateria = payload.get("bateria")
+    precisao_gps = payload.get("precisao")
+
+    async with uow.unidade() as db:
+        dispositivo = await device_cache.get_by_imei_async(db, imei)
+        if not dispositivo:
+            await manager.send_personal_message(json.dumps({
+                "type": "error",
+                "message": "Dispositivo não registrado",
+                "imei": imei
+            }), websocket)
+            return
+
+        emergencia = Emergencia(
+            usuario_id=dispositivo["usuario_id"],
+            dispositivo_id=dispositivo["id"],
+            latitude=lat,
+            longitude=lng,
+            status="ativo",
+            nivel_bateria=nivel_bateria,
+            precisao_gps=precisao_gps
+        )
+        db.add(emergencia)
+        # Atualizar "ultimo ping" e localização do device
+        acionada_em = datetime.utcnow()
+        await db.execute(
+            update(Dispositivo)
+            .where(Dispositivo.id == dispositivo["id"])
+            .values(
+                ultima_localizacao_lat=lat,
+                ultima_localizacao_lng=lng,
+                ultimo_ping=acionada_em
+            )
+        )
+        await db.commit()
+        await db.refresh(emergencia)
+    dashboard_stats.ajustar(total_emergencias=1, emergencias_ativas=1)
+    posicoes.atualizar(dispositivo["id"], lat, lng, acionada_em)
+    presenca.visto(dispositivo["id"], acionada_em)
+    proximidade.dispositivos.atualizar(dispositivo["id"], lat, lng)
+    proximidade.emergencias.atualizar(emergencia.id, lat, lng)
+
+    await manager.publish({
+        "type": "emergency_created",
+        "emergency_id": emergencia.id,
+        "device_id": dispositivo["id"],
+        "device_marca": dispositivo["marca"],
+        "device_modelo": dispositivo["modelo"],
+        "device_imei": dispositivo["imei"],
+        "user_id": dispositivo["usuario_id"],
+        "user_name": dispositivo["usuario_nome"],
+        "user_phone": dispositivo["usuario_telefone"],
+        "user_address": dispositivo["usuario_endereco"],
+        "latitude": lat,
+        "longitude": lng,
+        "timestamp": emergencia.timestamp_acionamento.isoformat(),
+        "battery_level": nivel_bateria,
+        "gps_accuracy": precisao_gps
+    }, **rota_assinatura(dispositivo))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket para comunicação em tempo real com admins"""
-    await manager.connect(websocket)
+    # ?encoding=binary: receber os eventos em frames binários (bytes UTF-8 do JSON)
+    await manager.connect(websocket, binary=websocket.query_params.get("encoding") == "binary")
+    limite = asyncio.Semaphore(settings.WS_MAX_INFLIGHT_PER_CONNECTION)
+    tarefas = set()
+    # Uma sessão de banco reutilizada pelas mensagens desta conexão
+    uow = ConnectionUnitOfWork(AsyncSessionLocal, recycle_after=settings.WS_SESSION_RECYCLE_MESSAGES)
     try:
         while True:
             data = await websocket.receive_text()
@@ -1005,164 +1843,57 @@ async def websocket_endpoint(websocket: WebSocket):
             try:
                 payload = json.loads(data)
             except Exception:
+                payload = None
+            if not isinstance(payload, dict):
                 # Echo para compatibilidade antiga
                 await manager.send_personal_message(f"Echo: {data}", websocket)
                 continue
 
             msg_type = payload.get("type")
-            if msg_type == "device_ping" or msg_type == "stolen_device_ping":
-                # Esperado: { type, imei, latitude, longitude, bateria?, precisao?, status? }
-                imei = payload.get("imei")
-                lat = payload.get("latitude")
-                lng = payload.get("longitude")
-                bateria = payload.get("bateria", 0)
-                precisao = payload.get("precisao", 0)
-                device_status = payload.get("status")
-                
-                # Atualizar no banco e retransmitir
-                db_gen = get_db()
-                db = next(db_gen)
+            if msg_type == "subscribe":
+                # Esperado: { type, eventos?, provincias?, postos?, areas? }
                 try:
-                    dispositivo = db.query(Dispositivo).filter(Dispositivo.imei == imei).first()
-                    if dispositivo:
-                        # Atualizar localização e último ping
-                        dispositivo.ultima_localizacao_lat = lat
-                        dispositivo.ultima_localizacao_lng = lng
-                        dispositivo.ultimo_ping = datetime.utcnow()
-                        
-                        # Atualizar status baseado no tipo de ping
-                        if msg_type == "stolen_device_ping" or device_status == "roubado":
-                            dispositivo.status = "roubado"
-                        elif dispositivo.status == "inativo":
-                            dispositivo.status = "ativo"
-                        
-                        # Registrar ping no histórico
-                        ping_record = PingDispositivo(
-                            dispositivo_id=dispositivo.id,
-                            latitude=lat,
-                            longitude=lng,
-                            precisao_gps=precisao,
-                            nivel_bateria=bateria,
-                            status_dispositivo=dispositivo.status,
-                            tipo_ping=msg_type,
-                            timestamp=datetime.utcnow()
-                        )
-                        db.add(ping_record)
-                        db.commit()
-
-                        usuario = db.query(Usuario).filter(Usuario.id == dispositivo.usuario_id).first()
-                        
-                        # Broadcast para todos admins conectados
-                        notification = {
-                            "type": "device_ping",
-                            "device_id": dispositivo.id,
-                            "imei": dispositivo.imei,
-                            "device_marca": dispositivo.marca,
-                            "device_modelo": dispositivo.modelo,
-                            "device_status": dispositivo.status,
-                            "usuario_id": dispositivo.usuario_id,
-                            "usuario_nome": usuario.nome_completo if usuario else "N/A",
-                            "latitude": lat,
-                            "longitude": lng,
-                            "bateria": bateria,
-                            "precisao_gps": precisao,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                        
-                        await manager.broadcast(json.dumps(notification))
-                        
-                        # Se é dispositivo roubado, enviar alerta especial
-                        if dispositivo.status == "roubado":
-                            await manager.broadcast(json.dumps({
-                                "type": "stolen_device_located",
-                                "message": f"🚨 DISPOSITIVO ROUBADO LOCALIZADO!",
-                                "device_id": dispositivo.id,
-                                "imei": imei,
-                                "device_info": f"{dispositivo.marca} {dispositivo.modelo}",
-                                "user_name": usuario.nome_completo if usuario else "N/A",
-                                "latitude": lat,
-                                "longitude": lng,
-                                "bateria": bateria,
-                                "timestamp": datetime.utcnow().isoformat()
-                            }))
-                    else:
-                        # Dispositivo desconhecido; apenas ecoar erro ao remetente
-                        await manager.send_personal_message(json.dumps({
-                            "type": "error",
-                            "message": "Dispositivo não registrado no sistema",
-                            "imei": imei
-                        }), websocket)
-                finally:
-                    try:
-                        next(db_gen)
-                    except StopIteration:
-                        pass
-            elif msg_type == "device_sos":
-                # Criar emergência no banco a partir do IMEI recebido e coordenadas
-                imei = payload.get("imei")
-                lat = payload.get("latitude")
-                lng = payload.get("longitude")
-                nivel_bateria = payload.get("bateria")
-                precisao_gps = payload.get("precisao")
-
-                db_gen = get_db()
-                db = next(db_gen)
+                    filtro = manager.subscribe(websocket, payload)
+                except ValueError as e:
+                    await manager.send_personal_message(json.dumps({"type": "error", "message": str(e)}), websocket)
+                else:
+                    await manager.send_personal_message(json.dumps({
+                        "type": "subscribed",
+                        "filtro": {dim: sorted(valores) for dim, valores in filtro.items()}
+                    }), websocket)
+            elif msg_type == "unsubscribe":
+                manager.unsubscribe(websocket)
+                await manager.send_personal_message(json.dumps({"type": "subscribed", "filtro": {}}), websocket)
+            elif msg_type == "map_sync":
+                # Esperado: { type, versao?, instancia? } do último snapshot/delta recebido
                 try:
-                    dispositivo = db.query(Dispositivo).filter(Dispositivo.imei == imei).first()
-                    if not dispositivo:
-                        await manager.send_personal_message(json.dumps({
-                            "type": "error",
-                            "message": "Dispositivo não registrado",
-                            "imei": imei
-                        }), websocket)
-                    else:
-                        emergencia = Emergencia(
-                            usuario_id=dispositivo.usuario_id,
-                            dispositivo_id=dispositivo.id,
-                            latitude=lat,
-                            longitude=lng,
-                            status="ativo",
-                            nivel_bateria=nivel_bateria,
-                            precisao_gps=precisao_gps
-                        )
-                        db.add(emergencia)
-                        # Atualizar "ultimo ping" e localização do device
-                        dispositivo.ultima_localizacao_lat = lat
-                        dispositivo.ultima_localizacao_lng = lng
-                        dispositivo.ultimo_ping = datetime.utcnow()
-                        db.commit()
-                        db.refresh(emergencia)
-
-                        # Buscar dados do usuário
-                        usuario = db.query(Usuario).filter(Usuario.id == dispositivo.usuario_id).first()
-                        
-                        await manager.broadcast(json.dumps({
-                            "type": "emergency_created",
-                            "emergency_id": emergencia.id,
-                            "device_id": dispositivo.id,
-                            "device_marca": dispositivo.marca,
-                            "device_modelo": dispositivo.modelo,
-                            "device_imei": dispositivo.imei,
-                            "user_id": dispositivo.usuario_id,
-                            "user_name": usuario.nome_completo if usuario else "N/A",
-                            "user_phone": usuario.telefone_principal if usuario else "N/A",
-                            "user_address": f"{usuario.rua}, {usuario.bairro}, {usuario.cidade}" if usuario else "N/A",
-                            "latitude": lat,
-                            "longitude": lng,
-                            "timestamp": emergencia.timestamp_acionamento.isoformat(),
-                            "battery_level": nivel_bateria,
-                            "gps_accuracy": precisao_gps
-                        }))
-                finally:
-                    try:
-                        next(db_gen)
-                    except StopIteration:
-                        pass
+                    versao = int(payload.get("versao") or 0)
+                except (TypeError, ValueError):
+                    await manager.send_personal_message(json.dumps({"type": "error", "message": "versao inválida"}), websocket)
+                else:
+                    map_sync.sincronizar(websocket, versao, payload.get("instancia"))
+            elif msg_type in ("device_ping", "stolen_device_ping", "device_sos"):
+                # Persistência fora do loop de recepção, limitada por conexão:
+                # com o limite atingido o loop deixa de ler e o próprio socket
+                # aplica contrapressão ao dispositivo que está inundando
+                await limite.acquire()
+                tarefa = asyncio.create_task(processar_mensagem_dispositivo(websocket, payload, datetime.utcnow(), uow))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+                tarefa.add_done_callback(lambda _: limite.release())
             else:
                 # Mensagem não reconhecida, ecoar
                 await manager.send_personal_message(json.dumps({"type": "echo", "data": payload}), websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Qualquer saída do loop (inclusive por erro) libera a conexão e as assinaturas
         manager.disconnect(websocket)
+        map_sync.remover(websocket)
+        # Mensagens já aceitas continuam sendo gravadas após a desconexão
+        if tarefas:
+            await asyncio.gather(*tarefas, return_exceptions=True)
+        await uow.close()
         
 @app.get("/")
 def root():
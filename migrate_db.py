@@ -3,9 +3,11 @@
 Script para migração do banco de dados
 """
 
-from database import engine, get_db
+from config import settings
+from database import engine, get_db, SessionLocal
 from models import Base, PingDispositivo, Dispositivo, Usuario, Admin, Emergencia, LogSistema
-from sqlalchemy import text
+from sqlalchemy import inspect, text
+from retention import PingRetention, adicionar_coluna_retido, particionar_mysql, particoes_mysql
 import sys
 
 def create_new_tables():
@@ -14,6 +16,9 @@ def create_new_tables():
         print("🔄 Criando novas tabelas...")
         Base.metadata.create_all(bind=engine)
         print("✅ Novas tabelas criadas com sucesso!")
+        with engine.begin() as conn:
+            if adicionar_coluna_retido(conn):
+                print("✅ Coluna 'retido' adicionada e preenchida")
         
         # Verificar se a tabela pings_dispositivos foi criada
         db = next(get_db())
@@ -46,6 +51,63 @@ def recreate_all_tables():
         print(f"❌ Erro ao recriar banco: {e}")
         sys.exit(1)
 
+def create_indexes(bind=engine):
+    """Criar os índices declarados nos modelos que ainda não existem (SQLite e MySQL)"""
+    try:
+        print("🔄 Criando índices...")
+        inspector = inspect(bind)
+        criados = 0
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existentes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                if index.name in existentes:
+                    print(f"  = {index.name} (já existe)")
+                    continue
+                index.create(bind=bind)
+                criados += 1
+                print(f"  + {index.name}")
+        print(f"✅ {criados} índice(s) criado(s)!")
+        return criados
+        
+    except Exception as e:
+        print(f"❌ Erro ao criar índices: {e}")
+        sys.exit(1)
+
+def partition_pings():
+    """Adicionar a coluna retido (qualquer banco) e particionar pings_dispositivos por mês (MySQL)"""
+    try:
+        with engine.begin() as conn:
+            if adicionar_coluna_retido(conn):
+                print("✅ Coluna 'retido' adicionada e preenchida")
+        create_indexes()
+        
+        if engine.dialect.name != "mysql":
+            print("ℹ️  SQLite: sem partições, a retenção usa o índice (retido, timestamp)")
+            return
+        print("🔄 Particionando pings_dispositivos (pode demorar em tabelas grandes)...")
+        with engine.begin() as conn:
+            if particionar_mysql(conn, settings.PING_PARTITION_MONTHS_AHEAD):
+                print(f"✅ Partições: {', '.join(particoes_mysql(conn))}")
+            else:
+                print("= Tabela já particionada")
+        
+    except Exception as e:
+        print(f"❌ Erro ao particionar pings: {e}")
+        sys.exit(1)
+
+def run_retention():
+    """Executar um ciclo de downsampling/expiração dos pings"""
+    retention = PingRetention(
+        SessionLocal,
+        retention_days=settings.PING_RETENTION_DAYS,
+        downsample_after_days=settings.PING_DOWNSAMPLE_AFTER_DAYS,
+        downsample_minutes=settings.PING_DOWNSAMPLE_MINUTES,
+        months_ahead=settings.PING_PARTITION_MONTHS_AHEAD
+    )
+    print(f"✅ Retenção executada: {retention.run_once()}")
+
 def show_tables():
     """Mostrar todas as tabelas do banco"""
     try:
@@ -72,12 +134,21 @@ if __name__ == "__main__":
             recreate_all_tables()
         elif command == "show":
             show_tables()
+        elif command == "indexes":
+            create_indexes()
+        elif command == "partition":
+            partition_pings()
+        elif command == "retention":
+            run_retention()
         else:
             print("❌ Comando inválido!")
-            print("Uso: python migrate_db.py [create|recreate|show]")
+            print("Uso: python migrate_db.py [create|recreate|show|indexes|partition|retention]")
     else:
         print("Comandos disponíveis:")
         print("  create   - Criar novas tabelas (seguro)")
         print("  recreate - Recriar TODAS as tabelas (apaga dados!)")
         print("  show     - Mostrar tabelas existentes")
+        print("  indexes  - Criar índices das consultas frequentes (seguro)")
+        print("  partition - Coluna retido (qualquer banco) + partições mensais de pings (MySQL)")
+        print("  retention - Executar downsampling/expiração dos pings")
         print("\nExemplo: python migrate_db.py create")
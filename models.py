@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -70,7 +70,7 @@ class Usuario(Base):
     # Informações adicionais
     foto_residencia = Column(String(500))  # URL/caminho da foto
     observacoes = Column(Text)
-    ativo = Column(Boolean, default=True)
+    ativo = Column(Boolean, default=True, index=True)
     
     # Metadados
     data_cadastro = Column(DateTime, default=datetime.utcnow)
@@ -92,7 +92,7 @@ class Dispositivo(Base):
     versao_app = Column(String(20))
     
     # Status e controle
-    status = Column(String(20), default="ativo")
+    status = Column(String(20), default="ativo", index=True)
     data_primeiro_registro = Column(DateTime, default=datetime.utcnow)
     ultima_localizacao_lat = Column(Float)
     ultima_localizacao_lng = Column(Float)
@@ -139,6 +139,12 @@ class Emergencia(Base):
     usuario = relationship("Usuario", back_populates="emergencias")
     dispositivo = relationship("Dispositivo", back_populates="emergencias")
     admin_responsavel = relationship("Admin", back_populates="emergencias_atendidas")
+    
+    # Índices: listagem (com ou sem filtro de status) ordenada pela data de acionamento
+    __table_args__ = (
+        Index("ix_emergencias_status_acionamento", status, timestamp_acionamento),
+        Index("ix_emergencias_acionamento", timestamp_acionamento),
+    )
 
 class PingDispositivo(Base):
     __tablename__ = 'pings_dispositivos'
@@ -152,15 +158,24 @@ class PingDispositivo(Base):
     nivel_bateria = Column(Integer)
     status_dispositivo = Column(String(20))  # online, offline, roubado
     tipo_ping = Column(String(30))  # device_ping, stolen_device_ping
+    retido = Column(Boolean, default=False, nullable=False)  # Histórico preservado (dispositivo já roubado)
     
     # Relacionamento
+    # No MySQL a tabela é particionada e a FK de dispositivo_id não existe no banco (ver retention.py)
     dispositivo = relationship("Dispositivo", back_populates="pings")
+    
+    # Índices: histórico por dispositivo (mais recente primeiro), pings de roubados e retenção
+    __table_args__ = (
+        Index("ix_pings_dispositivo_timestamp", dispositivo_id, timestamp.desc()),
+        Index("ix_pings_status_timestamp", status_dispositivo, timestamp),
+        Index("ix_pings_retido_timestamp", retido, timestamp),
+    )
 
 class LogSistema(Base):
     __tablename__ = 'logs_sistema'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     nivel = Column(String(20))  # INFO, WARNING, ERROR, CRITICAL
     modulo = Column(String(100))  # Módulo do sistema que gerou o log
     mensagem = Column(Text, nullable=False)
@@ -180,3 +195,19 @@ class ConfiguracaoSistema(Base):
     descricao = Column(Text)
     data_modificacao = Column(DateTime, default=datetime.utcnow)
     modificado_por = Column(Integer, ForeignKey('admins.id'))
+
+class ArquivoUpload(Base):
+    """Arquivo em UPLOAD_DIR e quantos registros apontam para ele"""
+    __tablename__ = 'arquivos_upload'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    caminho = Column(String(255), unique=True, nullable=False)  # relativo a UPLOAD_DIR, ex: "ab/cd/<sha256>.jpg"
+    sha256 = Column(String(64), index=True)  # vazio para fotos antigas (nome UUID)
+    tamanho = Column(Integer)
+    referencias = Column(Integer, default=0, nullable=False)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Varredura de órfãos: referencias = 0 e mais antigos que a carência
+        Index("ix_arquivos_referencias_atualizado", referencias, atualizado_em),
+    )
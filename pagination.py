@@ -0,0 +1,117 @@
+"""
+Paginação por cursor (keyset) para as listagens
+
+O cursor é opaco para o cliente: base64 (URL-safe) do JSON com a chave do
+último item da página, `[id]` ou `[timestamp, id]`. A próxima página é
+buscada com WHERE sobre essa chave em vez de OFFSET, de modo que o custo
+de cada página não cresce com a profundidade.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+
+class CursorInvalido(ValueError):
+    """Cursor malformado ou de outra listagem"""
+
+
+def encode_cursor(*valores: Any) -> str:
+    dados = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    bruto = json.dumps(dados, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, campos: int) -> list:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(bruto)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise CursorInvalido("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != campos:
+        raise CursorInvalido("Cursor inválido")
+    return valores
+
+
+def _pagina(itens: list, limit: int, chave) -> Tuple[list, Optional[str]]:
+    if limit <= 0:
+        # Página vazia, como antes do cursor (sem próxima página)
+        return [], None
+    if len(itens) <= limit:
+        return itens, None
+    itens = itens[:limit]
+    return itens, encode_cursor(*chave(itens[-1]))
+
+
+def paginar_por_id(
+    query: Query,
+    coluna_id,
+    cursor: Optional[str],
+    limit: int,
+    skip: int = 0,
+) -> Tuple[List[Any], Optional[str]]:
+    """Página em ordem crescente de id; retorna (itens, próximo cursor)"""
+    if cursor:
+        (ultimo_id,) = decode_cursor(cursor, 1)
+        if not isinstance(ultimo_id, int):
+            raise CursorInvalido("Cursor inválido")
+        query = query.filter(coluna_id > ultimo_id)
+
+    query = query.order_by(coluna_id)
+    if skip and not cursor:
+        query = query.offset(skip)
+    itens = query.limit(limit + 1).all()
+    return _pagina(itens, limit, lambda item: (getattr(item, coluna_id.key),))
+
+
+def filtrar_por_tempo(query: Query, coluna_tempo, coluna_id, cursor: Optional[str]) -> Query:
+    """Ordenar do mais recente para o mais antigo por (timestamp, id), a partir do cursor"""
+    if cursor:
+        tempo, ultimo_id = decode_cursor(cursor, 2)
+        try:
+            tempo = datetime.fromisoformat(tempo)
+        except (TypeError, ValueError):
+            raise CursorInvalido("Cursor inválido")
+        if not isinstance(ultimo_id, int):
+            raise CursorInvalido("Cursor inválido")
+        # Comparação de tuplas expandida; o "<=" redundante dá ao otimizador
+        # (SQLite e MySQL) uma faixa no índice do timestamp
+        query = query.filter(coluna_tempo <= tempo, or_(
+            coluna_tempo < tempo,
+            and_(coluna_tempo == tempo, coluna_id < ultimo_id),
+        ))
+    return query.order_by(coluna_tempo.desc(), coluna_id.desc())
+
+
+def proximo_cursor_por_tempo(query_chaves: Query, limit: int, skip: int = 0) -> Optional[str]:
+    """Cursor da página seguinte lendo só as chaves (timestamp, id) da fronteira
+
+    query_chaves deve ser a consulta já ordenada por filtrar_por_tempo e
+    selecionando apenas (timestamp, id).
+    """
+    if limit <= 0:
+        return None
+    fronteira = query_chaves.offset(skip + limit - 1).limit(2).all()
+    if len(fronteira) < 2:
+        return None
+    return encode_cursor(*fronteira[0])
+
+
+def paginar_por_tempo(
+    query: Query,
+    coluna_tempo,
+    coluna_id,
+    cursor: Optional[str],
+    limit: int,
+    skip: int = 0,
+) -> Tuple[List[Any], Optional[str]]:
+    """Página do mais recente para o mais antigo por (timestamp, id)"""
+    query = filtrar_por_tempo(query, coluna_tempo, coluna_id, cursor)
+    if skip and not cursor:
+        query = query.offset(skip)
+    itens = query.limit(limit + 1).all()
+    return _pagina(itens, limit, lambda item: (getattr(item, coluna_tempo.key), getattr(item, coluna_id.key)))
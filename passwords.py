@@ -0,0 +1,165 @@
+"""
+Hash e verificação de senhas (bcrypt) fora do event loop
+
+O bcrypt é CPU puro e propositalmente lento (~0,25 s por verificação com
+12 rounds). As chamadas vão para um pool de threads próprio e pequeno
+(o bcrypt libera o GIL), com limite de pedidos pendentes: numa rajada de
+logins o excedente recebe 503 em vez de enfileirar sem fim, e o pool
+padrão do servidor continua livre para as outras rotas.
+
+LoginThrottle limita as tentativas falhas por email e por IP numa janela
+deslizante e é consultado antes do bcrypt, de modo que força bruta não
+consome CPU.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from cache import TTLCache
+
+
+class PasswordPoolBusy(Exception):
+    """Fila do pool de senhas cheia - o cliente deve tentar novamente mais tarde"""
+
+
+class TooManyAttempts(Exception):
+    """Tentativas de login excedidas para o email ou IP"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Muitas tentativas de login")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """bcrypt num pool de threads dedicado, com limite de pendências"""
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 64):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pendentes = 0
+
+        # Métricas
+        self.total_hashed = 0
+        self.total_verified = 0
+        self.total_rejected = 0
+        self.last_ms = 0.0
+
+    async def hash(self, senha: str) -> str:
+        resultado = await self._executar(self._context.hash, senha)
+        self.total_hashed += 1
+        return resultado
+
+    async def verify(self, senha: str, senha_hash: str) -> bool:
+        resultado = await self._executar(self._context.verify, senha, senha_hash)
+        self.total_verified += 1
+        return resultado
+
+    async def _executar(self, funcao, *args):
+        if self._pendentes >= self.max_pending:
+            self.total_rejected += 1
+            raise PasswordPoolBusy()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+        self._pendentes += 1
+        inicio = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, funcao, *args)
+        finally:
+            self._pendentes -= 1
+            self.last_ms = (time.perf_counter() - inicio) * 1000
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pendentes,
+            "total_hashed": self.total_hashed,
+            "total_verified": self.total_verified,
+            "total_rejected": self.total_rejected,
+            "last_ms": round(self.last_ms, 2),
+        }
+
+
+class LoginThrottle:
+    """Limite de tentativas falhas por email e por IP (janela deslizante)"""
+
+    def __init__(
+        self,
+        max_por_email: int = 5,
+        max_por_ip: int = 20,
+        janela_segundos: float = 300.0,
+        maxsize: int = 100000,
+    ):
+        self.max_por_email = max_por_email
+        self.max_por_ip = max_por_ip
+        self.janela = janela_segundos
+        # Chaves sem falhas recentes expiram sozinhas; maxsize limita a memória
+        # mesmo sob uma varredura de emails/IPs
+        self._falhas = TTLCache(maxsize=maxsize, ttl=janela_segundos)
+        self._lock = threading.Lock()
+        self.total_blocked = 0
+
+    def verificar(self, email: str, ip: Optional[str]) -> None:
+        """Levanta TooManyAttempts se o email ou o IP estiver bloqueado"""
+        agora = time.monotonic()
+        espera = max(
+            self._espera(("email", email.lower()), self.max_por_email, agora),
+            self._espera(("ip", ip), self.max_por_ip, agora) if ip else 0,
+        )
+        if espera > 0:
+            self.total_blocked += 1
+            raise TooManyAttempts(int(espera) + 1)
+
+    def registrar_falha(self, email: str, ip: Optional[str]) -> None:
+        agora = time.monotonic()
+        self._registrar(("email", email.lower()), agora)
+        if ip:
+            self._registrar(("ip", ip), agora)
+
+    def registrar_sucesso(self, email: str) -> None:
+        self._falhas.pop(("email", email.lower()))
+
+    def _espera(self, chave: tuple, limite: int, agora: float) -> float:
+        with self._lock:
+            falhas = self._falhas.get(chave)
+            if falhas is None:
+                return 0
+            while falhas and falhas[0] <= agora - self.janela:
+                falhas.popleft()
+            if len(falhas) < limite:
+                return 0
+            # Liberado quando a falha mais antiga que ainda conta sair da janela
+            return falhas[-limite] + self.janela - agora
+
+    def _registrar(self, chave: tuple, agora: float) -> None:
+        with self._lock:
+            falhas = self._falhas.get(chave) or deque()
+            falhas.append(agora)
+            while len(falhas) > max(self.max_por_email, self.max_por_ip):
+                falhas.popleft()
+            # set renova o TTL da chave
+            self._falhas.set(chave, falhas)
+
+    def stats(self) -> dict:
+        return {
+            "max_por_email": self.max_por_email,
+            "max_por_ip": self.max_por_ip,
+            "janela_segundos": self.janela,
+            "tracked_keys": len(self._falhas),
+            "total_blocked": self.total_blocked,
+        }
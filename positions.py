@@ -0,0 +1,357 @@
+"""
+Última posição de cada dispositivo, em memória e fora da linha do banco
+
+Cada ping reescrevia ultima_localizacao_lat/lng e ultimo_ping na linha de
+dispositivos, disputando o lock da linha com as edições dos admins. A
+posição atual agora vive numa tabela compacta em memória: arrays paralelos
+(array('d') para latitude, longitude e horário, array('b') para o status)
+com um slot por dispositivo, cerca de 33 bytes por dispositivo. É ela que responde o mapa
+e o "visto por último".
+
+Os slots alterados desde o último checkpoint são gravados no banco num
+UPDATE em lote a cada checkpoint_seconds, com a mesma guarda de horário da
+fila de ingestão: uma posição mais recente já gravada nunca é sobrescrita.
+
+Cada alteração (posição ou status) incrementa a versão da tabela. O
+snapshot do mapa leva a versão atual e alteracoes_desde() devolve só os
+dispositivos alterados depois de uma versão, em O(alterados): os slots
+ficam num dict ordenado pela versão da última alteração. A "instância"
+muda a cada reinício do processo, quando as versões recomeçam do zero.
+"""
+import asyncio
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from geo import coordenadas
+from models import Dispositivo
+
+
+# Códigos de status no snapshot (-1: desconhecido)
+STATUS = ("ativo", "inativo", "roubado", "recuperado", "bloqueado")
+_CODIGO_STATUS = {nome: codigo for codigo, nome in enumerate(STATUS)}
+
+# Snapshot binário: instância (8 bytes), versão (int64) e quantidade (uint32),
+# seguidos das colunas ids (int64), lat, lng, ts (float64, NaN sem posição)
+# e status (int8), todas little-endian
+CABECALHO_BINARIO = struct.Struct("<8sqI")
+
+
+class Posicao(NamedTuple):
+    latitude: float
+    longitude: float
+    timestamp: datetime
+
+
+def _epoch(quando: datetime) -> float:
+    """datetime UTC sem fuso (como gravado no banco) → segundos"""
+    return quando.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _datetime(segundos: float) -> datetime:
+    return datetime.fromtimestamp(segundos, timezone.utc).replace(tzinfo=None)
+
+
+class PositionStore:
+    """Tabela em memória id → (lat, lng, horário, status) com checkpoint periódico"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        checkpoint_seconds: float = 60.0,
+        checkpoint_batch: int = 1000,
+    ):
+        self.session_factory = session_factory
+        self.checkpoint_interval = checkpoint_seconds
+        self.checkpoint_batch = checkpoint_batch
+        self._slots: Dict[int, int] = {}
+        self._ids = array("q")
+        self._lat = array("d")
+        self._lng = array("d")
+        self._ts = array("d")
+        self._status = array("b")
+        self._sujos: Set[int] = set()
+        # slot → versão da última alteração, em ordem crescente de versão
+        self._alteracoes: Dict[int, int] = {}
+        self.versao = 0
+        self.instancia = os.urandom(8)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.carregado = False
+
+        # Métricas
+        self.total_updates = 0
+        self.total_out_of_order = 0
+        self.total_checkpoints = 0
+        self.total_checkpointed = 0
+        self.total_errors = 0
+        self.last_checkpoint_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def atualizar(self, dispositivo_id: int, lat, lng, quando: datetime, status: Optional[str] = None) -> bool:
+        """Registrar a posição (e o status); False se inválida ou mais antiga que a atual"""
+        ponto = coordenadas(lat, lng)
+        if ponto is None:
+            return False
+        segundos = _epoch(quando)
+        with self._lock:
+            slot = self._slots.get(dispositivo_id)
+            if slot is None:
+                slot = self._novo_slot(dispositivo_id)
+            elif segundos < self._ts[slot]:
+                # Ping que chegou depois de um mais recente (tarefas fora de ordem)
+                self.total_out_of_order += 1
+                return False
+            self._lat[slot], self._lng[slot] = ponto
+            self._ts[slot] = segundos
+            if status is not None:
+                self._status[slot] = _CODIGO_STATUS.get(status, -1)
+            self._sujos.add(slot)
+            self._alterado(slot)
+        self.total_updates += 1
+        return True
+
+    def definir_status(self, dispositivo_id: int, status: str) -> None:
+        """Registrar o novo status do dispositivo (mesmo sem posição conhecida)"""
+        codigo = _CODIGO_STATUS.get(status, -1)
+        with self._lock:
+            slot = self._slots.get(dispositivo_id)
+            if slot is None:
+                slot = self._novo_slot(dispositivo_id)
+            elif self._status[slot] == codigo:
+                return
+            self._status[slot] = codigo
+            self._alterado(slot)
+
+    def get(self, dispositivo_id: int) -> Optional[Posicao]:
+        with self._lock:
+            slot = self._slots.get(dispositivo_id)
+            if slot is None or math.isnan(self._ts[slot]):
+                return None
+            return Posicao(self._lat[slot], self._lng[slot], _datetime(self._ts[slot]))
+
+    def vistos(self) -> List[Tuple[int, datetime, Optional[str]]]:
+        """(id, horário da última posição, status) dos dispositivos com posição"""
+        with self._lock:
+            return [
+                (self._ids[slot], _datetime(self._ts[slot]), STATUS[self._status[slot]] if self._status[slot] >= 0 else None)
+                for slot in range(len(self._ids)) if not math.isnan(self._ts[slot])
+            ]
+
+    def _novo_slot(self, dispositivo_id: int) -> int:
+        slot = len(self._ids)
+        self._slots[dispositivo_id] = slot
+        self._ids.append(dispositivo_id)
+        self._lat.append(math.nan)
+        self._lng.append(math.nan)
+        self._ts.append(math.nan)
+        self._status.append(-1)
+        return slot
+
+    def _alterado(self, slot: int) -> None:
+        self.versao += 1
+        self._alteracoes.pop(slot, None)
+        self._alteracoes[slot] = self.versao
+
+    # -- Mapa: snapshot e alterações ---------------------------------------
+
+    def snapshot(self) -> dict:
+        """Todos os dispositivos em colunas, com a versão atual"""
+        with self._lock:
+            return self._colunas(range(len(self._ids)), 0)
+
+    def alteracoes_desde(self, versao: int, instancia: Optional[str] = None) -> dict:
+        """Dispositivos alterados depois de `versao`; tudo se a versão não vale mais
+
+        completo=True indica que a resposta substitui o estado do cliente
+        (outra instância ou versão à frente da atual, p.ex. após reinício).
+        """
+        with self._lock:
+            if instancia != self.instancia.hex() or versao > self.versao:
+                return self._colunas(range(len(self._ids)), 0)
+            slots: List[int] = []
+            for slot, alterado_em in reversed(self._alteracoes.items()):
+                if alterado_em <= versao:
+                    break
+                slots.append(slot)
+            slots.reverse()
+            return self._colunas(slots, versao)
+
+    def _colunas(self, slots: Iterable[int], desde: int) -> dict:
+        ids, lat, lng, ts, status = [], [], [], [], []
+        for slot in slots:
+            ids.append(self._ids[slot])
+            if math.isnan(self._ts[slot]):
+                lat.append(None)
+                lng.append(None)
+                ts.append(None)
+            else:
+                lat.append(round(self._lat[slot], 6))
+                lng.append(round(self._lng[slot], 6))
+                ts.append(int(self._ts[slot]))
+            status.append(self._status[slot])
+        return {
+            "instancia": self.instancia.hex(),
+            "versao": self.versao,
+            "desde": desde,
+            "completo": desde == 0,
+            "status_nomes": STATUS,
+            "ids": ids,
+            "lat": lat,
+            "lng": lng,
+            "ts": ts,
+            "status": status,
+        }
+
+    def snapshot_binario(self) -> bytes:
+        """Snapshot completo no formato CABECALHO_BINARIO + colunas"""
+        with self._lock:
+            colunas = [array(a.typecode, a) for a in (self._ids, self._lat, self._lng, self._ts)]
+            status = self._status.tobytes()
+            cabecalho = CABECALHO_BINARIO.pack(self.instancia, self.versao, len(self._ids))
+        if sys.byteorder == "big":
+            for coluna in colunas:
+                coluna.byteswap()
+        return b"".join([cabecalho, *(coluna.tobytes() for coluna in colunas), status])
+
+    # -- Carga e checkpoint ------------------------------------------------
+
+    def garantir_carregado(self, db: Session) -> None:
+        if not self.carregado:
+            self.carregar(db)
+
+    def carregar(self, db: Optional[Session] = None) -> int:
+        """Preencher com os dispositivos do banco, sem sobrescrever o que já está em memória"""
+        proprio = db is None
+        if proprio:
+            db = self.session_factory()
+        try:
+            linhas = db.execute(
+                select(Dispositivo.id, Dispositivo.ultima_localizacao_lat,
+                       Dispositivo.ultima_localizacao_lng, Dispositivo.ultimo_ping, Dispositivo.status)
+            ).all()
+        finally:
+            if proprio:
+                db.close()
+
+        carregados = 0
+        with self._lock:
+            for dispositivo_id, lat, lng, quando, status in linhas:
+                if dispositivo_id in self._slots:
+                    continue
+                slot = self._novo_slot(dispositivo_id)
+                self._status[slot] = _CODIGO_STATUS.get(status, -1)
+                ponto = coordenadas(lat, lng)
+                if ponto is not None and quando is not None:
+                    self._lat[slot], self._lng[slot] = ponto
+                    self._ts[slot] = _epoch(quando)
+                self._alterado(slot)
+                carregados += 1
+        self.carregado = True
+        return carregados
+
+    def checkpoint(self) -> int:
+        """Gravar no banco as posições alteradas desde o último checkpoint"""
+        inicio = time.perf_counter()
+        with self._lock:
+            sujos, self._sujos = self._sujos, set()
+            linhas = [
+                {"b_id": self._ids[slot], "b_lat": self._lat[slot], "b_lng": self._lng[slot],
+                 "b_ts": _datetime(self._ts[slot])}
+                for slot in sujos
+            ]
+        if not linhas:
+            return 0
+
+        tabela = Dispositivo.__table__
+        comando = (
+            update(tabela)
+            .where(tabela.c.id == bindparam("b_id"))
+            .where(or_(tabela.c.ultimo_ping.is_(None), tabela.c.ultimo_ping <= bindparam("b_ts")))
+            .values(
+                ultima_localizacao_lat=bindparam("b_lat"),
+                ultima_localizacao_lng=bindparam("b_lng"),
+                ultimo_ping=bindparam("b_ts"),
+            )
+        )
+        db = self.session_factory()
+        try:
+            # Lotes em transações curtas: cada uma segura poucas linhas
+            for i in range(0, len(linhas), self.checkpoint_batch):
+                db.connection().execute(comando, linhas[i:i + self.checkpoint_batch])
+                db.commit()
+        except Exception:
+            db.rollback()
+            self.total_errors += 1
+            # Voltam para o próximo checkpoint (os já gravados só repetem o UPDATE)
+            with self._lock:
+                self._sujos |= sujos
+            raise
+        finally:
+            db.close()
+
+        self.total_checkpoints += 1
+        self.total_checkpointed += len(linhas)
+        self.last_checkpoint_ms = (time.perf_counter() - inicio) * 1000
+        return len(linhas)
+
+    async def start(self) -> None:
+        """Carregar as posições do banco e iniciar o checkpoint periódico"""
+        try:
+            await run_in_threadpool(self.carregar)
+        except Exception as e:
+            print(f"⚠️ Posições dos dispositivos não carregadas: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar a tarefa e gravar o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await run_in_threadpool(self.checkpoint)
+        except Exception as e:
+            print(f"❌ Erro no checkpoint final de posições: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await run_in_threadpool(self.checkpoint)
+            except Exception as e:
+                print(f"❌ Erro no checkpoint de posições: {e}")
+
+    def stats(self) -> dict:
+        colunas = (self._ids, self._lat, self._lng, self._ts, self._status)
+        bytes_usados = sum(a.buffer_info()[1] * a.itemsize for a in colunas)
+        return {
+            "loaded": self.carregado,
+            "devices": len(self._ids),
+            "version": self.versao,
+            "dirty": len(self._sujos),
+            "array_bytes": bytes_usados,
+            "checkpoint_seconds": self.checkpoint_interval,
+            "total_updates": self.total_updates,
+            "total_out_of_order": self.total_out_of_order,
+            "total_checkpoints": self.total_checkpoints,
+            "total_checkpointed": self.total_checkpointed,
+            "total_errors": self.total_errors,
+            "last_checkpoint_ms": round(self.last_checkpoint_ms, 2),
+        }
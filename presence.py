@@ -0,0 +1,202 @@
+"""
+Detecção de dispositivos que pararam de enviar pings (offline)
+
+Cada dispositivo tem um prazo: o horário do último ping mais
+offline_after_seconds. Os prazos ficam numa roda de tempo (timer wheel):
+baldes de resolution_seconds, de modo que a varredura só abre os baldes
+já vencidos em vez de percorrer a tabela inteira. Um ping novo só adia o
+prazo no dict; o dispositivo é mudado de balde quando o balde antigo
+vence, então cada dispositivo está em um único balde, o ping custa O(1)
+e a varredura custa O(vencidos + remarcados).
+
+Um min-heap teria o mesmo comportamento, mas cada remarcação custaria
+O(log n); com 100 mil dispositivos pingando, remarcar é o caso comum
+(ver bench_offline.py).
+
+Os vencidos de "ativo" passam a "inativo" num UPDATE em lote (o próximo
+ping os devolve a "ativo", como antes) e todos geram um evento
+device_offline, inclusive os roubados que ficaram em silêncio.
+"""
+import asyncio
+import math
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from cache import DeviceCache
+from models import Dispositivo
+
+
+def _epoch(quando: datetime) -> float:
+    return quando.replace(tzinfo=timezone.utc).timestamp()
+
+
+class OfflineSweeper:
+    """Roda de tempo de prazos (último ping + limite) varrida periodicamente"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        device_cache: DeviceCache,
+        offline_after_seconds: float = 600.0,
+        interval_seconds: float = 30.0,
+        resolution_seconds: Optional[float] = None,
+        batch_size: int = 500,
+        ao_ficar_offline: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+    ):
+        self.session_factory = session_factory
+        self.device_cache = device_cache
+        self.offline_after = offline_after_seconds
+        self.interval = interval_seconds
+        self.resolution = resolution_seconds or interval_seconds
+        self.batch_size = batch_size
+        self.ao_ficar_offline = ao_ficar_offline
+        self._prazos: Dict[int, float] = {}
+        # balde (prazo / resolução, arredondado para cima) → dispositivos
+        self._baldes: Dict[int, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_offline = 0
+        self.total_inactivated = 0
+        self.total_sweeps = 0
+        self.total_errors = 0
+        self.last_sweep_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._prazos)
+
+    def visto(self, dispositivo_id: int, quando: datetime) -> None:
+        """Registrar um ping do dispositivo (adia o prazo)"""
+        prazo = _epoch(quando) + self.offline_after
+        atual = self._prazos.get(dispositivo_id)
+        if atual is None:
+            self._prazos[dispositivo_id] = prazo
+            self._agendar(dispositivo_id, prazo)
+        elif prazo > atual:
+            self._prazos[dispositivo_id] = prazo
+
+    def _agendar(self, dispositivo_id: int, prazo: float) -> None:
+        self._baldes.setdefault(math.ceil(prazo / self.resolution), []).append(dispositivo_id)
+
+    def vencidos(self, agora: Optional[float] = None) -> List[Tuple[int, datetime]]:
+        """Retirar da roda os dispositivos sem ping até o prazo: (id, último ping)"""
+        agora = time.time() if agora is None else agora
+        limite = math.ceil(agora / self.resolution)
+        resultado = []
+        # Poucos baldes existem ao mesmo tempo (limite / resolução, mais a dispersão dos pings)
+        for balde in sorted(b for b in self._baldes if b <= limite):
+            for dispositivo_id in self._baldes.pop(balde):
+                prazo = self._prazos[dispositivo_id]
+                if prazo > agora:
+                    # Pingou depois de entrar no balde (ou vence no fim do balde atual)
+                    self._agendar(dispositivo_id, prazo)
+                    continue
+                del self._prazos[dispositivo_id]
+                ultimo = datetime.fromtimestamp(prazo - self.offline_after, timezone.utc).replace(tzinfo=None)
+                resultado.append((dispositivo_id, ultimo))
+        return resultado
+
+    def _inativar(self, ids: List[int]) -> Tuple[Dict[int, dict], List[int]]:
+        """Dados dos dispositivos vencidos e UPDATE em lote dos que estavam ativos"""
+        db = self.session_factory()
+        try:
+            dados = self.device_cache.get_many_by_id(db, ids)
+            ativos = [dispositivo_id for dispositivo_id in ids
+                      if dispositivo_id in dados and dados[dispositivo_id]["status"] == "ativo"]
+            for i in range(0, len(ativos), self.batch_size):
+                # A guarda de status mantém uma alteração feita no meio tempo
+                db.execute(
+                    update(Dispositivo)
+                    .where(Dispositivo.id.in_(ativos[i:i + self.batch_size]), Dispositivo.status == "ativo")
+                    .values(status="inativo")
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            return dados, ativos
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def varrer(self, agora: Optional[float] = None) -> int:
+        """Marcar os vencidos como offline; retorna quantos"""
+        vencidos = self.vencidos(agora)
+        if not vencidos:
+            return 0
+        inicio = time.perf_counter()
+        ids = [dispositivo_id for dispositivo_id, _ in vencidos]
+        try:
+            dados, ativos = await run_in_threadpool(self._inativar, ids)
+        except Exception:
+            self.total_errors += 1
+            # Tentar de novo na próxima varredura
+            for dispositivo_id, ultimo in vencidos:
+                if dispositivo_id not in self._prazos:
+                    self.visto(dispositivo_id, ultimo)
+            raise
+
+        inativados = set(ativos)
+        offline = []
+        for dispositivo_id, ultimo in vencidos:
+            entry = dados.get(dispositivo_id)
+            if entry is None:
+                continue
+            if dispositivo_id in inativados:
+                self.device_cache.set_status(entry["imei"], "inativo")
+            offline.append(dict(
+                entry,
+                status_anterior=entry["status"],
+                status="inativo" if dispositivo_id in inativados else entry["status"],
+                ultimo_ping=ultimo,
+            ))
+
+        self.total_sweeps += 1
+        self.total_offline += len(offline)
+        self.total_inactivated += len(inativados)
+        self.last_sweep_ms = (time.perf_counter() - inicio) * 1000
+        if offline and self.ao_ficar_offline is not None:
+            await self.ao_ficar_offline(offline)
+        return len(offline)
+
+    async def start(self, vistos: Iterable[Tuple[int, datetime]] = ()) -> None:
+        """Acompanhar os dispositivos já vistos e iniciar a varredura periódica"""
+        for dispositivo_id, quando in vistos:
+            self.visto(dispositivo_id, quando)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.varrer()
+            except Exception as e:
+                print(f"❌ Erro na varredura de dispositivos offline: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._prazos),
+            "buckets": len(self._baldes),
+            "offline_after_seconds": self.offline_after,
+            "interval_seconds": self.interval,
+            "total_sweeps": self.total_sweeps,
+            "total_offline": self.total_offline,
+            "total_inactivated": self.total_inactivated,
+            "total_errors": self.total_errors,
+            "last_sweep_ms": round(self.last_sweep_ms, 2),
+        }
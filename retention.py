@@ -0,0 +1,384 @@
+"""
+Particionamento por tempo e retenção de pings_dispositivos
+
+Cada ping tem a marca `retido`: pings de dispositivos que já foram
+roubados (status roubado/recuperado) ficam com retido=1 e nunca expiram;
+quando um dispositivo é marcado como roubado o histórico anterior dele é
+marcado também. A fila de ingestão confere de novo o status atual ao
+gravar cada lote (reter_pings_do_lote): um ping enfileirado antes da
+mudança de status, com o cache ainda desatualizado, também é preservado.
+
+No MySQL a tabela é particionada por RANGE COLUMNS(retido, timestamp):
+uma partição por mês para os pings comuns (retido=0) e uma partição
+única (p_retidos) para o histórico preservado. Expirar um mês é um
+DROP PARTITION, sem varrer linhas. No SQLite (desenvolvimento) não há
+partições: a expiração é um DELETE por faixa usando o índice
+(retido, timestamp).
+
+Antes de expirar, pings comuns antigos são reduzidos (downsampling) a um
+ping por dispositivo por intervalo.
+"""
+import asyncio
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import delete, func, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import ConfiguracaoSistema, Dispositivo, PingDispositivo
+
+# Status cujo histórico de pings é preservado
+STATUS_RETIDOS = ("roubado", "recuperado")
+
+TABELA = PingDispositivo.__tablename__
+CHAVE_DOWNSAMPLE = "pings_downsample_ate"
+_PARTICAO_MENSAL = re.compile(r"^p(\d{4})(\d{2})$")
+_LOTE_DELETE = 5000
+
+
+def ping_retido(status_dispositivo: Optional[str]) -> bool:
+    """Se um ping com este status deve ser preservado"""
+    return status_dispositivo in STATUS_RETIDOS
+
+
+def reter_historico(db: Session, dispositivo_ids: Iterable[int]) -> None:
+    """Preservar todo o histórico de pings dos dispositivos (sem commit)"""
+    ids = list(dispositivo_ids)
+    if ids:
+        db.execute(
+            update(PingDispositivo)
+            .where(PingDispositivo.dispositivo_id.in_(ids), PingDispositivo.retido == False)
+            .values(retido=True)
+        )
+
+
+def reter_pings_do_lote(db: Session, dispositivo_ids: Iterable[int], desde: datetime) -> None:
+    """Preservar os pings desde `desde` dos dispositivos hoje roubados/recuperados (sem commit)
+
+    O status gravado no ping vem do cache no momento da recepção; aqui vale
+    o status atual do dispositivo. A faixa de tempo mantém o UPDATE no
+    índice (dispositivo_id, timestamp), só sobre os pings do lote.
+    """
+    ids = list(dispositivo_ids)
+    if ids:
+        retidos = select(Dispositivo.id).where(Dispositivo.id.in_(ids), Dispositivo.status.in_(STATUS_RETIDOS))
+        db.execute(
+            update(PingDispositivo)
+            .where(
+                PingDispositivo.dispositivo_id.in_(retidos),
+                PingDispositivo.timestamp >= desde,
+                PingDispositivo.retido == False,
+            )
+            .values(retido=True)
+            .execution_options(synchronize_session=False)
+        )
+
+
+# ---------------------------------------------------------------------------
+# Partições MySQL
+# ---------------------------------------------------------------------------
+
+def _proximo_mes(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def nome_particao(mes: date) -> str:
+    return f"p{mes.year:04d}{mes.month:02d}"
+
+
+def _definicao_mensal(mes: date) -> str:
+    return f"PARTITION {nome_particao(mes)} VALUES LESS THAN (0, '{_proximo_mes(mes).isoformat()} 00:00:00')"
+
+
+def _meses(inicio: date, fim: date) -> List[date]:
+    """Meses de inicio até fim (inclusive), normalizados para o dia 1"""
+    mes, fim = date(inicio.year, inicio.month, 1), date(fim.year, fim.month, 1)
+    meses = []
+    while mes <= fim:
+        meses.append(mes)
+        mes = _proximo_mes(mes)
+    return meses
+
+
+def ddl_particionamento(inicio: date, fim: date) -> str:
+    """PARTITION BY com partições mensais de inicio a fim, p_futuro e p_retidos"""
+    particoes = [f"PARTITION p_antigo VALUES LESS THAN (0, '{date(inicio.year, inicio.month, 1).isoformat()} 00:00:00')"]
+    particoes += [_definicao_mensal(mes) for mes in _meses(inicio, fim)]
+    particoes.append("PARTITION p_futuro VALUES LESS THAN (0, MAXVALUE)")
+    particoes.append("PARTITION p_retidos VALUES LESS THAN (MAXVALUE, MAXVALUE)")
+    return "PARTITION BY RANGE COLUMNS(retido, `timestamp`) (\n    " + ",\n    ".join(particoes) + "\n)"
+
+
+def particoes_mysql(conn: Connection) -> List[str]:
+    """Nomes das partições de pings_dispositivos, em ordem (vazio se não particionada)"""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabela AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"tabela": TABELA}).fetchall()
+    return [row[0] for row in rows]
+
+
+def _meses_particionados(particoes: List[str]) -> List[date]:
+    meses = []
+    for nome in particoes:
+        m = _PARTICAO_MENSAL.match(nome)
+        if m:
+            meses.append(date(int(m.group(1)), int(m.group(2)), 1))
+    return meses
+
+
+def adicionar_coluna_retido(conn: Connection) -> bool:
+    """Adicionar e preencher a coluna retido num banco existente (SQLite e MySQL)"""
+    colunas = {col["name"] for col in inspect(conn).get_columns(TABELA)}
+    if "retido" in colunas:
+        return False
+    conn.execute(text(f"ALTER TABLE {TABELA} ADD COLUMN retido BOOLEAN NOT NULL DEFAULT 0"))
+    status = ", ".join(f"'{s}'" for s in STATUS_RETIDOS)
+    conn.execute(text(
+        f"UPDATE {TABELA} SET retido = 1 WHERE status_dispositivo IN ({status}) "
+        f"OR dispositivo_id IN (SELECT id FROM dispositivos WHERE status IN ({status}))"
+    ))
+    return True
+
+
+def particionar_mysql(conn: Connection, meses_futuros: int = 3) -> bool:
+    """Converter pings_dispositivos numa tabela particionada (somente MySQL)
+
+    Tabelas particionadas do InnoDB não aceitam chaves estrangeiras e toda
+    chave única precisa conter as colunas de particionamento: a FK de
+    dispositivo_id é removida (a relação continua declarada no ORM) e a
+    chave primária passa a ser (id, retido, timestamp).
+    """
+    if particoes_mysql(conn):
+        return False
+
+    for fk in inspect(conn).get_foreign_keys(TABELA):
+        conn.execute(text(f"ALTER TABLE {TABELA} DROP FOREIGN KEY `{fk['name']}`"))
+    conn.execute(text(f"ALTER TABLE {TABELA} DROP PRIMARY KEY, ADD PRIMARY KEY (id, retido, `timestamp`)"))
+
+    mais_antigo = conn.execute(
+        select(func.min(PingDispositivo.timestamp)).where(PingDispositivo.retido == False)
+    ).scalar()
+    hoje = datetime.utcnow().date()
+    inicio = mais_antigo.date() if mais_antigo else hoje
+    fim = date(hoje.year, hoje.month, 1)
+    for _ in range(meses_futuros):
+        fim = _proximo_mes(fim)
+    conn.execute(text(f"ALTER TABLE {TABELA} " + ddl_particionamento(inicio, fim)))
+    return True
+
+
+def garantir_particoes_futuras(conn: Connection, meses_futuros: int = 3) -> List[str]:
+    """Criar as partições mensais dos próximos meses a partir de p_futuro (vazia)"""
+    existentes = _meses_particionados(particoes_mysql(conn))
+    hoje = datetime.utcnow().date()
+    fim = date(hoje.year, hoje.month, 1)
+    for _ in range(meses_futuros):
+        fim = _proximo_mes(fim)
+    inicio = _proximo_mes(max(existentes)) if existentes else date(hoje.year, hoje.month, 1)
+    novos = _meses(inicio, fim) if inicio <= fim else []
+    if novos:
+        definicoes = [_definicao_mensal(mes) for mes in novos]
+        definicoes.append("PARTITION p_futuro VALUES LESS THAN (0, MAXVALUE)")
+        conn.execute(text(f"ALTER TABLE {TABELA} REORGANIZE PARTITION p_futuro INTO ({', '.join(definicoes)})"))
+    return [nome_particao(mes) for mes in novos]
+
+
+def remover_particoes_expiradas(conn: Connection, corte: datetime) -> List[str]:
+    """DROP PARTITION dos meses inteiramente anteriores ao corte"""
+    expiradas = [
+        nome_particao(mes) for mes in _meses_particionados(particoes_mysql(conn))
+        if datetime.combine(_proximo_mes(mes), datetime.min.time()) <= corte
+    ]
+    if expiradas:
+        conn.execute(text(f"ALTER TABLE {TABELA} DROP PARTITION {', '.join(expiradas)}"))
+    return expiradas
+
+
+# ---------------------------------------------------------------------------
+# Tarefa de retenção
+# ---------------------------------------------------------------------------
+
+class PingRetention:
+    """Tarefa periódica de downsampling, expiração e manutenção das partições"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        retention_days: int = 180,
+        downsample_after_days: int = 7,
+        downsample_minutes: int = 15,
+        months_ahead: int = 3,
+        interval_hours: float = 6,
+    ):
+        self.session_factory = session_factory
+        self.retention = timedelta(days=retention_days)
+        self.downsample_after = timedelta(days=downsample_after_days)
+        self.downsample_interval = timedelta(minutes=downsample_minutes)
+        self.months_ahead = months_ahead
+        self.interval = interval_hours * 3600
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_runs = 0
+        self.total_errors = 0
+        self.total_downsampled = 0
+        self.total_expired_rows = 0
+        self.total_dropped_partitions = 0
+        self.last_run_ms = 0.0
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.run_once)
+            except Exception as e:
+                self.total_errors += 1
+                print(f"❌ Erro na retenção de pings: {e}")
+            await asyncio.sleep(self.interval)
+
+    def run_once(self, agora: Optional[datetime] = None) -> dict:
+        """Executar um ciclo completo de manutenção"""
+        agora = agora or datetime.utcnow()
+        inicio = time.perf_counter()
+        resultado = {"partitions_created": [], "downsampled": 0, "expired_rows": 0, "partitions_dropped": []}
+
+        db = self.session_factory()
+        try:
+            mysql = db.get_bind().dialect.name == "mysql"
+            particionada = mysql and bool(particoes_mysql(db.connection()))
+            if particionada:
+                resultado["partitions_created"] = garantir_particoes_futuras(db.connection(), self.months_ahead)
+                db.commit()
+
+            # Expirar antes de reduzir: não vale a pena reduzir o que vai ser apagado
+            corte = agora - self.retention
+            if particionada:
+                resultado["partitions_dropped"] = remover_particoes_expiradas(db.connection(), corte)
+                db.commit()
+            else:
+                resultado["expired_rows"] = self.expirar(db, corte)
+
+            resultado["downsampled"] = self.downsample(db, agora - self.downsample_after)
+        finally:
+            db.close()
+
+        self.total_runs += 1
+        self.total_downsampled += resultado["downsampled"]
+        self.total_expired_rows += resultado["expired_rows"]
+        self.total_dropped_partitions += len(resultado["partitions_dropped"])
+        self.last_run_ms = (time.perf_counter() - inicio) * 1000
+        return resultado
+
+    def downsample(self, db: Session, ate: datetime) -> int:
+        """Manter um ping comum por dispositivo por intervalo, até a data dada"""
+        config = db.query(ConfiguracaoSistema).filter(ConfiguracaoSistema.chave == CHAVE_DOWNSAMPLE).first()
+        janela = self._proxima_janela(db, datetime.fromisoformat(config.valor) if config else None, ate)
+        removidos = 0
+        while janela is not None and janela < ate:
+            fim = min(janela + self.downsample_interval, ate)
+            rows = db.execute(
+                select(PingDispositivo.id, PingDispositivo.dispositivo_id)
+                .where(
+                    PingDispositivo.retido == False,
+                    PingDispositivo.timestamp >= janela,
+                    PingDispositivo.timestamp < fim,
+                )
+                .order_by(PingDispositivo.timestamp, PingDispositivo.id)
+            ).fetchall()
+
+            vistos = set()
+            descartar = []
+            for ping_id, dispositivo_id in rows:
+                if dispositivo_id in vistos:
+                    descartar.append(ping_id)
+                else:
+                    vistos.add(dispositivo_id)
+            for i in range(0, len(descartar), _LOTE_DELETE):
+                db.execute(delete(PingDispositivo).where(
+                    PingDispositivo.retido == False,
+                    PingDispositivo.timestamp >= janela,
+                    PingDispositivo.timestamp < fim,
+                    PingDispositivo.id.in_(descartar[i:i + _LOTE_DELETE]),
+                ))
+            removidos += len(descartar)
+
+            config = self._salvar_marca(db, config, fim)
+            db.commit()
+            janela = self._proxima_janela(db, fim, ate)
+
+        self._salvar_marca(db, config, ate)
+        db.commit()
+        return removidos
+
+    def _proxima_janela(self, db: Session, desde: Optional[datetime], ate: datetime) -> Optional[datetime]:
+        """Início do próximo intervalo com pings comuns (pula trechos vazios)"""
+        consulta = select(func.min(PingDispositivo.timestamp)).where(
+            PingDispositivo.retido == False, PingDispositivo.timestamp < ate
+        )
+        if desde is not None:
+            consulta = consulta.where(PingDispositivo.timestamp >= desde)
+        primeiro = db.execute(consulta).scalar()
+        if primeiro is None:
+            return None
+        # Alinhar ao intervalo para que janelas de execuções diferentes coincidam
+        passo = int(self.downsample_interval.total_seconds())
+        segundos = int((primeiro - datetime(1970, 1, 1)).total_seconds())
+        alinhado = datetime(1970, 1, 1) + timedelta(seconds=segundos - segundos % passo)
+        return max(alinhado, desde) if desde is not None else alinhado
+
+    def _salvar_marca(self, db: Session, config: Optional[ConfiguracaoSistema], ate: datetime) -> ConfiguracaoSistema:
+        if config is None:
+            config = ConfiguracaoSistema(
+                chave=CHAVE_DOWNSAMPLE,
+                descricao="Pings comuns anteriores a esta data já foram reduzidos"
+            )
+            db.add(config)
+        config.valor = ate.isoformat()
+        config.data_modificacao = datetime.utcnow()
+        return config
+
+    def expirar(self, db: Session, corte: datetime) -> int:
+        """Remover pings comuns anteriores ao corte (sem partições), em lotes"""
+        total = 0
+        while True:
+            ids = db.execute(
+                select(PingDispositivo.id)
+                .where(PingDispositivo.retido == False, PingDispositivo.timestamp < corte)
+                .limit(_LOTE_DELETE)
+            ).scalars().all()
+            if not ids:
+                return total
+            db.execute(delete(PingDispositivo).where(PingDispositivo.id.in_(ids)))
+            db.commit()
+            total += len(ids)
+
+    def stats(self) -> dict:
+        return {
+            "retention_days": self.retention.days,
+            "downsample_after_days": self.downsample_after.days,
+            "downsample_minutes": int(self.downsample_interval.total_seconds() // 60),
+            "total_runs": self.total_runs,
+            "total_errors": self.total_errors,
+            "total_downsampled": self.total_downsampled,
+            "total_expired_rows": self.total_expired_rows,
+            "total_dropped_partitions": self.total_dropped_partitions,
+            "last_run_ms": round(self.last_run_ms, 2),
+        }
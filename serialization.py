@@ -0,0 +1,72 @@
+"""
+Serialização única dos eventos enviados pelo WebSocket
+
+Cada evento é serializado uma única vez por formato e o mesmo frame é
+entregue a todas as conexões: bytes UTF-8 (orjson quando disponível,
+json da biblioteca padrão caso contrário) para conexões binárias e texto
+JSON para as demais.
+"""
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # datetime/date/Decimal e afins viram texto, como no isoformat() usado nos eventos
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(payload: Any) -> bytes:
+    """Serializar para JSON em bytes UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps_text(payload: Any) -> str:
+    """Serializar para JSON em texto ASCII (não-ASCII escapado)
+
+    O servidor ASGI codifica em UTF-8 cada frame de texto enviado; com
+    texto ASCII essa codificação é uma cópia simples de memória.
+    """
+    return json.dumps(payload, separators=(",", ":"), default=_default)
+
+
+class Frame:
+    """Evento já serializado, compartilhado entre todas as conexões"""
+
+    __slots__ = ("data", "text")
+
+    def __init__(self, data: Optional[bytes] = None, text: Optional[str] = None):
+        self.data = data    # bytes UTF-8 para conexões binárias
+        self.text = text    # texto ASCII para conexões de texto
+
+
+def encode_event(payload: dict, text: bool = True, binary: bool = True) -> Frame:
+    """Serializar um evento uma única vez em cada formato pedido"""
+    return Frame(
+        data=dumps(payload) if binary else None,
+        text=dumps_text(payload) if text else None,
+    )
+
+
+def stream_json_array(itens: Iterable[Any], lote: int = 200) -> Iterator[bytes]:
+    """Serializar uma sequência como array JSON em pedaços, à medida que é lida"""
+    yield b"["
+    separador = b""
+    pendentes = []
+    for item in itens:
+        pendentes.append(dumps(item))
+        if len(pendentes) >= lote:
+            yield separador + b",".join(pendentes)
+            separador = b","
+            pendentes = []
+    if pendentes:
+        yield separador + b",".join(pendentes)
+    yield b"]"
@@ -0,0 +1,199 @@
+"""
+Entrega dos arquivos de /uploads com cache de longa duração
+
+Um nome em /uploads nunca é reescrito: as fotos novas são endereçadas pelo
+conteúdo (<sha256>.ext, ver uploads.PhotoStore) e as antigas têm nomes
+UUID. Por isso cada resposta leva ETag forte (o próprio hash quando o nome
+o contém; senão tamanho e mtime) e Cache-Control immutable com max-age
+longo: num reload do dashboard o navegador nem pergunta ao servidor.
+Pedidos condicionais (If-None-Match / If-Modified-Since) recebem 304 e
+Range de um intervalo recebe 206, respeitando If-Range.
+
+O corpo vai pela extensão ASGI "http.response.zerocopysend" (sendfile)
+quando o servidor a oferece. Sem ela, arquivos de até um bloco (miniaturas
+e fotos comuns) são lidos numa única ida ao threadpool, e os maiores em
+blocos de 256 KB.
+"""
+import os
+import re
+from calendar import timegm
+from email.utils import formatdate, parsedate
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from uploads import CHUNK_SIZE
+
+UM_ANO = 365 * 24 * 3600
+HASH_NO_NOME = re.compile(r"[0-9a-f]{64}")
+
+
+def etag_do_arquivo(caminho: str, stat_result: os.stat_result) -> str:
+    """ETag forte: o hash do nome (com o sufixo da variante) ou tamanho-mtime"""
+    nome = Path(caminho).name
+    base = nome.rsplit(".", 1)[0]
+    if HASH_NO_NOME.fullmatch(base.split(".", 1)[0]):
+        return f'"{base}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def intervalo_pedido(valor: str, tamanho: int) -> Optional[Tuple[int, int]]:
+    """(início, fim inclusivo) de um header Range "bytes=..." de um intervalo
+
+    Retorna None se o header deve ser ignorado (sintaxe desconhecida ou
+    vários intervalos: a resposta é o arquivo inteiro) e levanta
+    ValueError se o intervalo não é satisfazível.
+    """
+    unidade, _, especificacao = valor.partition("=")
+    if unidade.strip().lower() != "bytes" or "," in especificacao:
+        return None
+    inicio, separador, fim = especificacao.strip().partition("-")
+    if not separador or not (inicio or fim) or not (inicio + fim).isdigit():
+        return None
+    if not inicio:
+        # Sufixo: os últimos N bytes
+        sufixo = int(fim)
+        if sufixo == 0 or tamanho == 0:
+            raise ValueError("intervalo vazio")
+        return max(tamanho - sufixo, 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        raise ValueError("intervalo fora do arquivo")
+    return inicio, fim
+
+
+def _ler(caminho: str, inicio: int, tamanho: int) -> bytes:
+    with open(caminho, "rb") as arquivo:
+        arquivo.seek(inicio)
+        return arquivo.read(tamanho)
+
+
+class ArquivoResponse(Response):
+    """Corpo de um arquivo (ou de um trecho dele) sem carregá-lo inteiro"""
+
+    def __init__(
+        self,
+        caminho: str,
+        headers: dict,
+        status_code: int = 200,
+        inicio: int = 0,
+        tamanho: int = 0,
+        method: str = "GET",
+    ):
+        self.caminho = caminho
+        self.status_code = status_code
+        self.inicio = inicio
+        self.tamanho = tamanho
+        self.send_header_only = method.upper() == "HEAD"
+        self.media_type = None
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only or self.tamanho == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            arquivo = await anyio.to_thread.run_sync(open, self.caminho, "rb")
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": arquivo,
+                    "offset": self.inicio,
+                    "count": self.tamanho,
+                    "more_body": False,
+                })
+            finally:
+                arquivo.close()
+        elif self.tamanho <= CHUNK_SIZE:
+            corpo = await anyio.to_thread.run_sync(_ler, self.caminho, self.inicio, self.tamanho)
+            await send({"type": "http.response.body", "body": corpo, "more_body": False})
+        else:
+            async with await anyio.open_file(self.caminho, mode="rb") as arquivo:
+                await arquivo.seek(self.inicio)
+                restante = self.tamanho
+                while restante > 0:
+                    bloco = await arquivo.read(min(CHUNK_SIZE, restante))
+                    # Arquivo menor que o anunciado: encerra em vez de travar
+                    restante = restante - len(bloco) if bloco else 0
+                    await send({"type": "http.response.body", "body": bloco, "more_body": restante > 0})
+
+
+class UploadFiles(StaticFiles):
+    """StaticFiles para arquivos imutáveis: ETag forte, immutable, 304 e 206"""
+
+    def __init__(self, *args, max_age: int = UM_ANO, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        method = scope["method"]
+        request_headers = Headers(scope=scope)
+        tamanho = stat_result.st_size
+        etag = etag_do_arquivo(str(full_path), stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers = {
+            "content-type": guess_type(str(full_path))[0] or "application/octet-stream",
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "cache-control": self.cache_control,
+        }
+
+        if self.nao_modificado(request_headers, etag, stat_result):
+            return NotModifiedResponse(Headers(headers))
+
+        intervalo = None
+        valor_range = request_headers.get("range")
+        if valor_range and method == "GET" and self.range_vale(request_headers, etag, last_modified):
+            try:
+                intervalo = intervalo_pedido(valor_range, tamanho)
+            except ValueError:
+                return Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{tamanho}", "accept-ranges": "bytes"},
+                )
+
+        if intervalo is None:
+            headers["content-length"] = str(tamanho)
+            return ArquivoResponse(str(full_path), headers, status_code, 0, tamanho, method)
+
+        inicio, fim = intervalo
+        headers["content-range"] = f"bytes {inicio}-{fim}/{tamanho}"
+        headers["content-length"] = str(fim - inicio + 1)
+        return ArquivoResponse(str(full_path), headers, 206, inicio, fim - inicio + 1, method)
+
+    @staticmethod
+    def nao_modificado(request_headers: Headers, etag: str, stat_result: os.stat_result) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # Comparação fraca (RFC 9110): W/"x" casa com "x"
+            candidatos = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in candidatos or etag in candidatos
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            data = parsedate(if_modified_since)
+            if data is not None:
+                return int(stat_result.st_mtime) <= timegm(data[:6])
+        return False
+
+    @staticmethod
+    def range_vale(request_headers: Headers, etag: str, last_modified: str) -> bool:
+        """If-Range: o intervalo só vale se o arquivo ainda for o mesmo"""
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        return if_range.strip() in (etag, last_modified)
@@ -0,0 +1,191 @@
+"""
+Tabela indexada de assinaturas do WebSocket
+
+Cada conexão pode restringir os eventos que recebe por tipo de evento,
+província do usuário, posto policial e áreas (bounding boxes). Dentro de
+uma dimensão os valores são alternativos (OU); entre dimensões todas as
+restrições precisam ser satisfeitas (E). Uma dimensão não restringida
+aceita qualquer valor, e um evento sem o atributo de uma dimensão não é
+filtrado por ela.
+
+O roteamento parte do índice da dimensão mais seletiva do evento e só
+testa as conexões candidatas, sem percorrer todas as conexões.
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Dimensões com valores discretos (nome no filtro → atributo do evento)
+DIMENSOES = ("eventos", "provincias", "postos")
+
+Area = Tuple[float, float, float, float]  # (min_lat, min_lng, max_lat, max_lng)
+
+# Áreas que cobrem mais células que isto não entram na grade; a conexão é
+# tratada como livre no índice e a área é conferida conexão a conexão
+MAX_CELULAS_POR_ASSINATURA = 4096
+
+
+def parse_filtro(dados: dict) -> dict:
+    """Validar e normalizar o filtro enviado pelo cliente; levanta ValueError"""
+    filtro = {}
+    for dim in DIMENSOES:
+        valores = dados.get(dim)
+        if valores is None:
+            continue
+        if isinstance(valores, str):
+            valores = [valores]
+        if not isinstance(valores, list) or not all(isinstance(v, str) for v in valores):
+            raise ValueError(f"'{dim}' deve ser uma lista de textos")
+        if valores:
+            filtro[dim] = frozenset(valores)
+
+    areas = dados.get("areas")
+    if areas is not None and not isinstance(areas, list):
+        raise ValueError("'areas' deve ser uma lista de áreas")
+    if areas:
+        normalizadas = []
+        for area in areas:
+            if not isinstance(area, (list, tuple)) or len(area) != 4:
+                raise ValueError("Cada área deve ser [min_lat, min_lng, max_lat, max_lng]")
+            try:
+                min_lat, min_lng, max_lat, max_lng = (float(v) for v in area)
+            except (TypeError, ValueError):
+                raise ValueError("Cada área deve ser [min_lat, min_lng, max_lat, max_lng]") from None
+            if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+                raise ValueError("Área inválida")
+            normalizadas.append((min_lat, min_lng, max_lat, max_lng))
+        filtro["areas"] = tuple(normalizadas)
+    return filtro
+
+
+class SubscriptionIndex:
+    """Índice invertido: valor de cada dimensão → conexões interessadas"""
+
+    def __init__(self, cell_degrees: float = 0.5):
+        self.cell_degrees = cell_degrees
+        self._filtros: Dict[Hashable, dict] = {}
+        self._por_valor: Dict[str, Dict[str, Set[Hashable]]] = {dim: defaultdict(set) for dim in DIMENSOES}
+        # Conexões que não restringem a dimensão
+        self._livres: Dict[str, Set[Hashable]] = {dim: set() for dim in DIMENSOES + ("areas",)}
+        # Grade de células → conexões com alguma área que toca a célula
+        self._celulas: Dict[Tuple[int, int], Set[Hashable]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._filtros)
+
+    def add(self, conn: Hashable, filtro: Optional[dict] = None) -> None:
+        """Registrar (ou substituir) o filtro de uma conexão"""
+        if conn in self._filtros:
+            self.remove(conn)
+        filtro = filtro or {}
+        self._filtros[conn] = filtro
+
+        for dim in DIMENSOES:
+            if dim in filtro:
+                for valor in filtro[dim]:
+                    self._por_valor[dim][valor].add(conn)
+            else:
+                self._livres[dim].add(conn)
+
+        if self._indexa_areas(filtro):
+            for cell in self._cells_de(filtro["areas"]):
+                self._celulas[cell].add(conn)
+        else:
+            self._livres["areas"].add(conn)
+
+    def remove(self, conn: Hashable) -> None:
+        filtro = self._filtros.pop(conn, None)
+        if filtro is None:
+            return
+        for dim in DIMENSOES:
+            if dim in filtro:
+                for valor in filtro[dim]:
+                    conns = self._por_valor[dim].get(valor)
+                    if conns is not None:
+                        conns.discard(conn)
+                        if not conns:
+                            del self._por_valor[dim][valor]
+            else:
+                self._livres[dim].discard(conn)
+
+        if self._indexa_areas(filtro):
+            for cell in self._cells_de(filtro["areas"]):
+                conns = self._celulas.get(cell)
+                if conns is not None:
+                    conns.discard(conn)
+                    if not conns:
+                        del self._celulas[cell]
+        else:
+            self._livres["areas"].discard(conn)
+
+    def filtro_de(self, conn: Hashable) -> dict:
+        return self._filtros.get(conn, {})
+
+    def match(
+        self,
+        evento: Optional[str] = None,
+        provincia: Optional[str] = None,
+        posto: Optional[str] = None,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+    ) -> List[Hashable]:
+        """Conexões que devem receber um evento com estes atributos"""
+        valores = {"eventos": evento, "provincias": provincia, "postos": posto}
+        tem_local = lat is not None and lng is not None
+
+        # Candidatos de cada dimensão presente no evento: índice + livres
+        grupos: List[Tuple[int, Iterable[Hashable], Iterable[Hashable]]] = []
+        for dim in DIMENSOES:
+            valor = valores[dim]
+            if valor is None:
+                continue
+            indexados = self._por_valor[dim].get(valor, ())
+            grupos.append((len(indexados) + len(self._livres[dim]), indexados, self._livres[dim]))
+        if tem_local:
+            indexados = self._celulas.get(self._cell(lat, lng), ())
+            grupos.append((len(indexados) + len(self._livres["areas"]), indexados, self._livres["areas"]))
+
+        if not grupos:
+            return [conn for conn, filtro in self._filtros.items() if not filtro]
+
+        # Partir da dimensão mais seletiva e conferir as demais por conexão
+        _, indexados, livres = min(grupos, key=lambda g: g[0])
+        resultado = []
+        for origem in (indexados, livres):
+            for conn in origem:
+                if self._aceita(self._filtros[conn], valores, lat, lng, tem_local):
+                    resultado.append(conn)
+        return resultado
+
+    def _aceita(self, filtro: dict, valores: dict, lat, lng, tem_local: bool) -> bool:
+        for dim in DIMENSOES:
+            permitidos = filtro.get(dim)
+            if permitidos is not None:
+                valor = valores[dim]
+                if valor is not None and valor not in permitidos:
+                    return False
+        areas = filtro.get("areas")
+        if areas is not None and tem_local:
+            return any(a[0] <= lat <= a[2] and a[1] <= lng <= a[3] for a in areas)
+        return True
+
+    def _indexa_areas(self, filtro: dict) -> bool:
+        if "areas" not in filtro:
+            return False
+        total = 0
+        for min_lat, min_lng, max_lat, max_lng in filtro["areas"]:
+            lat0, lng0 = self._cell(min_lat, min_lng)
+            lat1, lng1 = self._cell(max_lat, max_lng)
+            total += (lat1 - lat0 + 1) * (lng1 - lng0 + 1)
+        return total <= MAX_CELULAS_POR_ASSINATURA
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _cells_de(self, areas: Iterable[Area]):
+        for min_lat, min_lng, max_lat, max_lng in areas:
+            lat0, lng0 = self._cell(min_lat, min_lng)
+            lat1, lng1 = self._cell(max_lat, max_lng)
+            for i in range(lat0, lat1 + 1):
+                for j in range(lng0, lng1 + 1):
+                    yield (i, j)
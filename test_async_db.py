@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Teste da camada assíncrona de banco (handlers async sem bloquear o event loop)
+"""
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from main import create_emergencia, device_cache, dispositivo_ping, ping_coalescer, ping_ingest, responder_emergencia
+from models import Dispositivo, Emergencia
+from test_cache import criar_banco_teste
+
+
+def criar_banco_async():
+    """Mesmo banco de test_cache, em arquivo, acessado pelo driver aiosqlite"""
+    caminho = os.path.join(tempfile.mkdtemp(), "async.db")
+    criar_banco_teste(f"sqlite:///{caminho}")[0].dispose()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{caminho}")
+    return engine, async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+
+async def com_contador(coro):
+    """Executa coro contando quantas vezes o event loop rodou outra tarefa"""
+    voltas = 0
+    terminado = False
+
+    async def outra_tarefa():
+        nonlocal voltas
+        while not terminado:
+            voltas += 1
+            await asyncio.sleep(0)
+
+    tarefa = asyncio.create_task(outra_tarefa())
+    try:
+        return await coro, voltas
+    finally:
+        terminado = True
+        await tarefa
+
+
+def test_sos_e_resposta_pela_sessao_async():
+    """SOS e resposta gravam pelo AsyncSession e liberam o loop durante o I/O"""
+    print("🧪 Testando handlers de emergência com sessão assíncrona...")
+    engine, SessionAsync = criar_banco_async()
+    device_cache.clear()
+
+    async def cenario():
+        async with SessionAsync() as db:
+            resposta, voltas = await com_contador(create_emergencia(
+                {"dispositivo_id": 1, "latitude": -25.9, "longitude": 32.5}, db=db
+            ))
+        assert resposta["status"] == "success"
+        assert voltas > 0
+
+        async with SessionAsync() as db:
+            admin = SimpleNamespace(id=1, nome_completo="Admin")
+            await responder_emergencia(resposta["emergency_id"], {"observacoes": "a caminho"},
+                                       db=db, current_admin=admin)
+
+        async with SessionAsync() as db:
+            emergencia = await db.get(Emergencia, resposta["emergency_id"])
+            dispositivo = (await db.execute(select(Dispositivo).where(Dispositivo.id == 1))).scalar_one()
+        assert emergencia.status == "respondido"
+        assert emergencia.observacoes_admin == "a caminho"
+        assert dispositivo.ultima_localizacao_lat == -25.9
+        await engine.dispose()
+
+    asyncio.run(cenario())
+    print("  ✅ Emergência criada e respondida sem bloquear o loop")
+
+
+def test_ping_resolve_dispositivo_pela_sessao_async():
+    print("🧪 Testando ping HTTP com sessão assíncrona...")
+    engine, SessionAsync = criar_banco_async()
+    device_cache.clear()
+    enfileirados = []
+    enqueue_original = ping_ingest.enqueue
+    ping_ingest.enqueue = lambda ping, novo_status=None, anterior=None: enfileirados.append(ping)
+
+    async def cenario():
+        async with SessionAsync() as db:
+            resposta = await dispositivo_ping({"imei": "222222222222222", "latitude": -25.9, "longitude": 32.5}, db=db)
+        ping_coalescer.close()
+        await engine.dispose()
+        return resposta
+
+    try:
+        resposta = asyncio.run(cenario())
+    finally:
+        ping_ingest.enqueue = enqueue_original
+    assert resposta["device_id"] == 2
+    assert enfileirados[0]["dispositivo_id"] == 2
+    assert device_cache.get_by_imei(None, "222222222222222")["marca"] == "Tecno"
+    print("  ✅ Dispositivo resolvido e guardado no cache")
+
+
+if __name__ == "__main__":
+    test_sos_e_resposta_pela_sessao_async()
+    test_ping_resolve_dispositivo_pela_sessao_async()
+    print("\n🎉 Testes da camada assíncrona concluídos!")
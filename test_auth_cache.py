@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de autenticação (token verificado → admin)
+"""
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import main
+import schemas
+from cache import AdminPrincipal
+from test_cache import contar_queries, criar_banco_teste
+
+
+def autenticar(db, token):
+    return main.get_current_admin(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+
+
+def test_token_verificado_nao_consulta_o_banco():
+    print("🧪 Testando cache de autenticação...")
+    engine, SessionTeste = criar_banco_teste()
+    main.principal_cache.clear()
+    token = main.create_access_token({"sub": "1"})
+    db = SessionTeste()
+
+    antes = main.principal_cache.stats()["db_lookups_avoided"]
+    principal = autenticar(db, token)
+    assert principal.id == 1 and principal.nome_completo == "Admin"
+
+    contador = contar_queries(engine)
+    for _ in range(5):
+        assert autenticar(db, token) == principal
+    db.close()
+    assert contador["total"] == 0
+    assert main.principal_cache.stats()["db_lookups_avoided"] - antes == 5
+    print("  ✅ Requisições seguintes autenticadas sem consulta")
+
+
+def test_admin_desativado_perde_acesso():
+    """PUT /admins/{id} invalida o cache; admin inativo recebe 401"""
+    print("🧪 Testando invalidação ao desativar admin...")
+    _, SessionTeste = criar_banco_teste()
+    main.principal_cache.clear()
+    token = main.create_access_token({"sub": "1"})
+    db = SessionTeste()
+    assert autenticar(db, token).ativo
+
+    super_admin = AdminPrincipal(99, "super_admin", True, "Super")
+    main.update_admin(1, schemas.AdminUpdate(ativo=False, nome_completo="Admin Antigo"),
+                      db=db, current_admin=super_admin)
+    try:
+        autenticar(db, token)
+    except HTTPException as e:
+        assert e.status_code == 401 and e.detail == "Conta desativada"
+    else:
+        raise AssertionError("admin desativado autenticado")
+
+    main.update_admin(1, schemas.AdminUpdate(ativo=True), db=db, current_admin=super_admin)
+    assert autenticar(db, token).nome_completo == "Admin Antigo"
+    db.close()
+    print("  ✅ Alteração refletida imediatamente")
+
+
+def test_token_invalido():
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    try:
+        autenticar(db, "nao-e-um-jwt")
+    except HTTPException as e:
+        assert e.status_code == 401
+    else:
+        raise AssertionError("token inválido aceito")
+    db.close()
+
+
+if __name__ == "__main__":
+    test_token_verificado_nao_consulta_o_banco()
+    test_admin_desativado_perde_acesso()
+    test_token_invalido()
+    print("\n🎉 Testes do cache de autenticação concluídos!")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Teste dos caches em memória (TTLCache e DeviceCache)
+"""
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Admin, Usuario, Dispositivo
+from cache import TTLCache, DeviceCache
+
+
+def criar_banco_teste(url: str = "sqlite://"):
+    """Banco SQLite (em memória por padrão) com um usuário e dois dispositivos"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionTeste = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionTeste()
+    admin = Admin(nome_completo="Admin", email="admin@teste.mz", senha_hash="x",
+                  numero_badge="T001", posto_policial="PRM Teste")
+    db.add(admin)
+    db.flush()
+    usuario = Usuario(nome_completo="Maria", numero_identidade="BI002", telefone_principal="841111111",
+                      provincia="Maputo", cidade="Maputo", bairro="Sommerschield", rua="Av. Julius Nyerere",
+                      latitude_residencia=-25.96, longitude_residencia=32.57,
+                      admin_cadastrador_id=admin.id)
+    db.add(usuario)
+    db.flush()
+    db.add(Dispositivo(imei="111111111111111", marca="Samsung", modelo="A10", usuario_id=usuario.id))
+    db.add(Dispositivo(imei="222222222222222", marca="Tecno", modelo="Spark", usuario_id=usuario.id))
+    db.commit()
+    db.close()
+    return engine, SessionTeste
+
+
+def contar_queries(engine):
+    """Contador de SELECTs executados no engine"""
+    contador = {"total": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _contar(conn, cursor, statement, parameters, context, executemany):
+        contador["total"] += 1
+
+    return contador
+
+
+def test_ttl_cache_lru_e_expiracao():
+    """TTLCache remove o item menos usado e expira itens antigos"""
+    print("🧪 Testando TTLCache...")
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # remove "b", o menos usado
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    print("  ✅ LRU e TTL funcionando")
+
+
+def test_device_cache_evita_queries():
+    """Segunda resolução do mesmo IMEI não vai ao banco"""
+    print("🧪 Testando DeviceCache...")
+    engine, SessionTeste = criar_banco_teste()
+    cache = DeviceCache(maxsize=100, ttl=60)
+    contador = contar_queries(engine)
+    db = SessionTeste()
+
+    info = cache.get_by_imei(db, "111111111111111")
+    assert info["marca"] == "Samsung"
+    assert info["usuario_nome"] == "Maria"
+    assert info["usuario_endereco"] == "Av. Julius Nyerere, Sommerschield, Maputo"
+    assert contador["total"] == 1
+
+    assert cache.get_by_imei(db, "111111111111111")["id"] == info["id"]
+    assert cache.get_by_id(db, info["id"])["imei"] == "111111111111111"
+    assert contador["total"] == 1
+
+    assert cache.get_by_imei(db, "999999999999999") is None
+    assert cache.stats()["hits"] == 2
+    db.close()
+    print("  ✅ Apenas 1 query para 3 resoluções")
+
+
+def test_device_cache_invalidacao():
+    """Invalidação por dispositivo e por usuário força nova leitura"""
+    print("🧪 Testando invalidação do DeviceCache...")
+    engine, SessionTeste = criar_banco_teste()
+    cache = DeviceCache(maxsize=100, ttl=60)
+    db = SessionTeste()
+
+    a = cache.get_by_imei(db, "111111111111111")
+    cache.get_by_imei(db, "222222222222222")
+
+    db.query(Dispositivo).filter(Dispositivo.id == a["id"]).update({"status": "roubado"})
+    db.commit()
+    assert cache.get_by_imei(db, "111111111111111")["status"] == "ativo"
+    cache.invalidate(dispositivo_id=a["id"])
+    assert cache.get_by_imei(db, "111111111111111")["status"] == "roubado"
+
+    db.query(Usuario).filter(Usuario.id == a["usuario_id"]).update({"nome_completo": "Maria José"})
+    db.commit()
+    cache.invalidate_usuario(a["usuario_id"])
+    assert cache.get_by_imei(db, "111111111111111")["usuario_nome"] == "Maria José"
+    assert cache.get_by_imei(db, "222222222222222")["usuario_nome"] == "Maria José"
+
+    cache.set_status("222222222222222", "roubado")
+    assert cache.get_by_imei(db, "222222222222222")["status"] == "roubado"
+    db.close()
+    print("  ✅ Invalidação funcionando")
+
+
+if __name__ == "__main__":
+    test_ttl_cache_lru_e_expiracao()
+    test_device_cache_evita_queries()
+    test_device_cache_invalidacao()
+    print("\n🎉 Testes de cache concluídos!")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Teste da coalescência dos broadcasts de posição por dispositivo
+"""
+import asyncio
+
+from coalescer import PingCoalescer
+
+
+def test_latest_wins_por_dispositivo():
+    """Primeiro ping sai na hora; dentro da janela só o mais recente é enviado"""
+    print("🧪 Testando coalescência de device_ping...")
+
+    async def cenario():
+        enviados = []
+
+        async def publish(payload, **rota):
+            enviados.append((payload["device_id"], payload["seq"], rota))
+
+        coalescer = PingCoalescer(publish, window_ms=50)
+        for seq in range(5):
+            await coalescer.offer(1, {"device_id": 1, "seq": seq}, provincia="Maputo")
+        await coalescer.offer(2, {"device_id": 2, "seq": 0})
+        imediatos = list(enviados)
+
+        await asyncio.sleep(0.08)
+        stats = coalescer.stats()
+        coalescer.close()
+        return imediatos, enviados, stats
+
+    imediatos, enviados, stats = asyncio.run(cenario())
+    assert imediatos == [(1, 0, {"provincia": "Maputo"}), (2, 0, {})]
+    assert enviados[2:] == [(1, 4, {"provincia": "Maputo"})]
+    assert stats["total_received"] == 6
+    assert stats["total_emitted"] == 3
+    assert stats["total_suppressed"] == 3
+    assert stats["pending"] == 0
+    print("  ✅ Uma posição por dispositivo por janela")
+
+
+def test_janela_zero_desativa():
+    async def cenario():
+        enviados = []
+
+        async def publish(payload, **rota):
+            enviados.append(payload)
+
+        coalescer = PingCoalescer(publish, window_ms=0)
+        for seq in range(3):
+            await coalescer.offer(1, {"seq": seq})
+        return enviados
+
+    assert len(asyncio.run(cenario())) == 3
+
+
+if __name__ == "__main__":
+    test_latest_wins_por_dispositivo()
+    test_janela_zero_desativa()
+    print("\n🎉 Testes de coalescência concluídos!")
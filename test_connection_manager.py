@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Teste do fan-out não bloqueante do ConnectionManager
+"""
+import asyncio
+import json
+import time
+
+from connection_manager import ConnectionManager, CLOSE, DROP_OLDEST
+
+
+class FakeWebSocket:
+    """WebSocket falso que registra mensagens e simula latência de envio"""
+
+    def __init__(self, delay: float = 0.0, falhar: bool = False):
+        self.delay = delay
+        self.falhar = falhar
+        self.recebidas = []
+        self.binarias = []
+        self.fechado_com = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.falhar:
+            raise RuntimeError("conexão quebrada")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.recebidas.append(message)
+
+    async def send_bytes(self, data: bytes):
+        self.binarias.append(data)
+
+    async def close(self, code: int = 1000):
+        self.fechado_com = code
+
+
+def test_broadcast_nao_espera_consumidor_lento():
+    """Um consumidor lento não atrasa o broadcast nem os consumidores rápidos"""
+    print("🧪 Testando fan-out com consumidor lento...")
+
+    async def cenario():
+        manager = ConnectionManager(queue_size=10)
+        rapido = FakeWebSocket()
+        lento = FakeWebSocket(delay=1.0)
+        await manager.connect(rapido)
+        await manager.connect(lento)
+
+        inicio = time.perf_counter()
+        for i in range(5):
+            await manager.broadcast(f"msg {i}")
+        duracao = time.perf_counter() - inicio
+
+        await asyncio.sleep(0.05)
+        assert duracao < 0.05
+        assert rapido.recebidas == [f"msg {i}" for i in range(5)]
+        assert lento.recebidas == []
+        manager.disconnect(rapido)
+        manager.disconnect(lento)
+
+    asyncio.run(cenario())
+    print("  ✅ Broadcast não bloqueou")
+
+
+def test_politica_drop_oldest():
+    """Fila cheia descarta as mensagens mais antigas e conta as perdas"""
+    print("🧪 Testando política drop_oldest...")
+
+    async def cenario():
+        manager = ConnectionManager(queue_size=3, slow_consumer_policy=DROP_OLDEST)
+        lento = FakeWebSocket(delay=10)
+        await manager.connect(lento)
+        await asyncio.sleep(0)  # escritor pega a primeira mensagem e fica preso no envio
+
+        for i in range(10):
+            await manager.broadcast(f"msg {i}")
+            await asyncio.sleep(0)
+
+        stats = manager.stats()
+        conn = manager.active_connections[lento]
+        fila = [conn.queue.get_nowait() for _ in range(conn.queue.qsize())]
+        manager.disconnect(lento)
+        return fila, stats
+
+    fila, stats = asyncio.run(cenario())
+    assert fila == ["msg 7", "msg 8", "msg 9"]
+    assert stats["total_dropped"] == 6
+    assert stats["queue_depth_max"] == 3
+    print("  ✅ Mensagens antigas descartadas")
+
+
+def test_politica_close_e_conexao_quebrada():
+    """Consumidor lento é fechado e conexões quebradas são removidas"""
+    print("🧪 Testando política close...")
+
+    async def cenario():
+        manager = ConnectionManager(queue_size=1, slow_consumer_policy=CLOSE)
+        lento = FakeWebSocket(delay=10)
+        quebrado = FakeWebSocket(falhar=True)
+        await manager.connect(lento)
+        await manager.connect(quebrado)
+        await asyncio.sleep(0)
+
+        for i in range(3):
+            await manager.broadcast(f"msg {i}")
+            await asyncio.sleep(0.01)
+
+        return manager, lento
+
+    manager, lento = asyncio.run(cenario())
+    assert manager.active_connections == {}
+    assert lento.fechado_com == 1013
+    # A tarefa de fechamento foi mantida até terminar e depois descartada
+    assert manager._fechamentos == set()
+    stats = manager.stats()
+    assert stats["total_slow_closed"] == 1
+    assert stats["total_send_errors"] == 1
+    print("  ✅ Consumidores lentos e quebrados removidos")
+
+
+def test_publish_serializa_uma_vez():
+    """Conexões binárias recebem o mesmo objeto bytes; as de texto, o mesmo texto"""
+    print("🧪 Testando publish com frames compartilhados...")
+
+    async def cenario():
+        manager = ConnectionManager()
+        textos = [FakeWebSocket() for _ in range(3)]
+        binarios = [FakeWebSocket() for _ in range(3)]
+        for ws in textos:
+            await manager.connect(ws)
+        for ws in binarios:
+            await manager.connect(ws, binary=True)
+
+        await manager.publish({"type": "device_ping", "usuario_nome": "João"})
+        await asyncio.sleep(0.01)
+        for ws in textos + binarios:
+            manager.disconnect(ws)
+        return textos, binarios
+
+    textos, binarios = asyncio.run(cenario())
+    assert all(ws.recebidas[0] is textos[0].recebidas[0] for ws in textos)
+    assert all(ws.binarias[0] is binarios[0].binarias[0] for ws in binarios)
+    assert json.loads(textos[0].recebidas[0]) == json.loads(binarios[0].binarias[0])
+    assert textos[0].recebidas[0].isascii()
+    print("  ✅ Evento serializado uma vez por formato")
+
+
+if __name__ == "__main__":
+    test_broadcast_nao_espera_consumidor_lento()
+    test_politica_drop_oldest()
+    test_politica_close_e_conexao_quebrada()
+    test_publish_serializa_uma_vez()
+    print("\n🎉 Testes do ConnectionManager concluídos!")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Teste das estatísticas do dashboard (consulta única + snapshot)
+"""
+import warnings
+
+from sqlalchemy.exc import SAWarning
+
+from models import Dispositivo, Emergencia
+from dashboard import DashboardStats, consultar_estatisticas
+from test_cache import contar_queries, criar_banco_teste
+
+
+def test_consulta_unica():
+    """As seis contagens saem de uma única consulta"""
+    print("🧪 Testando consulta agregada do dashboard...")
+    engine, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    dispositivo = db.query(Dispositivo).first()
+    dispositivo.status = "roubado"
+    db.add(Emergencia(latitude=-25.9, longitude=32.5, usuario_id=dispositivo.usuario_id,
+                      dispositivo_id=dispositivo.id, status="ativo"))
+    db.add(Emergencia(latitude=-25.9, longitude=32.5, usuario_id=dispositivo.usuario_id,
+                      dispositivo_id=dispositivo.id, status="finalizado"))
+    db.commit()
+
+    contador = contar_queries(engine)
+    with warnings.catch_warnings():
+        # Sem o aviso de produto cartesiano entre os agregados
+        warnings.simplefilter("error", SAWarning)
+        stats = consultar_estatisticas(db)
+    db.close()
+    assert contador["total"] == 1
+    assert stats == {
+        "total_usuarios": 1,
+        "total_dispositivos": 2,
+        "total_emergencias": 2,
+        "emergencias_ativas": 1,
+        "dispositivos_roubados": 1,
+        "usuarios_ativos": 1,
+    }
+    print("  ✅ Estatísticas numa única consulta")
+
+
+def test_snapshot_incremental_e_reconciliacao():
+    """Leituras não consultam o banco; deltas atualizam e a reconciliação corrige"""
+    print("🧪 Testando snapshot do dashboard...")
+    engine, SessionTeste = criar_banco_teste()
+    dashboard = DashboardStats(SessionTeste)
+    db = SessionTeste()
+    assert dashboard.get(db)["total_dispositivos"] == 2
+
+    contador = contar_queries(engine)
+    dashboard.status_dispositivo("ativo", "roubado")
+    dashboard.ajustar(total_emergencias=1, emergencias_ativas=1)
+    dashboard.status_emergencia("ativo", "respondido")
+    stats = dashboard.get(db)
+    assert contador["total"] == 0
+    assert stats["dispositivos_roubados"] == 1
+    assert stats["total_emergencias"] == 1
+    assert stats["emergencias_ativas"] == 0
+    db.close()
+
+    # Nada disso foi gravado: a reconciliação volta aos valores do banco
+    stats = dashboard.reconcile()
+    assert stats["dispositivos_roubados"] == 0 and stats["total_emergencias"] == 0
+    assert dashboard.stats()["total_drift"] == 2
+    print("  ✅ Snapshot incremental reconciliado com o banco")
+
+
+if __name__ == "__main__":
+    test_consulta_unica()
+    test_snapshot_incremental_e_reconciliacao()
+    print("\n🎉 Testes do dashboard concluídos!")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Teste do índice espacial de proximidade (grade em memória)
+"""
+import random
+
+import main
+from geo import GridIndex, ProximityIndex, distancia_km
+from main import dispositivos_proximos, proximidade_emergencia
+from models import Dispositivo, Emergencia, Usuario
+from test_cache import criar_banco_teste
+
+
+def pontos_aleatorios(quantidade: int, semente: int = 7) -> dict:
+    aleatorio = random.Random(semente)
+    return {
+        i: (aleatorio.uniform(-26.5, -25.5), aleatorio.uniform(32.0, 33.0))
+        for i in range(quantidade)
+    }
+
+
+def test_raio_e_retangulo_iguais_a_busca_completa():
+    print("🧪 Testando buscas da grade contra a varredura completa...")
+    pontos = pontos_aleatorios(5000)
+    grade = GridIndex(cell_degrees=0.01)
+    for chave, (lat, lng) in pontos.items():
+        grade.atualizar(chave, lat, lng)
+
+    for raio in (0.5, 3.0, 40.0):
+        achados = grade.raio(-25.96, 32.57, raio)
+        esperado = {c for c, (lat, lng) in pontos.items() if distancia_km(-25.96, 32.57, lat, lng) <= raio}
+        assert {a[0] for a in achados} == esperado, raio
+        distancias = [a[3] for a in achados]
+        assert distancias == sorted(distancias)
+        # Com limit: os mais próximos, mesmo parando antes de visitar todas as células
+        assert grade.raio(-25.96, 32.57, raio, limit=5) == achados[:5]
+
+    proximos = grade.raio(-25.96, 32.57, 40.0, limit=10)
+    assert [a[0] for a in proximos] == [a[0] for a in grade.raio(-25.96, 32.57, 40.0)[:10]]
+
+    area = (-26.0, 32.5, -25.9, 32.6)
+    esperado = {c for c, (lat, lng) in pontos.items() if area[0] <= lat <= area[2] and area[1] <= lng <= area[3]}
+    assert {a[0] for a in grade.retangulo(*area)} == esperado
+    # Área que cobre toda a grade (percorre só as células ocupadas)
+    assert len(grade.retangulo(-90, -180, 90, 180)) == len(pontos)
+    print("  ✅ Mesmos resultados da varredura completa")
+
+
+def test_mover_remover_e_coordenadas_invalidas():
+    grade = GridIndex(cell_degrees=0.01)
+    assert grade.atualizar(1, -25.96, 32.57)
+    assert grade.atualizar(1, -19.83, 34.84)  # Beira
+    assert grade.raio(-25.96, 32.57, 5) == []
+    assert [a[0] for a in grade.raio(-19.83, 34.84, 1)] == [1]
+    assert grade.stats() == {"points": 1, "cells": 1}
+
+    # Carga do banco não sobrescreve a posição recebida por ping
+    assert grade.atualizar(1, -25.96, 32.57, somente_novo=True)
+    assert grade.get(1) == (-19.83, 34.84)
+
+    assert not grade.atualizar(2, None, 32.5)
+    assert not grade.atualizar(2, "abc", 32.5)
+    assert not grade.atualizar(2, 95, 32.5)
+    assert 2 not in grade
+
+    grade.remover(1)
+    assert len(grade) == 0 and grade.stats()["cells"] == 0
+
+
+def test_rotas_de_proximidade():
+    print("🧪 Testando rotas de proximidade...")
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    samsung, tecno = db.query(Dispositivo).order_by(Dispositivo.id).all()
+    samsung.ultima_localizacao_lat, samsung.ultima_localizacao_lng = -25.9655, 32.5832
+    tecno.ultima_localizacao_lat, tecno.ultima_localizacao_lng = -19.8436, 34.8389
+    maria = db.query(Usuario).one()
+    maria.latitude_residencia, maria.longitude_residencia = -25.9700, 32.5800
+    emergencia = Emergencia(latitude=-25.9660, longitude=32.5830, usuario_id=maria.id, dispositivo_id=samsung.id, status="ativo")
+    db.add(emergencia)
+    db.commit()
+
+    anterior = main.proximidade
+    main.proximidade = ProximityIndex(SessionTeste)
+    try:
+        achados = dispositivos_proximos(lat=-25.966, lng=32.583, raio_km=2, db=db, current_admin=None)
+        assert [d["imei"] for d in achados] == [samsung.imei]
+        assert achados[0]["distancia_km"] < 0.1
+
+        area = dispositivos_proximos(min_lat=-27, min_lng=30, max_lat=-10, max_lng=41, db=db, current_admin=None)
+        assert {d["id"] for d in area} == {samsung.id, tecno.id}
+
+        resposta = proximidade_emergencia(emergencia.id, raio_km=1, db=db, current_admin=None)
+        assert [d["id"] for d in resposta["dispositivos"]] == [samsung.id]
+        assert [r["usuario_id"] for r in resposta["residencias"]] == [maria.id]
+        assert main.proximidade.stats()["emergencias"]["points"] == 1
+    finally:
+        main.proximidade = anterior
+        db.close()
+    print("  ✅ Dispositivos e residências próximos da emergência")
+
+
+if __name__ == "__main__":
+    test_raio_e_retangulo_iguais_a_busca_completa()
+    test_mover_remover_e_coordenadas_invalidas()
+    test_rotas_de_proximidade()
+    print("\n🎉 Testes de proximidade concluídos!")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Teste da fila de ingestão de pings (gravação em lote)
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Admin, Usuario, Dispositivo, PingDispositivo
+from ingest import PingIngestQueue, IngestQueueFull
+from retention import reter_historico
+
+
+def criar_banco_teste():
+    """Banco SQLite em memória com um dispositivo cadastrado"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionTeste = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionTeste()
+    admin = Admin(nome_completo="Admin", email="admin@teste.mz", senha_hash="x",
+                  numero_badge="T001", posto_policial="PRM Teste")
+    db.add(admin)
+    db.flush()
+    usuario = Usuario(nome_completo="João", numero_identidade="BI001", telefone_principal="840000000",
+                      provincia="Maputo", cidade="Maputo", bairro="Central",
+                      latitude_residencia=-25.96, longitude_residencia=32.57,
+                      admin_cadastrador_id=admin.id)
+    db.add(usuario)
+    db.flush()
+    dispositivo = Dispositivo(imei="123456789012345", usuario_id=usuario.id, status="inativo")
+    db.add(dispositivo)
+    db.commit()
+    dispositivo_id = dispositivo.id
+    db.close()
+    return SessionTeste, dispositivo_id
+
+
+def montar_ping(dispositivo_id, lat, lng, timestamp):
+    return {
+        "dispositivo_id": dispositivo_id,
+        "latitude": lat,
+        "longitude": lng,
+        "precisao_gps": 5.0,
+        "nivel_bateria": 80,
+        "status_dispositivo": "ativo",
+        "tipo_ping": "device_ping",
+        "timestamp": timestamp
+    }
+
+
+def test_flush_em_lote():
+    """Pings enfileirados são gravados num único lote e atualizam a última localização"""
+    print("🧪 Testando gravação em lote...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=100, flush_interval_ms=50, max_queue=1000)
+
+    agora = datetime.utcnow()
+    for i in range(10):
+        fila.enqueue(montar_ping(dispositivo_id, -25.0 - i, 32.0 + i, agora + timedelta(seconds=i)),
+                     "ativo" if i == 0 else None)
+
+    assert asyncio.run(fila.flush())
+
+    db = SessionTeste()
+    assert db.query(PingDispositivo).count() == 10
+    dispositivo = db.query(Dispositivo).get(dispositivo_id)
+    assert dispositivo.ultima_localizacao_lat == -34.0
+    assert dispositivo.ultima_localizacao_lng == 41.0
+    assert dispositivo.status == "ativo"
+    db.close()
+
+    stats = fila.stats()
+    assert stats["total_flushed"] == 10
+    assert stats["total_batches"] == 1
+    assert stats["queue_depth"] == 0
+    print("  ✅ 10 pings gravados em 1 lote")
+
+
+def test_fila_cheia():
+    """Fila cheia rejeita novos pings (backpressure)"""
+    print("🧪 Testando limite da fila...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=10, max_queue=3)
+
+    for i in range(3):
+        fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, datetime.utcnow()))
+
+    try:
+        fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, datetime.utcnow()))
+        assert False, "Fila deveria estar cheia"
+    except IngestQueueFull:
+        pass
+
+    assert fila.stats()["total_rejected"] == 1
+    print("  ✅ Ping rejeitado com a fila cheia")
+
+
+def test_stop_descarrega_pendentes():
+    """Parar a fila grava tudo o que está pendente"""
+    print("🧪 Testando descarga no encerramento...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=4, flush_interval_ms=60000, max_queue=1000)
+
+    async def cenario():
+        await fila.start()
+        for i in range(10):
+            fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, datetime.utcnow()))
+        await fila.stop()
+
+    asyncio.run(cenario())
+
+    db = SessionTeste()
+    assert db.query(PingDispositivo).count() == 10
+    db.close()
+    assert len(fila) == 0
+    print("  ✅ Todos os pings gravados no encerramento")
+
+
+def test_ping_invalido_nao_bloqueia_a_fila():
+    """Depois de max_retries falhas o lote é gravado linha a linha e o ping inválido é descartado"""
+    print("🧪 Testando lote com ping inválido...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=100, max_queue=1000, max_retries=2)
+
+    agora = datetime.utcnow()
+    for i in range(6):
+        fila.enqueue(montar_ping(dispositivo_id, None if i == 2 else -25.0, 32.0, agora + timedelta(seconds=i)))
+
+    async def cenario():
+        return [await fila.flush() for _ in range(3)]
+
+    assert asyncio.run(cenario()) == [False, False, True]
+
+    db = SessionTeste()
+    assert db.query(PingDispositivo).count() == 5
+    db.close()
+    stats = fila.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["total_flushed"] == 5
+    assert stats["total_dropped"] == 1
+    assert stats["total_errors"] == 3
+    print("  ✅ 5 pings gravados, 1 descartado")
+
+
+def test_status_gravado_com_o_lote():
+    """O status vai no lote do ping que o mudou, sem esperar a fila esvaziar,
+    e não sobrescreve um status alterado por um admin no meio tempo"""
+    print("🧪 Testando mudança de status no lote...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=2, max_queue=1000)
+
+    agora = datetime.utcnow()
+    fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, agora), "roubado", "inativo")
+    for i in range(1, 6):
+        fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, agora + timedelta(seconds=i)))
+
+    assert asyncio.run(fila.flush())
+    assert len(fila) == 4
+    db = SessionTeste()
+    assert db.get(Dispositivo, dispositivo_id).status == "roubado"
+    assert db.query(PingDispositivo).filter(PingDispositivo.retido == True).count() == 2
+
+    # Admin marca como recuperado antes do lote com uma mudança antiga ser gravado
+    fila.enqueue(montar_ping(dispositivo_id, -25.0, 32.0, agora + timedelta(seconds=9)), "ativo", "roubado")
+    db.get(Dispositivo, dispositivo_id).status = "recuperado"
+    db.commit()
+    asyncio.run(fila.stop())
+    db.expire_all()
+    assert db.get(Dispositivo, dispositivo_id).status == "recuperado"
+    assert db.query(PingDispositivo).count() == 7
+    db.close()
+    print("  ✅ Status gravado no primeiro lote e alteração do admin preservada")
+
+
+def test_retido_conferido_ao_gravar():
+    """Ping enfileirado antes do dispositivo ser marcado como roubado é preservado"""
+    print("🧪 Testando retido decidido na gravação do lote...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    fila = PingIngestQueue(SessionTeste, batch_size=100, max_queue=1000)
+
+    agora = datetime.utcnow()
+    ping = montar_ping(dispositivo_id, -25.0, 32.0, agora)
+    ping["retido"] = False  # status do cache na recepção: ainda não roubado
+    fila.enqueue(ping)
+
+    # Admin marca como roubado antes da fila gravar o lote
+    db = SessionTeste()
+    db.get(Dispositivo, dispositivo_id).status = "roubado"
+    reter_historico(db, [dispositivo_id])
+    db.commit()
+
+    assert asyncio.run(fila.flush())
+    assert db.query(PingDispositivo.retido).scalar() is True
+    db.close()
+    print("  ✅ Ping gravado depois da mudança de status ficou retido")
+
+
+if __name__ == "__main__":
+    test_flush_em_lote()
+    test_fila_cheia()
+    test_stop_descarrega_pendentes()
+    test_ping_invalido_nao_bloqueia_a_fila()
+    test_status_gravado_com_o_lote()
+    test_retido_conferido_ao_gravar()
+    print("\n🎉 Testes da fila de ingestão concluídos!")
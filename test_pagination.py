@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Teste da paginação por cursor (keyset)
+"""
+from datetime import datetime, timedelta
+
+from models import Emergencia, Usuario
+from pagination import CursorInvalido, decode_cursor, encode_cursor, paginar_por_id, paginar_por_tempo
+from test_cache import criar_banco_teste
+
+
+def test_cursor_por_tempo_com_empates():
+    """Percorrer todas as páginas pelo cursor devolve cada item uma vez, em ordem"""
+    print("🧪 Testando paginação por (timestamp, id)...")
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    base = datetime(2026, 10, 1, 12, 0)
+    # Três emergências por segundo: empates no timestamp
+    db.add_all([
+        Emergencia(latitude=-25.9, longitude=32.5, usuario_id=1, dispositivo_id=1,
+                   status="ativo", timestamp_acionamento=base + timedelta(seconds=i // 3))
+        for i in range(25)
+    ])
+    db.commit()
+
+    esperado = [e.id for e in db.query(Emergencia).order_by(
+        Emergencia.timestamp_acionamento.desc(), Emergencia.id.desc()
+    )]
+    vistos, cursor = [], None
+    while True:
+        pagina, cursor = paginar_por_tempo(
+            db.query(Emergencia), Emergencia.timestamp_acionamento, Emergencia.id, cursor, 4
+        )
+        vistos += [e.id for e in pagina]
+        if cursor is None:
+            break
+    db.close()
+    assert vistos == esperado
+    print("  ✅ Todas as páginas sem repetição")
+
+
+def test_cursor_por_id_e_skip():
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    for i in range(2, 8):
+        db.add(Usuario(nome_completo=f"U{i}", numero_identidade=f"PAG{i:03d}", telefone_principal="84",
+                       provincia="Gaza", cidade="Xai-Xai", bairro="B", latitude_residencia=0,
+                       longitude_residencia=0, admin_cadastrador_id=1))
+    db.commit()
+
+    pagina, cursor = paginar_por_id(db.query(Usuario), Usuario.id, None, 3)
+    assert [u.id for u in pagina] == [1, 2, 3]
+    pagina, cursor = paginar_por_id(db.query(Usuario), Usuario.id, cursor, 3)
+    assert [u.id for u in pagina] == [4, 5, 6]
+    pagina, cursor = paginar_por_id(db.query(Usuario), Usuario.id, cursor, 3)
+    assert [u.id for u in pagina] == [7] and cursor is None
+    # skip continua funcionando para clientes antigos
+    pagina, _ = paginar_por_id(db.query(Usuario), Usuario.id, None, 2, skip=5)
+    assert [u.id for u in pagina] == [6, 7]
+    # limit=0 devolve página vazia, como antes do cursor
+    assert paginar_por_id(db.query(Usuario), Usuario.id, None, 0) == ([], None)
+    assert paginar_por_tempo(db.query(Usuario), Usuario.data_cadastro, Usuario.id, None, 0) == ([], None)
+    db.close()
+
+
+def test_cursor_invalido():
+    assert decode_cursor(encode_cursor(datetime(2026, 1, 2), 7), 2) == ["2026-01-02T00:00:00", 7]
+    for cursor in ("@@@", encode_cursor(1, 2), "bm90IGpzb24"):
+        try:
+            decode_cursor(cursor, 1)
+        except CursorInvalido:
+            continue
+        raise AssertionError(f"cursor aceito: {cursor}")
+
+
+if __name__ == "__main__":
+    test_cursor_por_tempo_com_empates()
+    test_cursor_por_id_e_skip()
+    test_cursor_invalido()
+    print("\n🎉 Testes de paginação concluídos!")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Teste do pool de senhas (bcrypt) e do limite de tentativas de login
+"""
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+
+import main
+from database import get_async_db
+from models import Admin
+from passwords import LoginThrottle, PasswordHasher, PasswordPoolBusy, TooManyAttempts
+from test_async_db import criar_banco_async
+
+
+def bloqueado(throttle, email, ip):
+    try:
+        throttle.verificar(email, ip)
+    except TooManyAttempts as e:
+        assert e.retry_after >= 1
+        return True
+    return False
+
+
+def test_throttle_por_email_e_ip():
+    print("🧪 Testando limite de tentativas de login...")
+    throttle = LoginThrottle(max_por_email=3, max_por_ip=5, janela_segundos=0.2)
+    for _ in range(3):
+        throttle.registrar_falha("a@prm.mz", "10.0.0.1")
+    assert bloqueado(throttle, "A@prm.mz", "10.0.0.9")
+    # Outro email pelo mesmo IP ainda passa até o limite do IP
+    assert not bloqueado(throttle, "b@prm.mz", "10.0.0.1")
+    throttle.registrar_falha("b@prm.mz", "10.0.0.1")
+    throttle.registrar_falha("c@prm.mz", "10.0.0.1")
+    assert bloqueado(throttle, "d@prm.mz", "10.0.0.1")
+
+    time.sleep(0.25)
+    assert not bloqueado(throttle, "a@prm.mz", "10.0.0.1")
+    throttle.registrar_falha("a@prm.mz", None)
+    throttle.registrar_sucesso("a@prm.mz")
+    assert not bloqueado(throttle, "a@prm.mz", None)
+    print("  ✅ Bloqueio por email/IP e liberação após a janela")
+
+
+def test_pool_de_senhas_limitado():
+    print("🧪 Testando pool de senhas...")
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2)
+
+    async def cenario():
+        senha_hash = await hasher.hash("segredo")
+        return await asyncio.gather(*[hasher.verify("segredo", senha_hash) for _ in range(3)],
+                                    return_exceptions=True)
+
+    resultados = asyncio.run(cenario())
+    hasher.close()
+    assert resultados.count(True) == 2
+    assert sum(isinstance(r, PasswordPoolBusy) for r in resultados) == 1
+    assert hasher.stats()["total_rejected"] == 1
+    print("  ✅ Excedente recusado em vez de enfileirado")
+
+
+def test_login_bloqueado_nao_usa_bcrypt():
+    print("🧪 Testando /auth/login com tentativas excedidas...")
+    engine, SessionAsync = criar_banco_async()
+
+    async def preparar():
+        async with SessionAsync() as db:
+            admin = await db.get(Admin, 1)
+            admin.senha_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("certa")
+            await db.commit()
+
+    async def sessao():
+        async with SessionAsync() as db:
+            yield db
+
+    asyncio.run(preparar())
+    main.app.dependency_overrides[get_async_db] = sessao
+    main.login_throttle.registrar_sucesso("admin@teste.mz")
+    cliente = TestClient(main.app)
+    try:
+        assert cliente.post("/auth/login", json={"email": "admin@teste.mz", "senha": "certa"}).status_code == 200
+        for _ in range(main.login_throttle.max_por_email):
+            assert cliente.post("/auth/login", json={"email": "admin@teste.mz", "senha": "errada"}).status_code == 401
+        verificadas = main.password_hasher.total_verified
+        r = cliente.post("/auth/login", json={"email": "admin@teste.mz", "senha": "certa"})
+        assert r.status_code == 429 and "retry-after" in r.headers
+        assert main.password_hasher.total_verified == verificadas
+    finally:
+        main.app.dependency_overrides.pop(get_async_db, None)
+        main.login_throttle.registrar_sucesso("admin@teste.mz")
+        asyncio.run(engine.dispose())
+    print("  ✅ 429 sem verificação de senha")
+
+
+if __name__ == "__main__":
+    test_throttle_por_email_e_ip()
+    test_pool_de_senhas_limitado()
+    test_login_bloqueado_nao_usa_bcrypt()
+    print("\n🎉 Testes de senhas concluídos!")
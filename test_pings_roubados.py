@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Teste do histórico de pings de dispositivos roubados (sem N+1, em streaming)
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from ingest import PingIngestQueue
+from main import get_pings_dispositivos_roubados, marcar_dispositivo_roubado
+from models import Dispositivo, PingDispositivo
+from test_cache import contar_queries, criar_banco_teste
+
+
+def popular_roubados(SessionTeste, quantidade: int = 60):
+    db = SessionTeste()
+    dispositivos = db.query(Dispositivo).all()
+    for dispositivo in dispositivos:
+        dispositivo.status = "roubado"
+    base = datetime(2026, 10, 1, 12, 0)
+    db.add_all([
+        PingDispositivo(
+            dispositivo_id=dispositivos[i % len(dispositivos)].id,
+            timestamp=base + timedelta(seconds=i // 2),
+            latitude=-25.9, longitude=32.5, status_dispositivo="roubado",
+            tipo_ping="stolen_device_ping", retido=True
+        )
+        for i in range(quantidade)
+    ])
+    db.commit()
+    db.close()
+
+
+def ler_resposta(response):
+    async def consumir():
+        return b"".join([parte async for parte in response.body_iterator])
+
+    return json.loads(asyncio.run(consumir())), response.headers.get("x-next-cursor")
+
+
+def test_numero_fixo_de_consultas():
+    """Duas consultas por página, qualquer que seja o limit"""
+    print("🧪 Testando consultas de /dispositivos/pings-roubados...")
+    engine, SessionTeste = criar_banco_teste()
+    popular_roubados(SessionTeste)
+
+    for limit in (5, 50):
+        db = SessionTeste()
+        contador = contar_queries(engine)
+        pings, cursor = ler_resposta(get_pings_dispositivos_roubados(limit=limit, db=db, current_admin=None))
+        db.close()
+        assert len(pings) == limit
+        assert cursor is not None
+        assert contador["total"] == 2, contador
+        assert pings[0]["dispositivo"]["imei"] in ("111111111111111", "222222222222222")
+        assert pings[0]["usuario"]["nome"] == "Maria"
+    print("  ✅ Número de consultas independente do tamanho da página")
+
+
+def test_paginas_pelo_cursor():
+    _, SessionTeste = criar_banco_teste()
+    popular_roubados(SessionTeste, quantidade=23)
+    vistos, cursor = [], None
+    while True:
+        db = SessionTeste()
+        pings, cursor = ler_resposta(get_pings_dispositivos_roubados(limit=10, cursor=cursor, db=db, current_admin=None))
+        db.close()
+        vistos += [p["id"] for p in pings]
+        if cursor is None:
+            break
+    assert len(vistos) == 23 and len(set(vistos)) == 23
+
+
+def test_ping_gravado_depois_de_marcar_roubado():
+    """Ping recebido antes de marcar-roubado, mas gravado depois, aparece no histórico"""
+    print("🧪 Testando ping na fila durante marcar-roubado...")
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    dispositivo = db.query(Dispositivo).order_by(Dispositivo.id).first()
+    fila = PingIngestQueue(SessionTeste, update_last_position=False)
+    fila.enqueue({
+        "dispositivo_id": dispositivo.id, "latitude": -25.9, "longitude": 32.5,
+        "status_dispositivo": dispositivo.status, "tipo_ping": "device_ping",
+        "retido": False, "timestamp": datetime.utcnow()
+    })
+
+    asyncio.run(marcar_dispositivo_roubado(dispositivo.id, db=db, current_admin=None))
+    assert asyncio.run(fila.flush())
+
+    pings, _ = ler_resposta(get_pings_dispositivos_roubados(limit=10, db=db, current_admin=None))
+    db.close()
+    assert [p["dispositivo"]["id"] for p in pings] == [dispositivo.id]
+    print("  ✅ Ping listado mesmo gravado após a mudança de status")
+
+
+if __name__ == "__main__":
+    test_numero_fixo_de_consultas()
+    test_paginas_pelo_cursor()
+    test_ping_gravado_depois_de_marcar_roubado()
+    print("\n🎉 Testes de pings-roubados concluídos!")
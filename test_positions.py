@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Teste da tabela em memória de últimas posições (PositionStore)
+"""
+import json
+import struct
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import main
+from live_map import MapSync
+from main import com_posicao_atual, mapa_snapshot, read_posicao_dispositivo
+from models import Dispositivo
+from positions import CABECALHO_BINARIO, STATUS, PositionStore
+from test_cache import contar_queries, criar_banco_teste
+
+
+def test_pings_fora_de_ordem_e_coordenadas_invalidas():
+    _, SessionTeste = criar_banco_teste()
+    posicoes = PositionStore(SessionTeste)
+    agora = datetime(2024, 5, 1, 12, 0, 0)
+
+    assert posicoes.atualizar(1, -25.96, 32.57, agora)
+    assert not posicoes.atualizar(1, -19.83, 34.84, agora - timedelta(seconds=5))
+    assert posicoes.get(1) == (-25.96, 32.57, agora)
+    assert posicoes.atualizar(1, -19.83, 34.84, agora + timedelta(seconds=5))
+    assert posicoes.get(1).latitude == -19.83
+
+    assert not posicoes.atualizar(2, None, 32.5, agora)
+    assert not posicoes.atualizar(2, 95, 32.5, agora)
+    assert posicoes.get(2) is None
+    assert posicoes.stats()["total_out_of_order"] == 1
+    assert posicoes.stats()["array_bytes"] == 33
+
+
+def test_checkpoint_grava_em_lote_sem_regredir():
+    print("🧪 Testando checkpoint das posições no banco...")
+    engine, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    samsung, tecno = db.query(Dispositivo).order_by(Dispositivo.id).all()
+    agora = datetime(2024, 5, 1, 12, 0, 0)
+
+    posicoes = PositionStore(SessionTeste)
+    for segundos in range(10):
+        posicoes.atualizar(samsung.id, -25.96 + segundos / 1000, 32.57, agora - timedelta(seconds=10 - segundos))
+    posicoes.atualizar(tecno.id, -19.83, 34.84, agora - timedelta(minutes=1))
+    # Depois disso a Tecno acionou um SOS, gravado direto na linha
+    tecno.ultima_localizacao_lat, tecno.ultima_localizacao_lng, tecno.ultimo_ping = -15.11, 39.26, agora
+    db.commit()
+
+    queries = contar_queries(engine)
+    assert posicoes.checkpoint() == 2
+    assert queries["total"] == 1
+    assert posicoes.checkpoint() == 0
+
+    db.expire_all()
+    assert samsung.ultima_localizacao_lat == -25.951
+    assert samsung.ultimo_ping == agora - timedelta(seconds=1)
+    assert (tecno.ultima_localizacao_lat, tecno.ultimo_ping) == (-15.11, agora)
+
+    # Nova carga não sobrescreve o que já está em memória
+    assert PositionStore(SessionTeste).carregar() == 2
+    assert posicoes.carregar() == 0
+    db.close()
+    print("  ✅ Só a última posição é gravada e a mais recente do banco é mantida")
+
+
+def test_leituras_usam_a_posicao_em_memoria():
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    anterior = main.posicoes
+    main.posicoes = PositionStore(SessionTeste)
+    try:
+        agora = datetime.utcnow()
+        main.posicoes.atualizar(1, -25.96, 32.57, agora)
+
+        samsung, tecno = com_posicao_atual(db.query(Dispositivo).order_by(Dispositivo.id).all())
+        assert (samsung.ultima_localizacao_lat, samsung.ultimo_ping) == (-25.96, agora)
+        assert tecno.ultima_localizacao_lat is None
+        # A sobreposição não vira UPDATE no próximo commit
+        assert not db.dirty
+
+        assert read_posicao_dispositivo(1, db=db, current_admin=None)["longitude"] == 32.57
+        assert read_posicao_dispositivo(2, db=db, current_admin=None)["ultimo_ping"] is None
+    finally:
+        main.posicoes = anterior
+        db.close()
+
+
+def test_snapshot_e_alteracoes_desde_a_versao():
+    print("🧪 Testando snapshot do mapa e deltas por versão...")
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    anterior = main.posicoes
+    main.posicoes = posicoes = PositionStore(SessionTeste)
+    try:
+        snapshot = json.loads(mapa_snapshot(db=db, current_admin=None).body)
+        assert snapshot["ids"] == [1, 2] and snapshot["completo"]
+        assert snapshot["lat"] == [None, None]
+        assert [STATUS[c] for c in snapshot["status"]] == ["ativo", "ativo"]
+
+        posicoes.atualizar(2, -19.83, 34.84, datetime(2024, 5, 1, 12, 0), "roubado")
+        posicoes.definir_status(2, "roubado")  # sem mudança: não gera versão
+        posicoes.atualizar(1, -25.96, 32.57, datetime(2024, 5, 1, 12, 0))
+        posicoes.definir_status(2, "recuperado")
+        delta = posicoes.alteracoes_desde(snapshot["versao"], snapshot["instancia"])
+        assert delta["versao"] == snapshot["versao"] + 3 and not delta["completo"]
+        # Ordem da última alteração; cada dispositivo aparece uma vez
+        assert delta["ids"] == [1, 2]
+        assert delta["lat"] == [-25.96, -19.83] and delta["ts"][0] == 1714564800
+        assert STATUS[delta["status"][1]] == "recuperado"
+        assert posicoes.alteracoes_desde(delta["versao"], delta["instancia"])["ids"] == []
+
+        # Versão de outra instância (servidor reiniciado): estado completo
+        assert posicoes.alteracoes_desde(delta["versao"], "0" * 16)["completo"]
+
+        corpo = mapa_snapshot(formato="binario", db=db, current_admin=None).body
+        instancia, versao, total = CABECALHO_BINARIO.unpack_from(corpo)
+        assert (instancia.hex(), versao, total) == (posicoes.instancia.hex(), delta["versao"], 2)
+        ids = struct.unpack_from("<2q", corpo, CABECALHO_BINARIO.size)
+        lat = struct.unpack_from("<2d", corpo, CABECALHO_BINARIO.size + 16)
+        assert ids == (1, 2) and lat == (-25.96, -19.83)
+        assert len(corpo) == CABECALHO_BINARIO.size + 2 * 33
+    finally:
+        main.posicoes = anterior
+        db.close()
+    print("  ✅ Snapshot em colunas e deltas só com o que mudou")
+
+
+def test_map_sync_pelo_websocket():
+    print("🧪 Testando map_sync no /ws...")
+    _, SessionTeste = criar_banco_teste()
+    posicoes = PositionStore(SessionTeste)
+    posicoes.carregar()
+    anterior = main.map_sync
+    main.map_sync = MapSync(posicoes, main.manager)
+    try:
+        with TestClient(main.app).websocket_connect("/ws") as ws:
+            ws.send_text(json.dumps({"type": "map_sync"}))
+            completo = ws.receive_json()
+            assert completo["type"] == "map_delta" and completo["completo"]
+            assert completo["ids"] == [1, 2]
+            assert len(main.map_sync) == 1
+
+        # Reconexão: só o que mudou enquanto o dashboard esteve fora
+        posicoes.atualizar(2, -19.83, 34.84, datetime.utcnow())
+        with TestClient(main.app).websocket_connect("/ws") as ws:
+            ws.send_text(json.dumps({"type": "map_sync", "versao": completo["versao"],
+                                     "instancia": completo["instancia"]}))
+            delta = ws.receive_json()
+            assert delta["ids"] == [2] and not delta["completo"]
+        assert len(main.map_sync) == 0
+    finally:
+        main.map_sync = anterior
+    print("  ✅ Dashboard reconectado recebe apenas as alterações")
+
+
+if __name__ == "__main__":
+    test_pings_fora_de_ordem_e_coordenadas_invalidas()
+    test_checkpoint_grava_em_lote_sem_regredir()
+    test_leituras_usam_a_posicao_em_memoria()
+    test_snapshot_e_alteracoes_desde_a_versao()
+    test_map_sync_pelo_websocket()
+    print("\n🎉 Testes de posições concluídos!")
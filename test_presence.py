@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Teste da detecção de dispositivos offline (roda de tempo de prazos)
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from cache import DeviceCache
+from models import Dispositivo
+from presence import OfflineSweeper
+from test_cache import criar_banco_teste
+
+INICIO = datetime(2024, 5, 1, 12, 0, 0)
+T0 = INICIO.replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_roda_so_devolve_os_vencidos():
+    sweeper = OfflineSweeper(None, DeviceCache(), offline_after_seconds=60)
+    for dispositivo_id in range(1000):
+        sweeper.visto(dispositivo_id, INICIO + timedelta(seconds=dispositivo_id % 10))
+    # Pings novos só adiam o prazo, sem novas entradas na roda
+    for segundos in range(1, 100):
+        sweeper.visto(7, INICIO + timedelta(seconds=segundos))
+    sweeper.visto(8, INICIO - timedelta(hours=1))  # ping atrasado não antecipa o prazo
+    assert sum(len(balde) for balde in sweeper._baldes.values()) == 1000
+
+    assert sweeper.vencidos(T0 + 59) == []
+    vencidos = sweeper.vencidos(T0 + 60)
+    assert {d for d, _ in vencidos} == set(range(0, 1000, 10))
+    assert vencidos[0][1] == INICIO
+
+    assert 7 not in {d for d, _ in sweeper.vencidos(T0 + 70)}
+    assert [d for d, _ in sweeper.vencidos(T0 + 159)] == [7]
+    assert len(sweeper) == 0 and sweeper.stats()["buckets"] == 0
+
+    # Volta a ser acompanhado depois do próximo ping
+    sweeper.visto(7, INICIO + timedelta(minutes=5))
+    assert len(sweeper) == 1
+
+
+def test_varredura_inativa_em_lote_e_notifica():
+    print("🧪 Testando varredura de dispositivos offline...")
+    _, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    samsung, tecno = db.query(Dispositivo).order_by(Dispositivo.id).all()
+    tecno.status = "roubado"
+    db.commit()
+
+    notificados = []
+
+    async def ao_ficar_offline(dispositivos):
+        notificados.extend(dispositivos)
+
+    cache = DeviceCache()
+    sweeper = OfflineSweeper(SessionTeste, cache, offline_after_seconds=600, ao_ficar_offline=ao_ficar_offline)
+    sweeper.visto(samsung.id, INICIO)
+    sweeper.visto(tecno.id, INICIO + timedelta(minutes=1))
+
+    assert asyncio.run(sweeper.varrer(T0 + 300)) == 0
+    assert asyncio.run(sweeper.varrer(T0 + 3600)) == 2
+
+    db.expire_all()
+    assert samsung.status == "inativo"
+    # Roubado em silêncio: notificado, mas o status não muda
+    assert tecno.status == "roubado"
+    assert [(d["id"], d["status_anterior"], d["status"]) for d in notificados] == [
+        (samsung.id, "ativo", "inativo"), (tecno.id, "roubado", "roubado")
+    ]
+    assert notificados[1]["ultimo_ping"] == INICIO + timedelta(minutes=1)
+    assert notificados[0]["usuario_nome"] == "Maria"
+    # O próximo ping encontra "inativo" no cache e devolve o dispositivo a "ativo"
+    assert cache.get_by_id(db, samsung.id)["status"] == "inativo"
+    assert sweeper.stats()["total_inactivated"] == 1
+    db.close()
+    print("  ✅ Só os ativos viram inativos; todos os vencidos geram evento")
+
+
+if __name__ == "__main__":
+    test_roda_so_devolve_os_vencidos()
+    test_varredura_inativa_em_lote_e_notifica()
+    print("\n🎉 Testes de dispositivos offline concluídos!")
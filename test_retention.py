@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Teste da retenção de pings (downsampling, expiração e histórico de roubados)
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, inspect, text
+
+import database
+from models import ConfiguracaoSistema, PingDispositivo
+from retention import PingRetention, ddl_particionamento, reter_historico
+from test_ingest import criar_banco_teste
+
+
+def adicionar_pings(db, dispositivo_id, inicio, quantidade, passo_segundos=60, retido=False):
+    db.add_all([
+        PingDispositivo(
+            dispositivo_id=dispositivo_id,
+            timestamp=inicio + timedelta(seconds=i * passo_segundos),
+            latitude=-25.96, longitude=32.57,
+            status_dispositivo="ativo", tipo_ping="device_ping",
+            retido=retido
+        )
+        for i in range(quantidade)
+    ])
+
+
+def test_downsample_e_expiracao():
+    """Pings antigos viram um por intervalo; expirados somem; retidos ficam"""
+    print("🧪 Testando retenção de pings...")
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    agora = datetime(2026, 10, 18, 12, 0)
+
+    db = SessionTeste()
+    # 2 horas de pings por minuto há 10 dias, 1 hora há 1 dia, 1 hora há 400 dias
+    adicionar_pings(db, dispositivo_id, datetime(2026, 10, 8, 10, 0), 120)
+    adicionar_pings(db, dispositivo_id, datetime(2026, 10, 17, 10, 0), 60)
+    adicionar_pings(db, dispositivo_id, datetime(2025, 9, 1, 10, 0), 60)
+    adicionar_pings(db, dispositivo_id, datetime(2025, 9, 1, 10, 0), 60, retido=True)
+    db.commit()
+    db.close()
+
+    retention = PingRetention(SessionTeste, retention_days=180, downsample_after_days=7, downsample_minutes=15)
+    resultado = retention.run_once(agora)
+
+    db = SessionTeste()
+    comuns = db.query(PingDispositivo).filter(PingDispositivo.retido == False)
+    # 2 horas em intervalos de 15 min = 8 pings mantidos; o último dia fica intacto
+    assert comuns.filter(PingDispositivo.timestamp < datetime(2026, 10, 9)).count() == 8
+    assert comuns.filter(PingDispositivo.timestamp >= datetime(2026, 10, 17)).count() == 60
+    assert comuns.filter(PingDispositivo.timestamp < datetime(2026, 1, 1)).count() == 0
+    assert db.query(PingDispositivo).filter(PingDispositivo.retido == True).count() == 60
+    marca = db.query(ConfiguracaoSistema).filter(ConfiguracaoSistema.chave == "pings_downsample_ate").one()
+    assert marca.valor == (agora - timedelta(days=7)).isoformat()
+    db.close()
+
+    assert resultado["downsampled"] == 112
+    assert resultado["expired_rows"] == 60
+
+    # Segunda execução não tem nada a fazer
+    segundo = retention.run_once(agora)
+    assert segundo["downsampled"] == 0 and segundo["expired_rows"] == 0
+    print("  ✅ Downsampling e expiração preservando retidos")
+
+
+def test_reter_historico_ao_marcar_roubado():
+    SessionTeste, dispositivo_id = criar_banco_teste()
+    db = SessionTeste()
+    adicionar_pings(db, dispositivo_id, datetime(2025, 1, 1), 10)
+    db.commit()
+    reter_historico(db, [dispositivo_id])
+    db.commit()
+    assert db.query(PingDispositivo).filter(PingDispositivo.retido == False).count() == 0
+    db.close()
+
+    retention = PingRetention(SessionTeste, retention_days=30)
+    assert retention.run_once(datetime(2026, 10, 18))["expired_rows"] == 0
+
+
+def test_ddl_particoes_mensais():
+    ddl = ddl_particionamento(date(2026, 11, 20), date(2027, 1, 1))
+    assert "PARTITION p_antigo VALUES LESS THAN (0, '2026-11-01 00:00:00')" in ddl
+    assert "PARTITION p202611 VALUES LESS THAN (0, '2026-12-01 00:00:00')" in ddl
+    assert "PARTITION p202612 VALUES LESS THAN (0, '2027-01-01 00:00:00')" in ddl
+    assert "PARTITION p202701 VALUES LESS THAN (0, '2027-02-01 00:00:00')" in ddl
+    assert ddl.index("p_futuro") < ddl.index("p_retidos")
+
+
+def test_init_db_adiciona_coluna_retido():
+    """Banco criado antes da coluna retido: init_db a adiciona e preenche"""
+    print("🧪 Testando coluna retido em banco existente...")
+    engine = create_engine("sqlite://")
+    database.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_pings_retido_timestamp"))
+        conn.execute(text("ALTER TABLE pings_dispositivos DROP COLUMN retido"))
+        conn.execute(text(
+            "INSERT INTO pings_dispositivos (dispositivo_id, latitude, longitude, status_dispositivo, tipo_ping, timestamp) "
+            "VALUES (1, -25.96, 32.57, 'roubado', 'stolen_device_ping', '2026-10-01 12:00:00'), "
+            "(1, -25.96, 32.57, 'ativo', 'device_ping', '2026-10-01 12:01:00')"
+        ))
+
+    original = database.engine
+    database.engine = engine
+    try:
+        database.init_db()
+        database.init_db()
+    finally:
+        database.engine = original
+
+    assert "retido" in {col["name"] for col in inspect(engine).get_columns("pings_dispositivos")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT retido FROM pings_dispositivos ORDER BY id")).scalars().all() == [1, 0]
+    print("  ✅ Coluna adicionada na inicialização")
+
+
+if __name__ == "__main__":
+    test_downsample_e_expiracao()
+    test_reter_historico_ao_marcar_roubado()
+    test_ddl_particoes_mensais()
+    test_init_db_adiciona_coluna_retido()
+    print("\n🎉 Testes de retenção concluídos!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Teste da entrega de /uploads (ETag forte, cache imutável, 304 e Range)
+"""
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from static_uploads import UploadFiles
+
+SHA = "ab" * 32
+
+
+def cliente_com_foto(conteudo: bytes):
+    raiz = Path(tempfile.mkdtemp())
+    (raiz / "ab" / "ab").mkdir(parents=True)
+    (raiz / "ab" / "ab" / f"{SHA}.jpg").write_bytes(conteudo)
+    (raiz / "antiga.jpg").write_bytes(conteudo)
+    app = Starlette(routes=[Mount("/uploads", UploadFiles(directory=raiz))])
+    return TestClient(app)
+
+
+def test_cache_imutavel_e_revalidacao():
+    print("🧪 Testando cache das fotos em /uploads...")
+    conteudo = os.urandom(300 * 1024)
+    cliente = cliente_com_foto(conteudo)
+
+    r = cliente.get(f"/uploads/ab/ab/{SHA}.jpg")
+    assert r.status_code == 200 and r.content == conteudo
+    assert r.headers["etag"] == f'"{SHA}"'
+    assert r.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert r.headers["content-type"] == "image/jpeg"
+
+    for condicao in ({"If-None-Match": f'"x", W/"{SHA}"'}, {"If-Modified-Since": r.headers["last-modified"]}):
+        r304 = cliente.get(f"/uploads/ab/ab/{SHA}.jpg", headers=condicao)
+        assert r304.status_code == 304 and r304.content == b""
+        assert r304.headers["etag"] == f'"{SHA}"'
+
+    # Fotos antigas (nome UUID) também recebem ETag forte e 304
+    antiga = cliente.get("/uploads/antiga.jpg")
+    assert antiga.headers["etag"].startswith('"') and not antiga.headers["etag"].startswith('W/')
+    assert cliente.get("/uploads/antiga.jpg", headers={"If-None-Match": antiga.headers["etag"]}).status_code == 304
+    print("  ✅ ETag forte, immutable e 304")
+
+
+def test_range():
+    print("🧪 Testando pedidos com Range...")
+    conteudo = os.urandom(600 * 1024)
+    cliente = cliente_com_foto(conteudo)
+    url = f"/uploads/ab/ab/{SHA}.jpg"
+
+    casos = {
+        "bytes=0-99": conteudo[:100],
+        "bytes=300000-": conteudo[300000:],
+        "bytes=-10": conteudo[-10:],
+    }
+    for valor, esperado in casos.items():
+        r = cliente.get(url, headers={"Range": valor})
+        assert r.status_code == 206, valor
+        assert r.content == esperado, valor
+        assert r.headers["content-length"] == str(len(esperado))
+
+    fora = cliente.get(url, headers={"Range": f"bytes={len(conteudo)}-"})
+    assert fora.status_code == 416 and fora.headers["content-range"] == f"bytes */{len(conteudo)}"
+    # If-Range de outra versão, vários intervalos ou sintaxe inválida: arquivo inteiro
+    for headers in ({"Range": "bytes=0-9", "If-Range": '"outra"'}, {"Range": "bytes=0-9,20-29"}, {"Range": "bytes=a-9"}):
+        r = cliente.get(url, headers=headers)
+        assert r.status_code == 200 and r.content == conteudo, headers
+    print("  ✅ 206, 416 e fallback para o arquivo inteiro")
+
+
+if __name__ == "__main__":
+    test_cache_imutavel_e_revalidacao()
+    test_range()
+    print("\n🎉 Testes de /uploads concluídos!")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Teste das assinaturas por tópico/região do WebSocket
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from connection_manager import ConnectionManager
+from subscriptions import SubscriptionIndex, parse_filtro
+from test_connection_manager import FakeWebSocket
+
+
+def test_indice_combina_dimensoes():
+    """Valores de uma dimensão são alternativos; dimensões diferentes se somam"""
+    print("🧪 Testando índice de assinaturas...")
+    indice = SubscriptionIndex(cell_degrees=0.5)
+    indice.add("todos")
+    indice.add("maputo", parse_filtro({"provincias": ["Maputo", "Gaza"]}))
+    indice.add("sos_maputo", parse_filtro({"eventos": ["emergency_created"], "provincias": ["Maputo"]}))
+    indice.add("posto", parse_filtro({"postos": "PRM Maputo Central"}))
+    indice.add("area", parse_filtro({"areas": [[-26.0, 32.5, -25.9, 32.7]]}))
+
+    assert set(indice.match("device_ping", "Maputo", "PRM Maputo Central", -25.95, 32.6)) == {
+        "todos", "maputo", "posto", "area"
+    }
+    assert set(indice.match("emergency_created", "Maputo", "PRM Matola", -19.8, 34.8)) == {
+        "todos", "maputo", "sos_maputo"
+    }
+    assert set(indice.match("device_ping", "Sofala", None, -19.8, 34.8)) == {"todos", "posto"}
+    # Sem atributos: só quem não filtra nada
+    assert indice.match() == ["todos"]
+
+    indice.remove("maputo")
+    indice.add("area", parse_filtro({"eventos": ["device_ping"]}))
+    assert set(indice.match("device_ping", "Maputo", "PRM Matola", -19.8, 34.8)) == {"todos", "area"}
+    assert len(indice) == 4
+    print("  ✅ Índice combina dimensões e áreas")
+
+
+def test_filtro_invalido():
+    for dados in ({"provincias": 3}, {"areas": [[1, 2, 3]]}, {"areas": [[10, 0, -10, 5]]},
+                  {"areas": 5}, {"areas": "abcd"}, {"areas": [[None, 1, 2, 3]]}, {"areas": [["x", 1, 2, 3]]}):
+        try:
+            parse_filtro(dados)
+        except ValueError:
+            continue
+        raise AssertionError(f"filtro aceito: {dados}")
+
+
+def test_publish_respeita_assinaturas():
+    """publish só entrega o evento às conexões cujo filtro combina"""
+    print("🧪 Testando roteamento do publish...")
+
+    async def cenario():
+        manager = ConnectionManager()
+        todos, gaza, sos = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for ws in (todos, gaza, sos):
+            await manager.connect(ws)
+        manager.subscribe(gaza, {"provincias": ["Gaza"]})
+        manager.subscribe(sos, {"eventos": ["emergency_created"]})
+
+        await manager.publish({"type": "device_ping", "latitude": -25.9, "longitude": 32.6}, provincia="Maputo")
+        await manager.publish({"type": "emergency_created", "latitude": -24.5, "longitude": 33.0}, provincia="Gaza")
+        manager.unsubscribe(gaza)
+        await manager.publish({"type": "device_ping"}, provincia="Maputo")
+        await asyncio.sleep(0.01)
+        for ws in (todos, gaza, sos):
+            manager.disconnect(ws)
+        return todos, gaza, sos
+
+    todos, gaza, sos = asyncio.run(cenario())
+    tipos = lambda ws: [json.loads(m)["type"] for m in ws.recebidas]
+    assert tipos(todos) == ["device_ping", "emergency_created", "device_ping"]
+    assert tipos(gaza) == ["emergency_created", "device_ping"]
+    assert tipos(sos) == ["emergency_created"]
+    print("  ✅ Eventos entregues apenas aos assinantes")
+
+
+def test_subscribe_invalido_pelo_socket():
+    """Filtro inválido responde com erro e a conexão é liberada ao sair"""
+    print("🧪 Testando subscribe inválido pelo /ws...")
+    with TestClient(main.app).websocket_connect("/ws") as ws:
+        ws.send_text(json.dumps({"type": "subscribe", "areas": 5}))
+        assert ws.receive_json()["type"] == "error"
+        ws.send_text(json.dumps({"type": "subscribe", "areas": [[None, 1, 2, 3]]}))
+        assert ws.receive_json()["type"] == "error"
+        ws.send_text(json.dumps({"type": "subscribe", "provincias": ["Gaza"]}))
+        assert ws.receive_json()["type"] == "subscribed"
+        assert len(main.manager.subscriptions) == 1
+    assert len(main.manager.active_connections) == 0
+    assert len(main.manager.subscriptions) == 0
+    print("  ✅ Erro devolvido e conexão removida")
+
+
+if __name__ == "__main__":
+    test_indice_combina_dimensoes()
+    test_filtro_invalido()
+    test_publish_respeita_assinaturas()
+    test_subscribe_invalido_pelo_socket()
+    print("\n🎉 Testes de assinaturas concluídos!")
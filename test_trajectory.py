@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Teste da simplificação de trajetos (Douglas–Peucker e agrupamento por tempo)
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+import main
+from main import trajeto_dispositivo
+from models import PingDispositivo
+from positions import PositionStore
+from test_cache import contar_queries, criar_banco_teste
+from trajectory import agrupar_por_tempo, douglas_peucker
+
+INICIO = datetime(2024, 5, 1, 12, 0, 0)
+# ~1 km para leste, ~1 km para norte e de volta ao ponto de partida
+CANTOS = [(-25.9700, 32.5700), (-25.9700, 32.5800), (-25.9610, 32.5800), (-25.9700, 32.5700)]
+
+
+def percurso(pontos_por_trecho: int = 240, ruido_m: float = 1.0) -> list:
+    """Pings a cada 5 s ao longo dos trechos, com ruído de GPS"""
+    aleatorio = random.Random(3)
+    grau = ruido_m / 111_000
+    pings = []
+    for (lat0, lng0), (lat1, lng1) in zip(CANTOS, CANTOS[1:]):
+        for i in range(pontos_por_trecho):
+            f = i / pontos_por_trecho
+            pings.append((lat0 + (lat1 - lat0) * f + aleatorio.uniform(-grau, grau),
+                          lng0 + (lng1 - lng0) * f + aleatorio.uniform(-grau, grau)))
+    pings.append(CANTOS[-1])
+    return pings
+
+
+def test_douglas_peucker_mantem_as_curvas():
+    pings = percurso()
+    lat, lng = [p[0] for p in pings], [p[1] for p in pings]
+    mantidos = douglas_peucker(lat, lng, 10)
+    assert mantidos[0] == 0 and mantidos[-1] == len(pings) - 1
+    # Os cantos e mais nada: o ruído de 1 m fica abaixo da tolerância
+    assert mantidos == [0, 240, 480, len(pings) - 1]
+    assert douglas_peucker(lat, lng, 0) == list(range(len(pings)))
+
+    # Ida e volta pela mesma reta: o ponto de retorno é mantido
+    ida_e_volta = douglas_peucker([0, 0, 0, 0, 0], [32.0, 32.005, 32.01, 32.005, 32.0], 10)
+    assert ida_e_volta == [0, 2, 4]
+
+
+def test_agrupar_por_tempo():
+    ts = [0, 3, 5, 9, 10, 19, 31]
+    assert agrupar_por_tempo(ts, 10) == [0, 4, 6]
+    assert agrupar_por_tempo(ts[:-1], 10) == [0, 4, 5]
+    assert agrupar_por_tempo(ts, 0) == list(range(len(ts)))
+
+
+def test_rota_de_trajeto_com_cache():
+    print("🧪 Testando rota de trajeto simplificado...")
+    engine, SessionTeste = criar_banco_teste()
+    db = SessionTeste()
+    pings = percurso()
+    db.add_all([
+        PingDispositivo(dispositivo_id=1, latitude=lat, longitude=lng, timestamp=INICIO + timedelta(seconds=5 * i),
+                        status_dispositivo="roubado", tipo_ping="stolen_device_ping", retido=True)
+        for i, (lat, lng) in enumerate(pings)
+    ])
+    db.commit()
+
+    anterior = main.posicoes
+    main.posicoes = PositionStore(SessionTeste)
+    main.trajeto_cache.clear()
+    try:
+        fim = INICIO + timedelta(hours=2)
+        trajeto = trajeto_dispositivo(1, desde=INICIO, ate=fim, tolerancia_m=10, intervalo_s=0, db=db, current_admin=None)
+        assert trajeto["pontos_originais"] == len(pings)
+        assert trajeto["pontos"] == 4
+        assert trajeto["ts"][1] - trajeto["ts"][0] == 240 * 5
+        assert math.isclose(trajeto["lat"][2], pings[480][0])
+
+        # Mesmo pedido: do cache, sem consultar o banco
+        queries = contar_queries(engine)
+        assert trajeto_dispositivo(1, desde=INICIO, ate=fim, tolerancia_m=10, intervalo_s=0, db=db, current_admin=None) is trajeto
+        assert queries["total"] == 0
+
+        agrupado = trajeto_dispositivo(1, desde=INICIO, ate=fim, tolerancia_m=0, intervalo_s=60, db=db, current_admin=None)
+        # Um ping por minuto: 0..60 min (o último ping abre o minuto 60)
+        assert agrupado["pontos"] == 61
+
+        # Período aberto termina na posição em memória, ainda não gravada pela fila
+        agora = datetime.utcnow()
+        main.posicoes.atualizar(1, -25.95, 32.60, agora)
+        aberto = trajeto_dispositivo(1, desde=INICIO, ate=None, tolerancia_m=10, intervalo_s=0, db=db, current_admin=None)
+        assert (aberto["lat"][-1], aberto["lng"][-1]) == (-25.95, 32.60)
+        assert aberto["pontos"] == 5
+    finally:
+        main.posicoes = anterior
+        db.close()
+    print("  ✅ Uma hora de pings (a cada 5 s) reduzida aos cantos do percurso")
+
+
+if __name__ == "__main__":
+    test_douglas_peucker_mantem_as_curvas()
+    test_agrupar_por_tempo()
+    test_rota_de_trajeto_com_cache()
+    print("\n🎉 Testes de trajeto concluídos!")
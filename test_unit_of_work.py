@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Teste da sessão de banco por conexão WebSocket
+"""
+import asyncio
+
+from sqlalchemy import select
+
+from models import Dispositivo
+from test_async_db import criar_banco_async
+from unit_of_work import ConnectionUnitOfWork
+
+
+def test_reutiliza_e_recicla_a_sessao():
+    """Uma sessão para várias mensagens, renovada a cada recycle_after"""
+    print("🧪 Testando reutilização da sessão por conexão...")
+    engine, SessionAsync = criar_banco_async()
+
+    async def cenario():
+        uow = ConnectionUnitOfWork(SessionAsync, recycle_after=4)
+        sessoes = []
+        for _ in range(6):
+            async with uow.unidade() as db:
+                await db.execute(select(Dispositivo.id))
+                sessoes.append(db)
+            # Transação encerrada entre mensagens: nenhuma conexão presa ao socket
+            assert uow._session is None or not uow._session.in_transaction()
+        await uow.close()
+        await engine.dispose()
+        return uow.stats(), len({id(db) for db in sessoes})
+
+    stats, distintas = asyncio.run(cenario())
+    assert stats["total_units"] == 6
+    assert stats["total_sessions"] == 2 and stats["total_recycles"] == 1
+    assert distintas == 2
+    print("  ✅ Sessão reutilizada e reciclada após N mensagens")
+
+
+def test_descarta_a_sessao_apos_erro():
+    print("🧪 Testando descarte da sessão após erro...")
+    engine, SessionAsync = criar_banco_async()
+
+    async def cenario():
+        uow = ConnectionUnitOfWork(SessionAsync)
+        try:
+            async with uow.unidade() as db:
+                db.add(Dispositivo(imei="111111111111111", usuario_id=1))
+                await db.flush()  # IMEI duplicado
+        except Exception:
+            pass
+        else:
+            raise AssertionError("flush deveria falhar")
+
+        # A próxima mensagem recebe uma sessão nova, sem a escrita com erro
+        async with uow.unidade() as db:
+            total = len((await db.execute(select(Dispositivo.id))).all())
+        await uow.close()
+        await engine.dispose()
+        return uow.stats(), total
+
+    stats, total = asyncio.run(cenario())
+    assert total == 2
+    assert stats["total_errors"] == 1 and stats["total_sessions"] == 2
+    print("  ✅ Sessão descartada e recriada após erro")
+
+
+if __name__ == "__main__":
+    test_reutiliza_e_recicla_a_sessao()
+    test_descarta_a_sessao_apos_erro()
+    print("\n🎉 Testes da sessão por conexão concluídos!")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Teste da gravação de uploads em blocos (limite incremental e rename atômico)
+e do armazenamento por conteúdo (deduplicação e limpeza de órfãos)
+"""
+import asyncio
+import io
+import os
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import UploadFile
+
+from PIL import Image
+
+from models import ArquivoUpload
+from test_cache import criar_banco_teste
+from uploads import PhotoStore, UploadTooLarge, salvar_upload
+from variants import VariantWorker, caminho_variante
+
+
+def arquivo(conteudo: bytes, informar_tamanho: bool = True) -> UploadFile:
+    return UploadFile(io.BytesIO(conteudo), size=len(conteudo) if informar_tamanho else None, filename="casa.jpg")
+
+
+def test_grava_em_blocos_sem_carregar_na_memoria():
+    print("🧪 Testando upload em blocos...")
+    pasta = Path(tempfile.mkdtemp())
+    conteudo = os.urandom(5 * 1024 * 1024)
+    upload = arquivo(conteudo)
+    # Aquecimento: importações feitas na primeira chamada não entram na medição
+    asyncio.run(salvar_upload(arquivo(b"x"), pasta / "aquecimento.jpg", 10))
+    os.remove(pasta / "aquecimento.jpg")
+
+    tracemalloc.start()
+    tamanho = asyncio.run(salvar_upload(upload, pasta / "casa.jpg", 6 * 1024 * 1024))
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert tamanho == len(conteudo)
+    assert (pasta / "casa.jpg").read_bytes() == conteudo
+    assert os.listdir(pasta) == ["casa.jpg"]
+    # Nunca mais que alguns blocos em memória (read() inteiro seriam 5 MB)
+    assert pico < 1024 * 1024, pico
+    print(f"  ✅ 5 MB gravados com pico de {pico // 1024} KB")
+
+
+def test_limite_incremental_nao_deixa_arquivo():
+    print("🧪 Testando limite de tamanho durante o upload...")
+    pasta = Path(tempfile.mkdtemp())
+    for informar_tamanho in (True, False):
+        try:
+            asyncio.run(salvar_upload(arquivo(b"x" * 1000, informar_tamanho), pasta / "grande.jpg", 999, chunk_size=100))
+        except UploadTooLarge:
+            pass
+        else:
+            raise AssertionError("upload acima do limite aceito")
+    # Nem o destino nem o temporário ficam no diretório
+    assert os.listdir(pasta) == []
+    print("  ✅ Upload grande recusado sem arquivo parcial")
+
+
+def enviar_foto(store: PhotoStore, SessionTeste, conteudo: bytes, url_anterior=None) -> str:
+    """Mesmo fluxo das rotas: receber, referenciar/liberar, commit, confirmar"""
+    foto = asyncio.run(store.receber(arquivo(conteudo), 1024 * 1024))
+    db = SessionTeste()
+    store.referenciar(db, foto)
+    store.liberar(db, url_anterior)
+    db.commit()
+    db.close()
+    asyncio.run(store.confirmar(foto))
+    return foto.url
+
+
+def test_fotos_iguais_gravadas_uma_vez():
+    print("🧪 Testando deduplicação de fotos...")
+    _, SessionTeste = criar_banco_teste()
+    raiz = Path(tempfile.mkdtemp())
+    store = PhotoStore(raiz, SessionTeste)
+
+    conteudo = os.urandom(4096)
+    url_1 = enviar_foto(store, SessionTeste, conteudo)
+    url_2 = enviar_foto(store, SessionTeste, conteudo)
+
+    assert url_1 == url_2
+    assert url_1.startswith("/uploads/") and url_1.endswith(".jpg")
+    arquivos = [p for p in raiz.rglob("*") if p.is_file()]
+    assert len(arquivos) == 1 and arquivos[0].read_bytes() == conteudo
+
+    db = SessionTeste()
+    registro = db.query(ArquivoUpload).one()
+    db.close()
+    assert registro.referencias == 2
+    assert store.stats()["total_deduplicated"] == 1
+    print("  ✅ Duas fotos iguais, um arquivo com duas referências")
+
+
+def test_descartar_mantem_foto_de_outro_upload():
+    """Commit do primeiro upload falha depois que outro upload da mesma foto confirmou"""
+    print("🧪 Testando descarte com upload concorrente da mesma foto...")
+    _, SessionTeste = criar_banco_teste()
+    raiz = Path(tempfile.mkdtemp())
+    store = PhotoStore(raiz, SessionTeste)
+
+    conteudo = os.urandom(4096)
+    primeira = asyncio.run(store.receber(arquivo(conteudo), 1024 * 1024))
+    assert primeira.criou
+    url = enviar_foto(store, SessionTeste, conteudo)
+    asyncio.run(store.descartar(primeira))
+    assert (raiz / url[len("/uploads/"):]).read_bytes() == conteudo
+
+    # Sem outro upload registrado o arquivo criado é desfeito
+    sozinha = asyncio.run(store.receber(arquivo(b"outra foto"), 1024 * 1024))
+    asyncio.run(store.descartar(sozinha))
+    assert not (raiz / sozinha.caminho).exists()
+    assert [p.name for p in raiz.rglob("*") if p.is_file()] == [Path(url).name]
+    print("  ✅ Foto referenciada preservada")
+
+
+def test_varredura_remove_so_orfaos():
+    print("🧪 Testando limpeza de fotos sem referência...")
+    _, SessionTeste = criar_banco_teste()
+    raiz = Path(tempfile.mkdtemp())
+    store = PhotoStore(raiz, SessionTeste, grace_seconds=60)
+
+    antiga = enviar_foto(store, SessionTeste, b"foto antiga")
+    atual = enviar_foto(store, SessionTeste, b"foto nova", url_anterior=antiga)
+
+    # Dentro da carência nada é apagado
+    assert store.sweep() == 0
+    assert store.sweep(agora=datetime.utcnow() + timedelta(minutes=5)) == 1
+
+    db = SessionTeste()
+    caminhos = {r.caminho: r.referencias for r in db.query(ArquivoUpload).all()}
+    db.close()
+    assert caminhos == {atual[len("/uploads/"):]: 1}
+    assert not (raiz / antiga[len("/uploads/"):]).exists()
+    assert (raiz / atual[len("/uploads/"):]).read_bytes() == b"foto nova"
+    print("  ✅ Foto substituída removida, foto em uso preservada")
+
+
+def test_variantes_com_fallback_para_o_original():
+    print("🧪 Testando variantes redimensionadas...")
+    _, SessionTeste = criar_banco_teste()
+    raiz = Path(tempfile.mkdtemp())
+    variantes = VariantWorker(raiz)
+    store = PhotoStore(raiz, SessionTeste, grace_seconds=60, ao_remover=variantes.remover)
+
+    jpeg = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (200, 30, 30)).save(jpeg, "JPEG")
+    url = enviar_foto(store, SessionTeste, jpeg.getvalue())
+    caminho = url[len("/uploads/"):]
+
+    # Geração pendente: serve o original e agenda uma vez só
+    assert asyncio.run(variantes.resolver(caminho, "miniatura")) == caminho
+    assert asyncio.run(variantes.resolver(caminho, "media")) == caminho
+    assert variantes.stats()["queued"] == 1
+
+    assert variantes.gerar(caminho) == 3
+    assert asyncio.run(variantes.resolver(caminho, "miniatura")) == caminho_variante(caminho, "miniatura")
+    with Image.open(raiz / caminho_variante(caminho, "miniatura")) as miniatura:
+        assert miniatura.format == "WEBP" and miniatura.size == (200, 150)
+    with Image.open(raiz / caminho_variante(caminho, "webp")) as webp:
+        assert webp.size == (1600, 1200)
+    # Variantes não viram originais nem saem da raiz
+    assert asyncio.run(variantes.resolver(caminho_variante(caminho, "media"), "miniatura")) == caminho_variante(caminho, "media")
+    assert asyncio.run(variantes.resolver("../fora.jpg", "miniatura")) == "../fora.jpg"
+
+    # A limpeza do original leva as variantes junto
+    enviar_foto(store, SessionTeste, b"outra foto", url_anterior=url)
+    assert store.sweep(agora=datetime.utcnow() + timedelta(minutes=5)) == 1
+    assert not list((raiz / caminho).parent.glob(Path(caminho).stem + "*"))
+    print("  ✅ Original servido até a geração; variantes removidas com a foto")
+
+
+if __name__ == "__main__":
+    test_grava_em_blocos_sem_carregar_na_memoria()
+    test_limite_incremental_nao_deixa_arquivo()
+    test_fotos_iguais_gravadas_uma_vez()
+    test_descartar_mantem_foto_de_outro_upload()
+    test_varredura_remove_so_orfaos()
+    test_variantes_com_fallback_para_o_original()
+    print("\n🎉 Testes de upload concluídos!")
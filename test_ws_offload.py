@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Teste do processamento das mensagens de dispositivo fora do loop do /ws
+"""
+import asyncio
+import json
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+import main
+from config import settings
+from test_async_db import criar_banco_async
+from unit_of_work import ConnectionUnitOfWork
+
+
+def test_limite_por_conexao():
+    """Nunca há mais que WS_MAX_INFLIGHT_PER_CONNECTION mensagens em processamento"""
+    print("🧪 Testando limite de mensagens simultâneas por conexão...")
+    em_andamento = {"atual": 0, "maximo": 0, "total": 0}
+
+    async def processar_lento(websocket, payload, recebido_em, uow):
+        em_andamento["atual"] += 1
+        em_andamento["maximo"] = max(em_andamento["maximo"], em_andamento["atual"])
+        await asyncio.sleep(0.01)
+        em_andamento["atual"] -= 1
+        em_andamento["total"] += 1
+
+    original, limite_original = main.processar_mensagem_dispositivo, settings.WS_MAX_INFLIGHT_PER_CONNECTION
+    main.processar_mensagem_dispositivo = processar_lento
+    settings.WS_MAX_INFLIGHT_PER_CONNECTION = 3
+    try:
+        with TestClient(main.app).websocket_connect("/ws") as ws:
+            for i in range(20):
+                ws.send_text(json.dumps({"type": "device_ping", "imei": "111111111111111",
+                                         "latitude": -25.9, "longitude": 32.5 + i}))
+    finally:
+        main.processar_mensagem_dispositivo = original
+        settings.WS_MAX_INFLIGHT_PER_CONNECTION = limite_original
+
+    assert em_andamento["maximo"] == 3
+    # Mensagens aceitas antes da desconexão terminam de ser processadas
+    assert em_andamento["total"] == 20
+    print("  ✅ Limite respeitado e nenhuma mensagem perdida")
+
+
+def test_ping_ws_vai_para_a_fila_de_ingestao():
+    """Ping pelo WebSocket é enfileirado com o horário da recepção"""
+    print("🧪 Testando ping do WebSocket pela fila de ingestão...")
+    engine, SessionAsync = criar_banco_async()
+    main.device_cache.clear()
+    enfileirados = []
+    enqueue_original = main.ping_ingest.enqueue
+    main.ping_ingest.enqueue = lambda ping, novo_status=None, anterior=None: enfileirados.append((ping, novo_status))
+    recebido_em = datetime(2026, 10, 1, 12, 0)
+
+    async def cenario():
+        uow = ConnectionUnitOfWork(SessionAsync)
+        await main.processar_mensagem_dispositivo(None, {
+            "type": "stolen_device_ping", "imei": "111111111111111", "latitude": -25.9, "longitude": 32.5
+        }, recebido_em, uow)
+        await uow.close()
+        main.ping_coalescer.close()
+        await engine.dispose()
+
+    try:
+        asyncio.run(cenario())
+    finally:
+        main.ping_ingest.enqueue = enqueue_original
+
+    ping, novo_status = enfileirados[0]
+    assert ping["timestamp"] == recebido_em
+    assert ping["retido"] is True and novo_status == "roubado"
+    assert main.device_cache.get_by_imei(None, "111111111111111")["status"] == "roubado"
+    main.device_cache.clear()
+    print("  ✅ Ping enfileirado e status atualizado no cache")
+
+
+def test_ping_ws_com_coordenadas_invalidas():
+    """Ping sem coordenadas válidas é recusado antes da fila de ingestão"""
+    print("🧪 Testando ping do WebSocket com coordenadas inválidas...")
+    enfileirados, enviados = [], []
+    enqueue_original, envio_original = main.ping_ingest.enqueue, main.manager.send_personal_message
+    main.ping_ingest.enqueue = lambda ping, novo_status=None, anterior=None: enfileirados.append(ping)
+
+    async def enviar(mensagem, websocket):
+        enviados.append(json.loads(mensagem))
+
+    main.manager.send_personal_message = enviar
+    try:
+        for lat in (None, "abc", 91):
+            asyncio.run(main.processar_ping_ws(None, {
+                "type": "device_ping", "imei": "111111111111111", "latitude": lat, "longitude": 32.5
+            }, datetime(2026, 10, 1, 12, 0), None))
+    finally:
+        main.ping_ingest.enqueue = enqueue_original
+        main.manager.send_personal_message = envio_original
+
+    assert enfileirados == []
+    assert [m["type"] for m in enviados] == ["error"] * 3
+    print("  ✅ Nenhum ping inválido enfileirado")
+
+
+if __name__ == "__main__":
+    test_limite_por_conexao()
+    test_ping_ws_vai_para_a_fila_de_ingestao()
+    test_ping_ws_com_coordenadas_invalidas()
+    print("\n🎉 Testes do processamento do /ws concluídos!")
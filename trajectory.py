@@ -0,0 +1,118 @@
+"""
+Trajetos simplificados dos dispositivos (Douglas–Peucker)
+
+Um telefone roubado que envia um ping a cada 5 s gera milhares de pontos
+quase iguais por hora. O trajeto é reduzido em dois passos opcionais:
+agrupamento por tempo (o primeiro ping de cada intervalo, como no
+downsampling da retenção) e Douglas–Peucker com tolerância em metros,
+que remove os pontos a menos de `tolerancia_m` do segmento que os
+substitui. O primeiro e o último ponto são sempre mantidos.
+
+As coordenadas são projetadas em metros (equiretangular em torno da
+latitude média, erro desprezível na escala de uma cidade). As distâncias
+ponto-segmento de cada passo são calculadas em bloco com numpy quando
+disponível; sem numpy o mesmo cálculo é feito em Python puro.
+"""
+import math
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional
+    np = None
+
+RAIO_TERRA_M = 6371008.8
+
+
+def agrupar_por_tempo(ts: Sequence[float], intervalo_s: float) -> List[int]:
+    """Índices do primeiro ponto de cada intervalo (e do último ponto)"""
+    if intervalo_s <= 0 or len(ts) < 3:
+        return list(range(len(ts)))
+    indices = []
+    balde_anterior = None
+    for i, segundos in enumerate(ts):
+        balde = segundos // intervalo_s
+        if balde != balde_anterior:
+            indices.append(i)
+            balde_anterior = balde
+    if indices[-1] != len(ts) - 1:
+        indices.append(len(ts) - 1)
+    return indices
+
+
+def projetar(lat: Sequence[float], lng: Sequence[float]) -> Tuple[list, list]:
+    """Coordenadas em metros num plano local (equiretangular)"""
+    lat0 = math.radians(sum(lat) / len(lat))
+    escala_x = RAIO_TERRA_M * math.cos(lat0)
+    if np is not None:
+        return (np.radians(np.asarray(lng, dtype=float)) * escala_x,
+                np.radians(np.asarray(lat, dtype=float)) * RAIO_TERRA_M)
+    return ([math.radians(v) * escala_x for v in lng], [math.radians(v) * RAIO_TERRA_M for v in lat])
+
+
+def _mais_distante(x, y, inicio: int, fim: int) -> Tuple[int, float]:
+    """Ponto entre inicio e fim mais distante do segmento inicio–fim: (índice, distância²)"""
+    x0, y0 = x[inicio], y[inicio]
+    dx, dy = x[fim] - x0, y[fim] - y0
+    comprimento2 = dx * dx + dy * dy
+    if np is not None:
+        px = x[inicio + 1:fim] - x0
+        py = y[inicio + 1:fim] - y0
+        if comprimento2 > 0:
+            # Projeção limitada ao segmento: volta ao ponto inicial não é "na reta"
+            t = np.clip((px * dx + py * dy) / comprimento2, 0.0, 1.0)
+            px = px - t * dx
+            py = py - t * dy
+        d2 = px * px + py * py
+        k = int(np.argmax(d2))
+        return inicio + 1 + k, float(d2[k])
+
+    melhor, melhor_d2 = inicio + 1, -1.0
+    for i in range(inicio + 1, fim):
+        px, py = x[i] - x0, y[i] - y0
+        if comprimento2 > 0:
+            t = min(max((px * dx + py * dy) / comprimento2, 0.0), 1.0)
+            px, py = px - t * dx, py - t * dy
+        d2 = px * px + py * py
+        if d2 > melhor_d2:
+            melhor, melhor_d2 = i, d2
+    return melhor, melhor_d2
+
+
+def douglas_peucker(lat: Sequence[float], lng: Sequence[float], tolerancia_m: float) -> List[int]:
+    """Índices dos pontos mantidos pela simplificação, em ordem"""
+    total = len(lat)
+    if total < 3 or tolerancia_m <= 0:
+        return list(range(total))
+    x, y = projetar(lat, lng)
+    tolerancia2 = tolerancia_m * tolerancia_m
+    manter = [False] * total
+    manter[0] = manter[-1] = True
+    # Pilha em vez de recursão: trajetos longos passariam do limite de recursão
+    pilha = [(0, total - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        k, d2 = _mais_distante(x, y, inicio, fim)
+        if d2 > tolerancia2:
+            manter[k] = True
+            pilha.append((inicio, k))
+            pilha.append((k, fim))
+    return [i for i, mantido in enumerate(manter) if mantido]
+
+
+def simplificar(
+    ts: Sequence[float],
+    lat: Sequence[float],
+    lng: Sequence[float],
+    tolerancia_m: float,
+    intervalo_s: float = 0,
+) -> Tuple[List[float], List[float], List[float]]:
+    """Trajeto (ts, lat, lng) agrupado por tempo e simplificado"""
+    indices = agrupar_por_tempo(ts, intervalo_s)
+    ts = [ts[i] for i in indices]
+    lat = [lat[i] for i in indices]
+    lng = [lng[i] for i in indices]
+    mantidos = douglas_peucker(lat, lng, tolerancia_m)
+    return [ts[i] for i in mantidos], [lat[i] for i in mantidos], [lng[i] for i in mantidos]
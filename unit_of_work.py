@@ -0,0 +1,75 @@
+"""
+Sessão de banco por conexão WebSocket
+
+Em vez de criar e descartar uma sessão a cada mensagem, cada conexão
+reutiliza uma AsyncSession. As mensagens da mesma conexão usam a sessão
+uma de cada vez; cada unidade termina com commit, o que encerra a
+transação e devolve a conexão ao pool entre mensagens (nenhuma conexão do
+pool fica presa a um socket ocioso). A sessão é descartada após um erro e
+reciclada a cada N mensagens.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class ConnectionUnitOfWork:
+    """AsyncSession reutilizada pelas mensagens de uma conexão"""
+
+    def __init__(self, session_factory: Callable[[], AsyncSession], recycle_after: int = 500):
+        self.session_factory = session_factory
+        self.recycle_after = max(recycle_after, 1)
+        self._session: Optional[AsyncSession] = None
+        self._usos = 0
+        self._lock = asyncio.Lock()
+
+        # Métricas
+        self.total_units = 0
+        self.total_sessions = 0
+        self.total_recycles = 0
+        self.total_errors = 0
+
+    @asynccontextmanager
+    async def unidade(self) -> AsyncIterator[AsyncSession]:
+        """Sessão para processar uma mensagem; commit ao sair, descarte em caso de erro"""
+        async with self._lock:
+            if self._session is None:
+                self._session = self.session_factory()
+                self._usos = 0
+                self.total_sessions += 1
+            db = self._session
+            try:
+                yield db
+                await db.commit()
+            except BaseException:
+                self.total_errors += 1
+                await self._descartar()
+                raise
+
+            self.total_units += 1
+            self._usos += 1
+            if self._usos >= self.recycle_after:
+                self.total_recycles += 1
+                await self._descartar()
+
+    async def close(self) -> None:
+        """Fechar a sessão (fim da conexão)"""
+        async with self._lock:
+            await self._descartar()
+
+    async def _descartar(self) -> None:
+        db, self._session = self._session, None
+        if db is not None:
+            # close() faz rollback do que não foi confirmado
+            await db.close()
+
+    def stats(self) -> dict:
+        return {
+            "recycle_after": self.recycle_after,
+            "total_units": self.total_units,
+            "total_sessions": self.total_sessions,
+            "total_recycles": self.total_recycles,
+            "total_errors": self.total_errors,
+        }
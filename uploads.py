@@ -0,0 +1,364 @@
+"""
+Gravação de uploads em disco sem carregar o arquivo na memória
+
+O conteúdo é lido em blocos do UploadFile e escrito num arquivo temporário
+no próprio diretório de destino, conferindo o limite de tamanho a cada
+bloco. Só no fim o temporário é renomeado (os.replace, atômico no mesmo
+sistema de arquivos) para o nome final: um upload interrompido ou grande
+demais nunca deixa um arquivo parcial visível em /uploads. As escritas
+rodam no threadpool, fora do event loop.
+
+As fotos de residência são endereçadas pelo conteúdo (PhotoStore): o
+caminho é o SHA-256 do arquivo, em subdiretórios pelos primeiros bytes do
+hash (ab/cd/abcd....jpg), de modo que a mesma foto enviada de novo ocupa
+um único arquivo. A tabela arquivos_upload conta quantos usuários apontam
+para cada arquivo; arquivos sem referências são removidos por uma
+varredura periódica, depois de um período de carência.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models import ArquivoUpload
+
+CHUNK_SIZE = 256 * 1024
+PREFIXO_URL = "/uploads/"
+PREFIXO_TEMPORARIO = ".upload-"
+
+
+class UploadTooLarge(Exception):
+    """Arquivo maior que o limite permitido"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Arquivo maior que {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+async def gravar_temporario(
+    arquivo: UploadFile,
+    pasta: Path,
+    max_bytes: int,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[str, int, str]:
+    """Gravar o upload num temporário em pasta; retorna (caminho, tamanho, sha256)"""
+    # Tamanho informado pelo multipart: recusar cedo sem ler nada
+    if arquivo.size is not None and arquivo.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    fd, temporario = await run_in_threadpool(
+        tempfile.mkstemp, dir=pasta, prefix=PREFIXO_TEMPORARIO, suffix=".part"
+    )
+    digest = hashlib.sha256()
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as saida:
+            while True:
+                bloco = await arquivo.read(chunk_size)
+                if not bloco:
+                    break
+                total += len(bloco)
+                if total > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                await run_in_threadpool(_escrever, saida, digest, bloco)
+            await run_in_threadpool(_sincronizar, saida)
+    except BaseException:
+        await run_in_threadpool(_remover, temporario)
+        raise
+    finally:
+        await arquivo.close()
+    return temporario, total, digest.hexdigest()
+
+
+async def salvar_upload(arquivo: UploadFile, destino: Path, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """Gravar o upload em destino, em blocos; retorna o tamanho em bytes"""
+    temporario, total, _ = await gravar_temporario(arquivo, destino.parent, max_bytes, chunk_size)
+    try:
+        await run_in_threadpool(os.replace, temporario, destino)
+    except BaseException:
+        await run_in_threadpool(_remover, temporario)
+        raise
+    return total
+
+
+def _escrever(saida, digest, bloco: bytes) -> None:
+    saida.write(bloco)
+    digest.update(bloco)
+
+
+def _sincronizar(saida) -> None:
+    saida.flush()
+    os.fsync(saida.fileno())
+
+
+def _remover(caminho) -> None:
+    try:
+        os.unlink(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def caminho_por_conteudo(sha256: str, extensao: str) -> str:
+    """Caminho relativo a UPLOAD_DIR: dois níveis de subdiretórios pelo hash"""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{extensao}"
+
+
+def caminho_da_url(url: Optional[str]) -> Optional[str]:
+    """"/uploads/ab/cd/x.jpg" → "ab/cd/x.jpg" (None se não for um upload local)"""
+    if not url or not url.startswith(PREFIXO_URL):
+        return None
+    return url[len(PREFIXO_URL):]
+
+
+@dataclass
+class FotoRecebida:
+    """Upload gravado, aguardando o commit que o referencia"""
+    caminho: str
+    sha256: str
+    tamanho: int
+    temporario: str
+    # True se este upload criou o arquivo final (não havia cópia idêntica)
+    criou: bool
+
+    @property
+    def url(self) -> str:
+        return PREFIXO_URL + self.caminho
+
+
+class PhotoStore:
+    """Fotos endereçadas pelo conteúdo, com contagem de referências
+
+    Ordem usada pelas rotas: receber() grava o temporário e liga o arquivo
+    final; referenciar()/liberar() entram na mesma transação que altera o
+    usuário; depois do commit, confirmar() (ou descartar() se o commit
+    falhar). confirmar() recoloca o arquivo final se a varredura o tiver
+    removido entre receber() e o commit.
+    """
+
+    def __init__(
+        self,
+        raiz: Path,
+        session_factory: Callable[[], Session],
+        grace_seconds: float = 3600.0,
+        interval_seconds: float = 3600.0,
+        ao_remover: Optional[Callable[[str], None]] = None,
+    ):
+        self.raiz = Path(raiz)
+        self.session_factory = session_factory
+        self.grace = grace_seconds
+        self.interval = interval_seconds
+        # Chamado com o caminho de cada arquivo apagado pela varredura
+        # (ex.: remover as variantes redimensionadas)
+        self.ao_remover = ao_remover
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.total_received = 0
+        self.total_deduplicated = 0
+        self.total_swept = 0
+        self.total_sweeps = 0
+        self.total_errors = 0
+        self.last_sweep_ms = 0.0
+
+    # -- Uploads ------------------------------------------------------------
+
+    async def receber(self, arquivo: UploadFile, max_bytes: int) -> FotoRecebida:
+        extensao = Path(arquivo.filename or "").suffix.lower()
+        temporario, tamanho, sha256 = await gravar_temporario(arquivo, self.raiz, max_bytes)
+        caminho = caminho_por_conteudo(sha256, extensao)
+        try:
+            criou = await run_in_threadpool(self._ligar, temporario, caminho)
+        except BaseException:
+            await run_in_threadpool(_remover, temporario)
+            raise
+        self.total_received += 1
+        if not criou:
+            self.total_deduplicated += 1
+        return FotoRecebida(caminho, sha256, tamanho, temporario, criou)
+
+    def _ligar(self, temporario: str, caminho: str) -> bool:
+        destino = self.raiz / caminho
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Hard link: o temporário continua existindo até confirmar()
+            os.link(temporario, destino)
+        except FileExistsError:
+            return False
+        return True
+
+    async def confirmar(self, foto: FotoRecebida) -> None:
+        """Após o commit: garantir o arquivo final e apagar o temporário"""
+        await run_in_threadpool(self._confirmar, foto)
+
+    def _confirmar(self, foto: FotoRecebida) -> None:
+        destino = self.raiz / foto.caminho
+        if destino.exists():
+            _remover(foto.temporario)
+        else:
+            os.replace(foto.temporario, destino)
+
+    async def descartar(self, foto: FotoRecebida) -> None:
+        """Commit falhou: desfazer o que receber() gravou"""
+        await run_in_threadpool(self._descartar, foto)
+
+    def _descartar(self, foto: FotoRecebida) -> None:
+        _remover(foto.temporario)
+        if foto.criou:
+            # Só sem registro da foto: outro upload dela que já fez commit
+            # depende deste arquivo; um que ainda não fez o recoloca no
+            # próprio confirmar()
+            db = self.session_factory()
+            try:
+                self._remover_arquivo(db, foto.caminho)
+            finally:
+                db.close()
+
+    # -- Referências (sem commit; na transação da rota) -------------------
+
+    def referenciar(self, db: Session, foto: FotoRecebida) -> None:
+        """+1 referência para a foto recebida (cria o registro se preciso)"""
+        incremento = (
+            update(ArquivoUpload)
+            .where(ArquivoUpload.caminho == foto.caminho)
+            .values(referencias=ArquivoUpload.referencias + 1, atualizado_em=datetime.utcnow())
+        )
+        if db.execute(incremento).rowcount:
+            return
+        try:
+            with db.begin_nested():
+                db.add(ArquivoUpload(caminho=foto.caminho, sha256=foto.sha256, tamanho=foto.tamanho,
+                                     referencias=1, atualizado_em=datetime.utcnow()))
+        except IntegrityError:
+            # Outro upload da mesma foto criou o registro ao mesmo tempo
+            db.execute(incremento)
+
+    def referenciar_url(self, db: Session, url: Optional[str]) -> None:
+        """+1 referência para uma URL já existente (atribuída sem upload)"""
+        caminho = caminho_da_url(url)
+        if caminho is not None:
+            db.execute(
+                update(ArquivoUpload)
+                .where(ArquivoUpload.caminho == caminho)
+                .values(referencias=ArquivoUpload.referencias + 1, atualizado_em=datetime.utcnow())
+            )
+
+    def liberar(self, db: Session, url: Optional[str]) -> None:
+        """-1 referência; fotos antigas sem registro entram com zero, para a varredura"""
+        caminho = caminho_da_url(url)
+        if caminho is None:
+            return
+        agora = datetime.utcnow()
+        alterados = db.execute(
+            update(ArquivoUpload)
+            .where(ArquivoUpload.caminho == caminho, ArquivoUpload.referencias > 0)
+            .values(referencias=ArquivoUpload.referencias - 1, atualizado_em=agora)
+        ).rowcount
+        if not alterados and db.execute(
+            select(ArquivoUpload.id).where(ArquivoUpload.caminho == caminho)
+        ).first() is None:
+            db.add(ArquivoUpload(caminho=caminho, referencias=0, atualizado_em=agora))
+
+    # -- Varredura de órfãos -----------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await run_in_threadpool(self.sweep)
+            except Exception as e:
+                self.total_errors += 1
+                print(f"❌ Erro na limpeza de uploads órfãos: {e}")
+
+    def sweep(self, agora: Optional[datetime] = None) -> int:
+        """Remover arquivos sem referências há mais que a carência; retorna quantos"""
+        agora = agora or datetime.utcnow()
+        limite = agora - timedelta(seconds=self.grace)
+        inicio = time.perf_counter()
+        removidos = 0
+
+        db = self.session_factory()
+        try:
+            orfaos = db.execute(
+                select(ArquivoUpload.id, ArquivoUpload.caminho)
+                .where(ArquivoUpload.referencias == 0, ArquivoUpload.atualizado_em < limite)
+            ).all()
+            for arquivo_id, caminho in orfaos:
+                # Apagar o registro só se continuar sem referências
+                apagado = db.execute(
+                    delete(ArquivoUpload)
+                    .where(ArquivoUpload.id == arquivo_id, ArquivoUpload.referencias == 0)
+                ).rowcount
+                db.commit()
+                if apagado and self._remover_arquivo(db, caminho):
+                    removidos += 1
+        finally:
+            db.close()
+
+        self._remover_temporarios_antigos()
+        self.total_swept += removidos
+        self.total_sweeps += 1
+        self.last_sweep_ms = (time.perf_counter() - inicio) * 1000
+        return removidos
+
+    def _remover_arquivo(self, db: Session, caminho: str) -> bool:
+        destino = self.raiz / caminho
+        lixo = destino.with_name(destino.name + ".lixo")
+        try:
+            os.replace(destino, lixo)
+        except FileNotFoundError:
+            return False
+        # Um upload da mesma foto pode ter recriado o registro enquanto isso:
+        # nesse caso o arquivo volta para o lugar
+        if db.execute(select(ArquivoUpload.id).where(ArquivoUpload.caminho == caminho)).first() is not None:
+            os.replace(lixo, destino)
+            return False
+        _remover(lixo)
+        if self.ao_remover is not None:
+            self.ao_remover(caminho)
+        return True
+
+    def _remover_temporarios_antigos(self) -> None:
+        """Temporários de uploads interrompidos (processo encerrado no meio)"""
+        corte = time.time() - self.grace
+        for temporario in self.raiz.glob(PREFIXO_TEMPORARIO + "*.part"):
+            try:
+                if temporario.stat().st_mtime < corte:
+                    temporario.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "grace_seconds": self.grace,
+            "interval_seconds": self.interval,
+            "total_received": self.total_received,
+            "total_deduplicated": self.total_deduplicated,
+            "total_swept": self.total_swept,
+            "total_sweeps": self.total_sweeps,
+            "total_errors": self.total_errors,
+            "last_sweep_ms": round(self.last_sweep_ms, 2),
+        }
@@ -0,0 +1,186 @@
+"""
+Variantes redimensionadas das fotos de residência (miniatura, média, WebP)
+
+As listagens do dashboard não precisam da foto original. Depois do commit
+do upload a foto entra numa fila e uma tarefa em segundo plano gera, no
+threadpool, as variantes em WebP ao lado do original:
+
+    ab/cd/<sha256>.jpg  ->  ab/cd/<sha256>.miniatura.webp
+                            ab/cd/<sha256>.media.webp
+                            ab/cd/<sha256>.webp.webp
+
+GET /uploads/...?variante=miniatura serve a variante quando ela já existe
+e o original enquanto a geração está pendente (fotos antigas entram na
+fila no primeiro pedido). O Pillow é opcional: sem ele só o original é
+servido.
+"""
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional
+    Image = None
+
+# Maior lado de cada variante, em pixels (None = tamanho original)
+VARIANTES = {"webp": None, "media": 800, "miniatura": 200}
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+
+
+def caminho_variante(caminho: str, variante: str) -> str:
+    """ab/cd/<hash>.jpg -> ab/cd/<hash>.<variante>.webp"""
+    original = Path(caminho)
+    return str(original.with_name(f"{original.stem}.{variante}.webp").as_posix())
+
+
+class VariantWorker:
+    """Fila limitada de fotos cujas variantes ainda precisam ser geradas"""
+
+    def __init__(self, raiz: Path, workers: int = 1, queue_size: int = 1000, quality: int = 80):
+        self.raiz = Path(raiz)
+        self.workers = workers
+        self.quality = quality
+        self._fila: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pendentes: set = set()
+        self._tasks: list = []
+
+        # Métricas
+        self.total_generated = 0
+        self.total_fallbacks = 0
+        self.total_dropped = 0
+        self.total_errors = 0
+        self.last_ms = 0.0
+
+    @property
+    def disponivel(self) -> bool:
+        return Image is not None
+
+    def agendar(self, caminho: str) -> bool:
+        """Colocar a foto na fila; False se já pendente, sem Pillow ou fila cheia"""
+        if not self.disponivel or caminho in self._pendentes:
+            return False
+        try:
+            self._fila.put_nowait(caminho)
+        except asyncio.QueueFull:
+            # Sem perda: o próximo pedido da variante agenda de novo
+            self.total_dropped += 1
+            return False
+        self._pendentes.add(caminho)
+        return True
+
+    async def resolver(self, caminho: str, variante: str) -> str:
+        """Caminho a servir: a variante se já gerada, senão o original"""
+        # As consultas ao disco rodam no threadpool; a fila só é usada no loop
+        servido, original_existe = await run_in_threadpool(self._localizar, caminho, variante)
+        if original_existe is not None:
+            self.total_fallbacks += 1
+            if original_existe:
+                self.agendar(caminho)
+        return servido
+
+    def _localizar(self, caminho: str, variante: str) -> Tuple[str, Optional[bool]]:
+        """(caminho a servir, se o original existe quando a variante ainda falta)"""
+        if not self._e_original(caminho):
+            return caminho, None
+        gerada = caminho_variante(caminho, variante)
+        if (self.raiz / gerada).is_file():
+            return gerada, None
+        return caminho, (self.raiz / caminho).is_file()
+
+    def _e_original(self, caminho: str) -> bool:
+        """Só fotos dentro da raiz e que não sejam elas próprias variantes"""
+        original = Path(caminho)
+        if original.suffix.lower() not in EXTENSOES_IMAGEM:
+            return False
+        if Path(original.stem).suffix.lstrip(".") in VARIANTES:
+            return False
+        raiz = self.raiz.resolve()
+        return raiz in (raiz / original).resolve().parents
+
+    # -- Geração -------------------------------------------------------------
+
+    async def start(self) -> None:
+        if not self._tasks:
+            # Uma asyncio.Queue fica presa ao loop em que esperou: a cada
+            # start a fila é recriada (mantendo o que já estava agendado)
+            antiga, self._fila = self._fila, asyncio.Queue(maxsize=self._fila.maxsize)
+            while not antiga.empty():
+                self._fila.put_nowait(antiga.get_nowait())
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            caminho = await self._fila.get()
+            try:
+                await run_in_threadpool(self.gerar, caminho)
+            except Exception as e:
+                self.total_errors += 1
+                print(f"❌ Erro ao gerar variantes de {caminho}: {e}")
+            finally:
+                self._pendentes.discard(caminho)
+
+    def gerar(self, caminho: str) -> int:
+        """Gerar as variantes que faltam; retorna quantas foram gravadas"""
+        inicio = time.perf_counter()
+        geradas = 0
+        with Image.open(self.raiz / caminho) as imagem:
+            # Fotos de celular vêm rotacionadas pelo EXIF
+            atual = ImageOps.exif_transpose(imagem)
+            if atual.mode not in ("RGB", "RGBA"):
+                atual = atual.convert("RGBA" if "transparency" in atual.info else "RGB")
+            # Da maior para a menor: cada redução parte da anterior
+            for variante, lado in VARIANTES.items():
+                if lado:
+                    atual = atual.copy()
+                    atual.thumbnail((lado, lado))
+                destino = self.raiz / caminho_variante(caminho, variante)
+                if destino.exists():
+                    continue
+                temporario = destino.with_name(f"{destino.name}.{os.getpid()}.part")
+                try:
+                    atual.save(temporario, format="WEBP", quality=self.quality)
+                    os.replace(temporario, destino)
+                except BaseException:
+                    if temporario.exists():
+                        temporario.unlink()
+                    raise
+                geradas += 1
+        self.total_generated += geradas
+        self.last_ms = (time.perf_counter() - inicio) * 1000
+        return geradas
+
+    def remover(self, caminho: str) -> None:
+        """Apagar as variantes de uma foto removida pela limpeza de órfãos"""
+        for variante in VARIANTES:
+            try:
+                os.unlink(self.raiz / caminho_variante(caminho, variante))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "available": self.disponivel,
+            "workers": self.workers,
+            "queued": self._fila.qsize(),
+            "pending": len(self._pendentes),
+            "total_generated": self.total_generated,
+            "total_fallbacks": self.total_fallbacks,
+            "total_dropped": self.total_dropped,
+            "total_errors": self.total_errors,
+            "last_ms": round(self.last_ms, 2),
+        }